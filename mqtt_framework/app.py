@@ -1,7 +1,7 @@
 from enum import Enum
 from typing import Protocol, runtime_checkable
 
-from mqtt_framework.callbacks import Callbacks
+from mqtt_framework.callbacks import AsyncCallbacks, Callbacks
 
 
 class TriggerSource(Enum):
@@ -41,3 +41,41 @@ class App(Protocol):
     def do_update(self, trigger_source: TriggerSource) -> None:
         """Do periodic work and e.g. update data to MQTT if polled system"""
         ...
+
+
+@runtime_checkable
+class AsyncApp(Protocol):
+    """
+    App variant whose handlers are coroutines. Coroutines are run in an event
+    loop managed by the framework, in a dedicated thread
+    """
+
+    def init(self, callbacks: AsyncCallbacks) -> None:
+        """Initialize the app"""
+        ...
+
+    def get_version(self) -> str:
+        """Provide application version"""
+        ...
+
+    async def stop(self) -> None:
+        """This function is called when app will be shutdown for clean up"""
+        ...
+
+    async def subscribe_to_mqtt_topics(self) -> None:
+        """Subscribe to all nesessary MQTT topics (without app prefix)"""
+        ...
+
+    async def mqtt_message_received(self, topic: str, message: str) -> None:
+        """
+        Message received for one of the subscribed MQTT topics (without app prefix)
+        """
+        ...
+
+    async def do_healthy_check(self) -> bool:
+        """Do healt check. Return True for OK"""
+        ...
+
+    async def do_update(self, trigger_source: TriggerSource) -> None:
+        """Do periodic work and e.g. update data to MQTT if polled system"""
+        ...
@@ -0,0 +1,33 @@
+from typing import Mapping
+
+from prometheus_client import CollectorRegistry
+from prometheus_client.metrics_core import Metric
+
+
+class AppMetricsCollector:
+    """
+    Prometheus collector for metrics of several apps run in the same process.
+    Metrics of each app registry are exposed with app label, families with
+    the same name are merged so the exposition stays valid
+    """
+
+    def __init__(self, registries: Mapping[str, CollectorRegistry]) -> None:
+        self._registries = dict(registries)
+
+    def collect(self):
+        metrics: dict[str, Metric] = {}
+        for app_name, registry in self._registries.items():
+            for metric in registry.collect():
+                if (merged := metrics.get(metric.name)) is None:
+                    merged = metrics[metric.name] = Metric(
+                        metric.name, metric.documentation, metric.type, metric.unit
+                    )
+                for sample in metric.samples:
+                    merged.add_sample(
+                        sample.name,
+                        {"app": app_name, **sample.labels},
+                        sample.value,
+                        sample.timestamp,
+                        sample.exemplar,
+                    )
+        return list(metrics.values())
@@ -1,13 +1,38 @@
 import logging
-from typing import Callable, Protocol, runtime_checkable
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Iterable,
+    Mapping,
+    Protocol,
+    runtime_checkable,
+)
 
 from prometheus_client import CollectorRegistry
 
+from mqtt_framework.mqtt_v5 import PublishProperties
+from mqtt_framework.publish_policy import PublishPolicy
+
+MqttValue = str | bytes | bytearray | int | float
+
 
 @runtime_checkable
 class Callbacks(Protocol):
-    def get_config(self) -> dict:
-        """Provide application config"""
+    def get_config(self) -> Mapping[str, Any]:
+        """
+        Provide application config as immutable snapshot. Snapshot is replaced
+        on configuration reload, see add_config_listener
+        """
+        ...
+
+    def add_config_listener(
+        self, listener: Callable[[Mapping[str, Any], set[str]], None]
+    ) -> None:
+        """
+        Add listener called with new config snapshot and names of changed
+        settings when configuration is reloaded via reloadConfig topic
+        """
         ...
 
     def get_logger(self) -> logging.Logger:
@@ -30,13 +55,248 @@ class Callbacks(Protocol):
         ...
 
     def publish_value_to_mqtt_topic(
-        self, topic: str, value: str | bytes | bytearray | int | float, retain=False
+        self,
+        topic: str,
+        value: str | bytes | bytearray | int | float,
+        retain=False,
+        properties: PublishProperties | None = None,
     ) -> None:
-        """Publish data to MQTT topic"""
+        """
+        Publish data to MQTT topic. properties (message expiry and user
+        properties) are sent only with MQTT v5
+        """
+        ...
+
+    def publish_values_to_mqtt_topics(
+        self,
+        values: Mapping[str, MqttValue] | Iterable[tuple[str, MqttValue]],
+        retain=False,
+        qos=0,
+        properties: PublishProperties | None = None,
+    ) -> dict[str, str]:
+        """
+        Publish several values to MQTT topics (without app prefix) in one call.
+        Return failed topics with error description, empty dict if all succeeded.
+        Failures are not reported when publishes are coalesced
+        """
+        ...
+
+    def publish_object_to_mqtt_topic(
+        self,
+        topic: str,
+        obj: Any,
+        retain=False,
+        codec="json",
+        properties: PublishProperties | None = None,
+    ) -> None:
+        """
+        Encode object with payload codec and publish it to MQTT topic.
+        Available codecs: json, orjson and msgpack (the last two require
+        orjson and msgpack packages), more can be added with
+        mqtt_framework.payload_codecs.register_codec
+        """
+        ...
+
+    def publish_objects_to_mqtt_topics(
+        self,
+        values: Mapping[str, Any] | Iterable[tuple[str, Any]],
+        retain=False,
+        qos=0,
+        codec="json",
+        properties: PublishProperties | None = None,
+    ) -> dict[str, str]:
+        """
+        Encode several objects with payload codec and publish them like
+        publish_values_to_mqtt_topics. Encoding failures are returned as
+        failed topics
+        """
+        ...
+
+    def set_publish_policy(self, topic: str, policy: PublishPolicy | None) -> None:
+        """
+        Set publish policy for topics (without app prefix) matching the topic
+        filter, e.g. publish only changed values. None removes the policy
+        """
+        ...
+
+    def add_update_job(
+        self,
+        name: str,
+        func: Callable,
+        interval: float | None = None,
+        cron: str | None = None,
+        max_instances=1,
+        executor="default",
+    ) -> None:
+        """
+        Add named update job, run either every interval seconds or by cron
+        schedule (same format as UPDATE_CRON_SCHEDULE). func is called with
+        TriggerSource as argument. Job runs in given scheduler executor, a
+        dedicated thread pool is created for executor names not yet in use.
+        Executor "process" runs func in a worker process, func must then be
+        picklable and can return values to publish as {topic: value}.
+        Adding job with existing name replaces the job
+        """
+        ...
+
+    def remove_update_job(self, name: str) -> None:
+        """Remove named update job"""
         ...
 
     def subscribe_to_mqtt_topic(
-        self, topic: str, callback: Callable[[str, str], None] | None = None
+        self,
+        topic: str,
+        callback: (
+            Callable[[str, str], None] | Callable[[str, bytes], None] | None
+        ) = None,
+        raw=False,
+        process=False,
+        codec: str | None = None,
+        shared=True,
+        with_wildcards=False,
+    ) -> None:
+        """
+        Subscribe to MQTT topic (without app prefix). Topic can contain + and #
+        wildcards. If with_wildcards is True, callback receives segments
+        matched by the wildcards as third argument: callback(topic, data,
+        wildcards).
+        If raw is True, callback receives the payload as bytes without decoding.
+        If codec is given, callback receives the payload decoded with the codec,
+        e.g. codec="json". Payload is decoded once and the same object is given
+        to all matching subscriptions, so callbacks should not modify it.
+        Messages which can not be decoded are logged and not passed to callback.
+        If process is True, callback is run in a worker process and can return
+        values to publish as {topic: value}.
+        In clustered mode topic is subscribed as shared subscription, so each
+        message is handled by one replica only. Set shared to False to receive
+        messages in all replicas
+        """
+        ...
+
+
+@runtime_checkable
+class AsyncCallbacks(Protocol):
+    """
+    Callbacks for AsyncApp. Publish and subscribe are coroutines which can be
+    awaited from the framework event loop without blocking it
+    """
+
+    def get_config(self) -> Mapping[str, Any]:
+        """
+        Provide application config as immutable snapshot. Snapshot is replaced
+        on configuration reload, see add_config_listener
+        """
+        ...
+
+    def add_config_listener(
+        self, listener: Callable[[Mapping[str, Any], set[str]], None]
+    ) -> None:
+        """
+        Add listener called with new config snapshot and names of changed
+        settings when configuration is reloaded via reloadConfig topic.
+        Listener can be a coroutine function
+        """
+        ...
+
+    def get_logger(self) -> logging.Logger:
+        """Provide preconfigured logger"""
+        ...
+
+    def get_metrics_registry(self) -> CollectorRegistry:
+        """Provide Prometheus metrics registry for custom metrics"""
+        ...
+
+    def add_url_rule(
+        self,
+        rule: str,
+        endpoint=None,
+        view_func=None,
+        provide_automatic_options=None,
+        **options
+    ) -> None:
+        """Add custom url rules"""
+        ...
+
+    async def publish_value_to_mqtt_topic(
+        self,
+        topic: str,
+        value: MqttValue,
+        retain=False,
+        properties: PublishProperties | None = None,
+    ) -> None:
+        """Publish data to MQTT topic"""
+        ...
+
+    async def publish_values_to_mqtt_topics(
+        self,
+        values: Mapping[str, MqttValue] | Iterable[tuple[str, MqttValue]],
+        retain=False,
+        qos=0,
+        properties: PublishProperties | None = None,
+    ) -> dict[str, str]:
+        """
+        Publish several values to MQTT topics (without app prefix) in one call.
+        Return failed topics with error description
+        """
+        ...
+
+    async def publish_object_to_mqtt_topic(
+        self,
+        topic: str,
+        obj: Any,
+        retain=False,
+        codec="json",
+        properties: PublishProperties | None = None,
+    ) -> None:
+        """Encode object with payload codec and publish it to MQTT topic"""
+        ...
+
+    async def publish_objects_to_mqtt_topics(
+        self,
+        values: Mapping[str, Any] | Iterable[tuple[str, Any]],
+        retain=False,
+        qos=0,
+        codec="json",
+        properties: PublishProperties | None = None,
+    ) -> dict[str, str]:
+        """
+        Encode several objects with payload codec and publish them.
+        Return failed topics with error description
+        """
+        ...
+
+    def set_publish_policy(self, topic: str, policy: PublishPolicy | None) -> None:
+        """Set publish policy for topics matching the topic filter"""
+        ...
+
+    def add_update_job(
+        self,
+        name: str,
+        func: Callable,
+        interval: float | None = None,
+        cron: str | None = None,
+        max_instances=1,
+        executor="default",
+    ) -> None:
+        """Add named update job, func can be a coroutine function"""
+        ...
+
+    def remove_update_job(self, name: str) -> None:
+        """Remove named update job"""
+        ...
+
+    async def subscribe_to_mqtt_topic(
+        self,
+        topic: str,
+        callback: Callable[..., Awaitable[None]] | None = None,
+        raw=False,
+        process=False,
+        codec: str | None = None,
+        shared=True,
+        with_wildcards=False,
     ) -> None:
-        """Subscribe to MQTT topic"""
+        """
+        Subscribe to MQTT topic (without app prefix). Callback is a coroutine
+        function, called with same arguments as Callbacks.subscribe_to_mqtt_topic
+        """
         ...
@@ -0,0 +1,96 @@
+import logging
+import threading
+from typing import Callable
+
+from prometheus_client import CollectorRegistry, Counter, Gauge
+
+from mqtt_framework.callbacks import MqttValue
+from mqtt_framework.mqtt_v5 import PublishProperties
+
+# (topic, value, retain, qos, properties)
+OutboundMessage = tuple[str, MqttValue, bool, int, PublishProperties | None]
+
+
+class PublishCoalescer:
+    """
+    Outbound buffer holding the latest pending value per topic.
+
+    A newer value for a topic replaces the pending one, so at most one message
+    per topic is sent per flush. Buffer is flushed from own thread every
+    interval seconds, or earlier when max_pending topics are waiting.
+    """
+
+    def __init__(
+        self,
+        flush_func: Callable[[list[OutboundMessage]], object],
+        interval: float,
+        max_pending: int,
+        registry: CollectorRegistry,
+        logger: logging.Logger,
+    ) -> None:
+        self._flush_func = flush_func
+        self._interval = interval
+        self._max_pending = max_pending
+        self._logger = logger
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pending: dict[str, OutboundMessage] = {}
+        self._running = False
+        self._thread = threading.Thread(
+            target=self._run, name="mqtt-publish-coalescer", daemon=True
+        )
+        self._pending_metric = Gauge(
+            "mqtt_publish_pending",
+            "Number of topics waiting to be published",
+            registry=registry,
+        )
+        self._pending_metric.set_function(lambda: len(self._pending))
+        self._coalesced_metric = Counter(
+            "mqtt_publish_coalesced",
+            "How many pending MQTT messages replaced by a newer value",
+            registry=registry,
+        )
+
+    def start(self) -> None:
+        self._running = True
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Stop flush thread and flush pending messages"""
+        self._running = False
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self.flush()
+
+    def put(
+        self,
+        topic: str,
+        value: MqttValue,
+        retain=False,
+        qos=0,
+        properties: PublishProperties | None = None,
+    ) -> None:
+        with self._lock:
+            if topic in self._pending:
+                self._coalesced_metric.inc()
+            self._pending[topic] = (topic, value, retain, qos, properties)
+            full = len(self._pending) >= self._max_pending
+        if full:
+            self._wakeup.set()
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self._pending:
+                return
+            messages = list(self._pending.values())
+            self._pending.clear()
+        try:
+            self._flush_func(messages)
+        except Exception as e:
+            self._logger.exception("Error occurred while flushing messages: %s", e)
+
+    def _run(self) -> None:
+        while self._running:
+            self._wakeup.wait(self._interval)
+            self._wakeup.clear()
+            self.flush()
@@ -1,6 +1,27 @@
 """Base configuration"""
 
 import ssl
+from typing import Any, Mapping
+
+# settings which take effect only at start, so they can not be reloaded
+NOT_RELOADABLE_PREFIXES = (
+    "MQTT_",
+    "WEB_",
+    "SHUTDOWN_",
+    "CLUSTER_",
+    "STREAM_",
+    "VALUE_STORE_",
+    "HISTORY_",
+)
+NOT_RELOADABLE = {
+    "EXIT",
+    "PROCESS_POOL_WORKERS",
+    "CONFIG_RELOAD_ENABLED",
+    "HEALTH_CHECK_INTERVAL",
+}
+
+_TRUE_VALUES = {"true", "yes", "1", "on"}
+_FALSE_VALUES = {"false", "no", "0", "off"}
 
 
 class Config(object):
@@ -9,9 +30,34 @@ class Config(object):
     UPDATE_INTERVAL = 60
     DELAY_BEFORE_FIRST_TRY = 5
     UPDATE_CRON_SCHEDULE = None
+    UPDATE_JITTER = 0
+    UPDATE_BACKOFF_MAX = 600
+    UPDATE_NOW_DEBOUNCE = 1
+    PROCESS_POOL_WORKERS = 2
+    CONFIG_RELOAD_ENABLED = False
+    HEALTH_CHECK_INTERVAL = 10
+    HEALTH_CHECK_TTL = 30
+    CLUSTER_ENABLED = False
+    CLUSTER_GROUP = None
+    CLUSTER_NODE_ID = None
+    CLUSTER_LEASE_INTERVAL = 2
+    CLUSTER_LEASE_TIMEOUT = 6
+    SHUTDOWN_DRAIN_TIMEOUT = 5
+    SHUTDOWN_JOBS_TIMEOUT = 10
+    WEB_ENABLED = True
     WEB_PORT = 5000
     WEB_STATIC_DIR = "/web/static"
     WEB_TEMPLATE_DIR = "/web/templates"
+    STREAM_ENABLED = False
+    STREAM_PORT = 5001
+    STREAM_BUFFER_SIZE = 1000
+    VALUE_STORE_ENABLED = False
+    VALUE_STORE_MAX_TOPICS = 10000
+    HISTORY_ENABLED = False
+    HISTORY_RAW_SIZE = 3600
+    HISTORY_MINUTE_SIZE = 1440
+    HISTORY_HOUR_SIZE = 168
+    HISTORY_MAX_MEMORY_MB = 16
 
     MQTT_BROKER_URL = "127.0.0.1"
     MQTT_BROKER_PORT = 1883
@@ -26,6 +72,16 @@ class Config(object):
     MQTT_TLS_INSECURE = False
     MQTT_LAST_WILL_MESSAGE = "offline"
     MQTT_LAST_WILL_RETAIN = True
+    MQTT_DISPATCHER_WORKERS = 0
+    MQTT_DISPATCHER_QUEUE_SIZE = 1000
+    MQTT_PUBLISH_COALESCE_INTERVAL = 0
+    MQTT_PUBLISH_COALESCE_MAX_PENDING = 1000
+    MQTT_OFFLINE_QUEUE_FILE = None
+    MQTT_OFFLINE_QUEUE_MAX_SIZE = 10000
+    MQTT_OFFLINE_QUEUE_DROP_POLICY = "oldest"
+    MQTT_OFFLINE_QUEUE_QOS = 1
+    MQTT_PROTOCOL_VERSION = 4
+    MQTT_TOPIC_ALIAS_MAXIMUM = 10
 
     def __init__(self, app_name: str) -> None:
         self.app_name = app_name
@@ -41,3 +97,59 @@ class Config(object):
     @property
     def MQTT_LAST_WILL_TOPIC(self) -> str:
         return f"{self.app_name}/status"
+
+
+def config_defaults(config: Config) -> dict[str, Any]:
+    """Return upper case settings of config object, including app settings"""
+    return {key: getattr(config, key) for key in dir(config) if key.isupper()}
+
+
+def validate_config(
+    defaults: Mapping[str, Any], values: Mapping[str, Any]
+) -> dict[str, Any]:
+    """
+    Check that values of known settings match the type of their default values.
+    Strings are converted, e.g. "false" to bool or "1.5" to float. Settings
+    with None as default value are not checked. Return converted values,
+    raise ValueError if a value is invalid
+    """
+    result = {}
+    for key, value in values.items():
+        if key not in defaults:
+            continue
+        try:
+            result[key] = _convert(value, defaults[key])
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid value for {key}: {value!r}") from None
+    return result
+
+
+def is_reloadable(key: str) -> bool:
+    return not key.startswith(NOT_RELOADABLE_PREFIXES) and key not in NOT_RELOADABLE
+
+
+def _convert(value: Any, default: Any) -> Any:
+    if default is None or value is None:
+        return value
+    if isinstance(default, bool):
+        if isinstance(value, bool):
+            return value
+        if str(value).lower() in _TRUE_VALUES:
+            return True
+        if str(value).lower() in _FALSE_VALUES:
+            return False
+        raise ValueError(value)
+    if isinstance(default, (int, float)):
+        if isinstance(value, bool):
+            raise TypeError(value)
+        if isinstance(value, (int, float)):
+            return value
+        try:
+            return int(value)
+        except ValueError:
+            return float(value)
+    if isinstance(default, str):
+        if isinstance(value, (dict, list)):
+            raise TypeError(value)
+        return str(value)
+    return value
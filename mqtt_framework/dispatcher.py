@@ -0,0 +1,130 @@
+import logging
+import math
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+
+# minimum seconds between warnings about dropped messages
+DROP_WARNING_INTERVAL = 10
+
+
+class MessageDispatcher:
+    """
+    Run MQTT message handlers in a bounded thread pool.
+
+    Messages with the same key (topic) are handled one at a time in arrival
+    order, messages with different keys are handled in parallel.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        queue_size: int,
+        registry: CollectorRegistry,
+        logger: logging.Logger,
+    ) -> None:
+        self._queue_size = queue_size
+        self._logger = logger
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending: dict[str, deque] = {}
+        self._ready: queue.SimpleQueue = queue.SimpleQueue()
+        self._size = 0
+        self._accepting = False
+        # drops not yet reported and time of the last warning
+        self._unreported_drops = 0
+        self._last_drop_warning = -math.inf
+        self._threads = [
+            threading.Thread(
+                target=self._worker, name=f"mqtt-dispatcher-{i}", daemon=True
+            )
+            for i in range(workers)
+        ]
+        self._queue_depth_metric = Gauge(
+            "mqtt_dispatcher_queue_depth",
+            "Number of MQTT messages waiting or being handled",
+            registry=registry,
+        )
+        self._queue_depth_metric.set_function(lambda: self._size)
+        self._wait_time_metric = Histogram(
+            "mqtt_dispatcher_wait_seconds",
+            "Time MQTT messages spent in queue before handling",
+            registry=registry,
+        )
+        self._dropped_metric = Counter(
+            "mqtt_dispatcher_dropped",
+            "How many MQTT messages dropped because queue was full",
+            registry=registry,
+        )
+
+    def start(self) -> None:
+        self._accepting = True
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, key: str, func: Callable, *args) -> bool:
+        """Queue func(*args) for execution. Return False if message was dropped"""
+        with self._lock:
+            if not self._accepting or self._size >= self._queue_size:
+                self._dropped_metric.inc()
+                self._warn_dropped(key)
+                return False
+            self._size += 1
+            task = (time.monotonic(), func, args)
+            if tasks := self._pending.get(key):
+                tasks.append(task)
+            else:
+                self._pending[key] = deque((task,))
+                self._ready.put(key)
+        return True
+
+    def _warn_dropped(self, key: str) -> None:
+        self._unreported_drops += 1
+        now = time.monotonic()
+        if now - self._last_drop_warning < DROP_WARNING_INTERVAL:
+            return
+        self._logger.warning(
+            "%d MQTT messages dropped, dispatcher queue full or stopped, last: %s",
+            self._unreported_drops,
+            key,
+        )
+        self._unreported_drops = 0
+        self._last_drop_warning = now
+
+    def stop(self, timeout: float | None = None) -> bool:
+        """
+        Stop accepting new messages and wait until queued messages are handled.
+        Return False if the queue was not drained within timeout
+        """
+        with self._lock:
+            self._accepting = False
+            drained = self._idle.wait_for(lambda: self._size == 0, timeout)
+        for _ in self._threads:
+            self._ready.put(None)
+        return drained
+
+    def _worker(self) -> None:
+        while (key := self._ready.get()) is not None:
+            # keep the task in the deque while running, so that new messages
+            # for the same key are appended behind it instead of becoming ready
+            with self._lock:
+                enqueued, func, args = self._pending[key][0]
+            self._wait_time_metric.observe(time.monotonic() - enqueued)
+            try:
+                func(*args)
+            except Exception as e:
+                self._logger.exception("Error occurred in message handler: %s", e)
+            with self._lock:
+                tasks = self._pending[key]
+                tasks.popleft()
+                self._size -= 1
+                if tasks:
+                    self._ready.put(key)
+                else:
+                    del self._pending[key]
+                if self._size == 0:
+                    self._idle.notify_all()
@@ -0,0 +1,60 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from typing import Any, Coroutine
+
+
+class EventLoopThread:
+    """asyncio event loop running in a dedicated thread"""
+
+    def __init__(self, logger: logging.Logger) -> None:
+        self._logger = logger
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._run, name="asyncio-event-loop", daemon=True
+        )
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self._loop
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Cancel running tasks and stop the loop"""
+        if not self._loop.is_running():
+            return
+        asyncio.run_coroutine_threadsafe(self._cancel_tasks(), self._loop).result(
+            timeout
+        )
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._loop.close()
+
+    def submit(self, coro: Coroutine, log_exceptions=True) -> concurrent.futures.Future:
+        """Schedule coroutine to the loop, exceptions are logged by default"""
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        if log_exceptions:
+            future.add_done_callback(self._log_exception)
+        return future
+
+    def run(self, coro: Coroutine, timeout: float | None = None) -> Any:
+        """Run coroutine in the loop and wait for the result"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    async def _cancel_tasks(self) -> None:
+        current = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks() if task is not current]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _log_exception(self, future: concurrent.futures.Future) -> None:
+        if not future.cancelled() and (e := future.exception()):
+            self._logger.error("Error occurred in coroutine: %s", e, exc_info=e)
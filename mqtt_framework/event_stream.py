@@ -0,0 +1,260 @@
+import asyncio
+import collections
+import itertools
+import json
+import logging
+import threading
+import time
+from urllib.parse import SplitResult, parse_qs, urlsplit
+
+from prometheus_client import CollectorRegistry, Counter, Gauge
+
+from mqtt_framework.callbacks import MqttValue
+from mqtt_framework.event_loop import EventLoopThread
+from mqtt_framework.topic_router import TopicRouter
+from mqtt_framework.value_store import to_json_value
+
+# comment sent to idle clients, so that closed connections are noticed
+KEEPALIVE_INTERVAL = 15
+# bytes buffered per client before writing waits, slow clients fall behind
+# in the shared buffer instead of growing own buffers
+WRITE_BUFFER_LIMIT = 65536
+MAX_REQUEST_SIZE = 8192
+REQUEST_TIMEOUT = 10
+
+# (id, topic, encoded event)
+_Event = tuple[int, str, bytes]
+
+
+class EventStream:
+    """
+    Server-Sent Events stream of published and received MQTT values.
+
+    Values are recorded from any thread to a bounded ring buffer shared by
+    all clients. Clients are served by an asyncio server in the given event
+    loop, so idle clients do not tie up threads, and each value is encoded
+    once however many clients there are. A client reads the buffer from its
+    own position, so a slow client falls behind, skips values which no longer
+    fit in the buffer and gets an overflow event telling how many were lost.
+
+    GET /stream?topic=<filter> streams values matching the topic filters (the
+    parameter can be repeated, default all topics) from now on. Clients
+    reconnecting with Last-Event-ID header get missed values from the buffer.
+    """
+
+    def __init__(
+        self,
+        port: int,
+        buffer_size: int,
+        registry: CollectorRegistry,
+        logger: logging.Logger,
+    ) -> None:
+        self._port = port
+        self._logger = logger
+        self._lock = threading.Lock()
+        # values recorded but not yet encoded, written by any thread, and
+        # how many of them were pushed out before encoding
+        self._pending: collections.deque = collections.deque(maxlen=buffer_size)
+        self._pending_lost = 0
+        # encoded events, only used in event loop thread
+        self._events: collections.deque[_Event] = collections.deque(maxlen=buffer_size)
+        self._last_id = 0
+        self._wakeup_pending = False
+        self._clients = 0
+        self._writers: set[asyncio.StreamWriter] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._server: asyncio.Server | None = None
+        self._new_events: asyncio.Event | None = None
+        self._running = False
+        clients_metric = Gauge(
+            "stream_clients",
+            "Number of connected event stream clients",
+            registry=registry,
+        )
+        clients_metric.set_function(lambda: self._clients)
+        self._events_metric = Counter(
+            "stream_events",
+            "How many values recorded to event stream",
+            registry=registry,
+        )
+        self._dropped_metric = Counter(
+            "stream_events_dropped",
+            "How many events slow clients missed because buffer was full",
+            registry=registry,
+        )
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    def start(self, event_loop: EventLoopThread) -> None:
+        self._loop = event_loop.loop
+        event_loop.run(self._start_server())
+
+    def stop(self, event_loop: EventLoopThread, timeout: float | None = None) -> None:
+        event_loop.run(self._stop_server(), timeout)
+
+    def record(self, direction: str, topic: str, value: MqttValue) -> None:
+        """Record value published or received, called from any thread"""
+        with self._lock:
+            if len(self._pending) == self._pending.maxlen:
+                self._pending_lost += 1
+            self._pending.append((time.time(), direction, topic, value))
+            wakeup = self._running and self._clients and not self._wakeup_pending
+            if wakeup:
+                self._wakeup_pending = True
+        self._events_metric.inc()
+        if wakeup:
+            self._loop.call_soon_threadsafe(self._flush_pending)
+
+    async def _start_server(self) -> None:
+        self._new_events = asyncio.Event()
+        self._running = True
+        self._server = await asyncio.start_server(
+            self._handle_client, "0.0.0.0", self._port, limit=MAX_REQUEST_SIZE
+        )
+
+    async def _stop_server(self) -> None:
+        self._running = False
+        self._server.close()
+        for writer in list(self._writers):
+            writer.close()
+        self._new_events.set()
+        await self._server.wait_closed()
+
+    def _flush_pending(self) -> None:
+        """Encode pending values and wake up clients"""
+        with self._lock:
+            pending = list(self._pending)
+            self._pending.clear()
+            lost, self._pending_lost = self._pending_lost, 0
+            self._wakeup_pending = False
+        if not pending:
+            return
+        # lost values get ids too, so resuming clients are told about them.
+        # Pending values then fill the whole buffer, which keeps ids in it
+        # contiguous
+        self._last_id += lost
+        for timestamp, direction, topic, value in pending:
+            self._last_id += 1
+            self._events.append(
+                (
+                    self._last_id,
+                    topic,
+                    _encode(self._last_id, direction, topic, value, timestamp),
+                )
+            )
+        new_events, self._new_events = self._new_events, asyncio.Event()
+        new_events.set()
+
+    async def _handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            request = await self._read_request(reader)
+        except (asyncio.TimeoutError, asyncio.LimitOverrunError, ValueError) as e:
+            self._logger.debug("Invalid event stream request: %s", e)
+            request = None
+        except (ConnectionError, asyncio.IncompleteReadError):
+            writer.close()
+            return
+        if request is None:
+            await self._send_error(writer, "400 Bad Request")
+            return
+        method, url, headers = request
+        if method != "GET" or url.path != "/stream":
+            await self._send_error(writer, "404 Not Found")
+            return
+        router = TopicRouter()
+        try:
+            for topic_filter in parse_qs(url.query).get("topic", ["#"]):
+                router.add(topic_filter, True)
+        except ValueError:
+            await self._send_error(writer, "400 Bad Request")
+            return
+
+        writer.transport.set_write_buffer_limits(WRITE_BUFFER_LIMIT)
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Access-Control-Allow-Origin: *\r\n"
+            b"Connection: keep-alive\r\n\r\n"
+        )
+        with self._lock:
+            self._clients += 1
+        self._writers.add(writer)
+        self._flush_pending()
+        last_id = self._last_id
+        if (resume_id := headers.get("last-event-id", "")).isdigit():
+            # ids restart with the process, ignore ids not yet given
+            last_id = min(int(resume_id), last_id)
+        try:
+            while self._running:
+                new_events = self._new_events
+                last_id = self._write_events(writer, router, last_id)
+                await writer.drain()
+                try:
+                    await asyncio.wait_for(new_events.wait(), KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    writer.write(b": keepalive\n\n")
+                    await writer.drain()
+        except (ConnectionError, RuntimeError):
+            pass
+        finally:
+            with self._lock:
+                self._clients -= 1
+            self._writers.discard(writer)
+            writer.close()
+
+    def _write_events(
+        self, writer: asyncio.StreamWriter, router: TopicRouter, last_id: int
+    ) -> int:
+        """Write events after last_id matching the router, return new last id"""
+        if not self._events or last_id >= self._last_id:
+            return last_id
+        first_id = self._events[0][0]
+        if last_id + 1 < first_id:
+            dropped = first_id - last_id - 1
+            self._dropped_metric.inc(dropped)
+            data = json.dumps({"dropped": dropped})
+            writer.write(f"event: overflow\ndata: {data}\n\n".encode())
+            last_id = first_id - 1
+        for _, topic, data in itertools.islice(
+            self._events, last_id + 1 - first_id, None
+        ):
+            if router.match(topic):
+                writer.write(data)
+        return self._last_id
+
+    async def _read_request(
+        self, reader: asyncio.StreamReader
+    ) -> tuple[str, SplitResult, dict[str, str]]:
+        data = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), REQUEST_TIMEOUT)
+        request_line, *header_lines = data.decode("latin-1").split("\r\n")
+        method, target, _ = request_line.split(" ", 2)
+        headers = {}
+        for line in header_lines:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return method, urlsplit(target), headers
+
+    async def _send_error(self, writer: asyncio.StreamWriter, status: str) -> None:
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Length: 0\r\n"
+            "Connection: close\r\n\r\n".encode()
+        )
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+
+def _encode(
+    event_id: int, direction: str, topic: str, value: MqttValue, timestamp: float
+) -> bytes:
+    data = json.dumps(
+        {"topic": topic, "value": to_json_value(value), "time": timestamp}
+    )
+    return f"id: {event_id}\nevent: {direction}\ndata: {data}\n\n".encode()
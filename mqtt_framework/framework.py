@@ -1,64 +1,211 @@
 #!/usr/bin/env python3
 
+import asyncio
+import concurrent.futures
 import contextlib
+import functools
+import inspect
+import json
 import os
+import random
+import re
 import signal
 import threading
 import logging
 import time
-from typing import Callable
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Iterable,
+    Mapping,
+    NamedTuple,
+)
 import tzlocal
 
-from datetime import datetime, timedelta
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
 from threading import Lock
 
 from flask import Flask as Flask, Response
-from flask import jsonify
-from cheroot.wsgi import Server as WSGIServer
-
-from flask_mqtt import Mqtt
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
-from prometheus_flask_exporter import PrometheusMetrics
-from prometheus_client import CollectorRegistry, Counter, Summary
-
+from flask import abort, jsonify, request
+
+from paho.mqtt.client import (
+    MQTT_ERR_NO_CONN,
+    MQTT_ERR_SUCCESS,
+    MQTTv5,
+    MQTTMessageInfo,
+    error_string,
+)
+from prometheus_client import CollectorRegistry, Counter, Histogram, Summary
+
+from apscheduler.events import (
+    EVENT_JOB_MAX_INSTANCES,
+    EVENT_JOB_MISSED,
+    EVENT_JOB_SUBMITTED,
+    JobEvent,
+)
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.jobstores.base import JobLookupError
 from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.base import BaseTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 
 from mqtt_framework.app import App as App, TriggerSource
+from mqtt_framework.app_metrics import AppMetricsCollector
+from mqtt_framework.callbacks import MqttValue
+from mqtt_framework.coalescer import OutboundMessage, PublishCoalescer
 from mqtt_framework.config import Config as Config
+from mqtt_framework.config import config_defaults, is_reloadable, validate_config
+from mqtt_framework.dispatcher import MessageDispatcher
+from mqtt_framework.event_loop import EventLoopThread
+from mqtt_framework.health_probe import HealthProbe
+from mqtt_framework.mqtt_client import MqttClient
+from mqtt_framework.mqtt_v5 import PublishProperties, TopicAliases, to_paho_properties
+from mqtt_framework.payload_codecs import get_codec
+from mqtt_framework.publish_policy import LastValueCache, PublishPolicy
 from mqtt_framework.read_only_dict import ReadOnlyDict
+from mqtt_framework.topic_router import TopicRouter
+from mqtt_framework.value_store import ValueStore, to_json_value
+
+if TYPE_CHECKING:
+    # imported lazily, only when used
+    from mqtt_framework.event_stream import EventStream
+    from mqtt_framework.history import History
+    from mqtt_framework.process_pool import ProcessPool
 
 # current MQTT-Framework version
 __version__ = "2.0.1"
 
+PAYLOAD_SIZE_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+LOG_LEVELS = frozenset({"TRACE", "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"})
+# seconds to wait for broker to acknowledge a replayed offline queue batch
+OFFLINE_QUEUE_ACK_TIMEOUT = 10
+# seconds to wait before publishing again when replay publish failed
+OFFLINE_QUEUE_RETRY_DELAY = 5
+# seconds doubled after each do_update error when there is no update interval
+UPDATE_BACKOFF_BASE = 30
+
+
+def _payload_size(value: MqttValue | None) -> int:
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8")) if not value.isascii() else len(value)
+    return 0 if value is None else len(str(value))
+
+
+# marks payload which could not be decoded by subscription codec
+_DECODE_FAILED = object()
+
+
+class MqttSubscription(NamedTuple):
+    callback: Callable | None
+    raw: bool = False
+    coroutine: bool = False
+    process: bool = False
+    codec: str | None = None
+    with_wildcards: bool = False
+
 
 class Framework:
     TOPIC_STATUS = "status"
     TOPIC_UPDATE_NOW = "updateNow"
     TOPIC_SET_LOG_LEVEL = "setLogLevel"
+    TOPIC_RELOAD_CONFIG = "reloadConfig"
+    TOPIC_LEADER = "leader"
+    # handled by the framework, never queued to the dispatcher or dropped
+    _FRAMEWORK_TOPICS = frozenset(
+        {
+            TOPIC_UPDATE_NOW,
+            TOPIC_SET_LOG_LEVEL,
+            TOPIC_RELOAD_CONFIG,
+            TOPIC_LEADER,
+            TOPIC_STATUS,
+        }
+    )
 
     ###########################################################
     # Init and shutdown methods
     ###########################################################
 
-    def __init__(self) -> None:
+    def __init__(self, host: "Framework | None" = None, name: str = "") -> None:
         self._TRACE_LOG_LEVEL = 5
-        self._limiter = Limiter(
-            get_remote_address,
-            default_limits=["1 per second"],
-            storage_uri="memory://",
-            strategy="fixed-window",
-        )
-        self._scheduler = BackgroundScheduler(timezone=str(tzlocal.get_localzone()))
+        # apps added with add_app run in own Framework instances, which share
+        # MQTT connection, scheduler and web server of the host instance
+        self._host = host
+        self._name = name
+        self._guests: list[Framework] = []
+        self._guest_apps: list[tuple[App, Config]] = []
+        self._guest_router = TopicRouter()
+        # scheduler is shared, so job ids of added apps are prefixed
+        self._job_id_prefix = f"{name}." if host else ""
+        # web server, limiter and HTTP metrics are created in start only if
+        # web is enabled, so their modules are not imported in headless mode
+        self._limiter = None
+        self._metrics = None
+        self._metrics_server = None
+        if host:
+            self._scheduler = host._scheduler
+            self._job_executors = host._job_executors
+        else:
+            self._scheduler = BackgroundScheduler(timezone=str(tzlocal.get_localzone()))
+            self._scheduler.add_listener(
+                self._scheduler_event,
+                EVENT_JOB_SUBMITTED | EVENT_JOB_MAX_INSTANCES | EVENT_JOB_MISSED,
+            )
+            self._job_executors = set()
+        # consecutive do_update errors and monotonic time before which
+        # scheduled runs are skipped, guarded by _update_lock
+        self._update_failures = 0
+        self._update_not_before = 0.0
+        # do_update never runs concurrently: whether an update runs, manual
+        # update waiting to run and triggers waiting for the running update
+        self._update_lock = Lock()
+        self._update_running = False
+        self._manual_update_pending = False
+        self._deferred_updates: list[TriggerSource] = []
         self._lock = Lock()
+        self._stopped = threading.Event()
+        # validated snapshot of the configuration, replaced as a whole on reload
+        self._config: Mapping[str, Any] = ReadOnlyDict({})
+        self._config_defaults: dict[str, Any] = {}
+        self._config_lock = Lock()
+        self._config_listeners: list[Callable] = []
+        self._shutdown_durations: dict[str, float] = {}
         self.__add_trace_level_to_logger()
         self.__init_flask()
-        self.__init_flask_routes()
         self.__init_metrics()
-        self.__init_mqtt()
+        if host:
+            self._mqtt = host._mqtt
+        else:
+            self.__init_mqtt()
         self._started = False
-        self._mqtt_callbacks = {}
+        self._mqtt_router = TopicRouter()
+        self._last_value_cache = LastValueCache()
+        self._dispatcher = None
+        self._coalescer = None
+        self._offline_queue = None
+        self._offline_queue_lock = Lock()
+        self._offline_queue_replaying = False
+        self._offline_queue_thread = None
+        self._offline_queue_stop = threading.Event()
+        self._event_loop = None
+        self._event_loop_lock = Lock()
+        self._process_pool = None
+        self._process_pool_lock = Lock()
+        self._leader_election = None
+        # shared by all apps, as topic aliases are per connection
+        self._topic_aliases: TopicAliases | None = None
+        self._mqtt_v5 = False
+        self._value_store: ValueStore | None = None
+        self._history: "History | None" = None
+        # shared by all apps, served by the host
+        self._event_stream: "EventStream | None" = None
+        self._health_probe = HealthProbe(
+            self._check_app_health, self._metrics_registry, self._flask.logger
+        )
 
     def __add_trace_level_to_logger(self) -> None:
         logging.addLevelName(self._TRACE_LOG_LEVEL, "TRACE")
@@ -78,15 +225,46 @@ class Framework:
         if os.environ.get("CFG_WEB_TEMPLATE_DIR") is not None:
             template_folder = os.environ.get("CFG_WEB_TEMPLATE_DIR")
 
+        # own logger for each added app, log lines show the app name
+        import_name = f"{__name__}.{self._name}" if self._host else __name__
         self._flask = Flask(
-            __name__, static_folder=static_folder, template_folder=template_folder
+            import_name, static_folder=static_folder, template_folder=template_folder
         )
+        if self._host:
+            handler = logging.StreamHandler()
+            handler.setFormatter(
+                logging.Formatter(
+                    f"[%(asctime)s] %(levelname)s in {self._name}: %(message)s"
+                )
+            )
+            self._flask.logger.addHandler(handler)
+            self._flask.logger.propagate = False
+
+    def _init_web(self) -> None:
+        from flask_limiter import Limiter
+        from flask_limiter.util import get_remote_address
+        from prometheus_flask_exporter import PrometheusMetrics
 
-    def __init_flask_routes(self) -> None:
+        self._limiter = Limiter(
+            get_remote_address,
+            default_limits=["1 per second"],
+            storage_uri="memory://",
+            strategy="fixed-window",
+        )
+        self._metrics = PrometheusMetrics(
+            app=None, registry=self._create_exposed_metrics_registry()
+        )
+
+        # health endpoints serve cached results, so they are not rate limited
         @self._flask.route("/healthy")
-        @self._limiter.limit("10 per minute")
-        def do_healthy_check() -> tuple[str, int]:
-            return self._rest_do_healthy_check()
+        @self._limiter.exempt
+        def do_healthy_check() -> Response:
+            return self._json_response(*self._rest_do_healthy_check())
+
+        @self._flask.route("/live")
+        @self._limiter.exempt
+        def do_liveness_check() -> Response:
+            return self._json_response(*self._rest_do_liveness_check())
 
         @self._flask.route("/update")
         @self._limiter.limit("2 per minute")
@@ -98,30 +276,193 @@ class Framework:
         def printjobs() -> tuple[Response, int]:
             return self._rest_get_jobs()
 
+        @self._flask.route("/values")
+        @self._limiter.limit("10 per second")
+        def get_values() -> Response:
+            return self._rest_get_values()
+
+        @self._flask.route("/history")
+        @self._limiter.limit("10 per second")
+        def get_history() -> tuple[Response, int]:
+            return self._rest_get_history()
+
+        if self._guests:
+            self._init_guest_web_routes()
+
+        self._limiter.init_app(self._flask)
+        self._metrics.init_app(self._flask)
+
+    def _init_guest_web_routes(self) -> None:
+        from flask_limiter.util import get_remote_address
+
+        def app_rate_limit_key() -> str:
+            # limits are counted separately for each app
+            return f"{get_remote_address()}/{request.view_args.get('app_name')}"
+
+        @self._flask.route("/<app_name>/healthy")
+        @self._limiter.exempt
+        def do_app_healthy_check(app_name: str) -> Response:
+            return self._json_response(
+                *self._get_guest(app_name)._rest_do_healthy_check()
+            )
+
+        @self._flask.route("/<app_name>/update")
+        @self._limiter.limit("2 per minute", key_func=app_rate_limit_key)
+        def app_update(app_name: str) -> tuple[str, int]:
+            return self._get_guest(app_name)._rest_update_now()
+
+        @self._flask.route("/<app_name>/jobs")
+        @self._limiter.limit("1 per second", key_func=app_rate_limit_key)
+        def print_app_jobs(app_name: str) -> tuple[Response, int]:
+            return self._get_guest(app_name)._rest_get_jobs()
+
+        @self._flask.route("/<app_name>/values")
+        @self._limiter.limit("10 per second", key_func=app_rate_limit_key)
+        def get_app_values(app_name: str) -> Response:
+            return self._get_guest(app_name)._rest_get_values()
+
+        @self._flask.route("/<app_name>/history")
+        @self._limiter.limit("10 per second", key_func=app_rate_limit_key)
+        def get_app_history(app_name: str) -> tuple[Response, int]:
+            return self._get_guest(app_name)._rest_get_history()
+
+    def _get_guest(self, name: str) -> "Framework":
+        for guest in self._guests:
+            if guest._name == name:
+                return guest
+        abort(404)
+
+    def _create_exposed_metrics_registry(self) -> CollectorRegistry:
+        """Registry served in /metrics, metrics of all apps labelled by app"""
+        if not self._guests:
+            return self._metrics_registry
+        registry = CollectorRegistry()
+        registry.register(
+            AppMetricsCollector(
+                {
+                    framework._name: framework._metrics_registry
+                    for framework in self._frameworks()
+                }
+            )
+        )
+        return registry
+
+    def _frameworks(self) -> tuple["Framework", ...]:
+        """This instance and instances of added apps"""
+        return (self, *self._guests)
+
     def __init_mqtt(self) -> None:
-        self._mqtt = Mqtt()
+        self._mqtt = MqttClient()
 
         @self._mqtt.on_connect()
         def handle_connect(client, userdata, flags, rc) -> None:
             self._mqtt_handle_connect(client, userdata, flags, rc)
 
+        @self._mqtt.on_disconnect()
+        def handle_disconnect(client, userdata, rc) -> None:
+            self._mqtt_handle_disconnect(rc)
+
+        @self._mqtt.on_subscribe()
+        def handle_subscribe(client, userdata, mid, reason_codes, properties) -> None:
+            for reason_code in reason_codes:
+                self._count_reason_code("subscribe", reason_code)
+
+        @self._mqtt.on_publish()
+        def handle_publish(client, userdata, mid, reason_code, properties) -> None:
+            self._count_reason_code("publish", reason_code)
+
         @self._mqtt.on_message()
         def mqtt_message_received(client, userdata, message) -> None:
             self._mqtt_message_received(client, userdata, message)
 
         @self._mqtt.on_log()
         def handle_logging(client, userdata, level, buf) -> None:
-            self._trace_log(f"MQTT: {buf}")
+            self._trace_log("MQTT: %s", buf)
 
     def __init_metrics(self) -> None:
         self._metrics_registry = CollectorRegistry()
-        self._metrics = PrometheusMetrics(app=None, registry=self._metrics_registry)
         self._mqtt_messages_received_metric = Counter(
             "mqtt_messages_received", "", registry=self._metrics_registry
         )
         self._mqtt_messages_sent_metric = Counter(
             "mqtt_messages_sent", "", registry=self._metrics_registry
         )
+        self._config_reloads_metric = Counter(
+            "config_reloads",
+            "How many configuration reloads applied or rejected",
+            ["result"],
+            registry=self._metrics_registry,
+        )
+        self._mqtt_handler_duration_metric = Histogram(
+            "mqtt_handler_duration_seconds",
+            "Time spent in MQTT message handlers",
+            ["filter"],
+            registry=self._metrics_registry,
+        )
+        self._mqtt_message_latency_metric = Histogram(
+            "mqtt_message_latency_seconds",
+            "Time from MQTT message reception until handlers have finished",
+            ["filter"],
+            registry=self._metrics_registry,
+        )
+        self._mqtt_handler_errors_metric = Counter(
+            "mqtt_handler_errors",
+            "How many exceptions caused by MQTT message handlers",
+            ["filter"],
+            registry=self._metrics_registry,
+        )
+        self._mqtt_received_payload_size_metric = Histogram(
+            "mqtt_received_payload_bytes",
+            "Size of received MQTT payloads",
+            ["filter"],
+            buckets=PAYLOAD_SIZE_BUCKETS,
+            registry=self._metrics_registry,
+        )
+        self._mqtt_published_payload_size_metric = Histogram(
+            "mqtt_published_payload_bytes",
+            "Size of published MQTT payloads",
+            buckets=PAYLOAD_SIZE_BUCKETS,
+            registry=self._metrics_registry,
+        )
+        self._mqtt_publish_duration_metric = Histogram(
+            "mqtt_publish_duration_seconds",
+            "Time spent in a publish call writing messages to MQTT client",
+            registry=self._metrics_registry,
+        )
+        self._codec_encode_metric = Histogram(
+            "mqtt_codec_encode_seconds",
+            "Time spent encoding objects to MQTT payloads",
+            ["codec"],
+            registry=self._metrics_registry,
+        )
+        self._codec_decode_metric = Histogram(
+            "mqtt_codec_decode_seconds",
+            "Time spent decoding MQTT payloads to objects",
+            ["codec"],
+            registry=self._metrics_registry,
+        )
+        self._mqtt_reason_codes_metric = Counter(
+            "mqtt_reason_codes",
+            "MQTT reason codes received from broker",
+            ["operation", "reason"],
+            registry=self._metrics_registry,
+        )
+        self._codec_errors_metric = Counter(
+            "mqtt_codec_errors",
+            "How many payloads failed to encode or decode",
+            ["codec", "operation"],
+            registry=self._metrics_registry,
+        )
+        self._mqtt_messages_suppressed_metric = Counter(
+            "mqtt_messages_suppressed",
+            "How many MQTT messages not sent due to publish policy",
+            registry=self._metrics_registry,
+        )
+        self._mqtt_messages_failed_metric = Counter(
+            "mqtt_messages_failed",
+            "How many MQTT messages MQTT client failed to publish",
+            registry=self._metrics_registry,
+        )
         self._do_update_metric = Summary(
             "do_update", "Time spent in do_update", registry=self._metrics_registry
         )
@@ -130,15 +471,55 @@ class Framework:
             "How many exceptions caused by do_update",
             registry=self._metrics_registry,
         )
+        self._update_job_metric = Summary(
+            "update_job",
+            "Time spent in update jobs",
+            ["job"],
+            registry=self._metrics_registry,
+        )
+        self._update_job_exception_metric = Counter(
+            "update_job_exceptions",
+            "How many exceptions caused by update jobs",
+            ["job"],
+            registry=self._metrics_registry,
+        )
+        self._update_runs_skipped_metric = Counter(
+            "update_runs_skipped",
+            "How many scheduled update runs skipped",
+            ["job", "reason"],
+            registry=self._metrics_registry,
+        )
+        self._update_triggers_coalesced_metric = Counter(
+            "update_triggers_coalesced",
+            "How many manual update triggers merged to a pending update",
+            registry=self._metrics_registry,
+        )
+        self._update_runs_misfired_metric = Counter(
+            "update_runs_misfired",
+            "How many scheduled update runs missed because scheduler was late",
+            ["job"],
+            registry=self._metrics_registry,
+        )
+        self._update_schedule_drift_metric = Histogram(
+            "update_schedule_drift_seconds",
+            "Delay from scheduled run time until update run is submitted",
+            ["job"],
+            buckets=(0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60),
+            registry=self._metrics_registry,
+        )
 
     def _start_wsgi_server_blocking(self) -> None:
         self._trace_log("Start WSGIServer")
-        port = self._flask.config["WEB_PORT"]
-        self._WSGIServer = WSGIServer(("0.0.0.0", port), self._flask)
-        self._WSGIServer.start()  # blocking
+        self._WSGIServer.serve()  # blocking
         self._trace_log("WSGIServer stopped")
 
     def _start_flask(self) -> None:
+        from cheroot.wsgi import Server as WSGIServer
+
+        port = self._flask.config["WEB_PORT"]
+        self._WSGIServer = WSGIServer(("0.0.0.0", port), self._flask)
+        # bind already here, stop would be ignored if server is not yet prepared
+        self._WSGIServer.prepare()
         self._server_thread = threading.Thread(target=self._start_wsgi_server_blocking)
         self._server_thread.start()
 
@@ -147,6 +528,26 @@ class Framework:
         self._WSGIServer.stop()
         self._server_thread.join()
 
+    def _start_metrics_server(self) -> None:
+        from mqtt_framework.metrics_server import MetricsServer
+
+        self._trace_log("Start metrics server")
+        self._metrics_server = MetricsServer(
+            self._flask.config["WEB_PORT"],
+            self._create_exposed_metrics_registry(),
+            {
+                "/healthy": self._rest_do_healthy_check,
+                "/live": self._rest_do_liveness_check,
+            },
+            self._flask.logger,
+        )
+        self._metrics_server.start()
+
+    def _stop_metrics_server(self) -> None:
+        self._trace_log("Stop metrics server")
+        self._metrics_server.stop()
+        self._metrics_server = None
+
     def _signal_handler(self, sig, frame) -> None:
         self._trace_log(f"Signal {signal.strsignal(sig)} received")
         self.shutdown()
@@ -157,7 +558,12 @@ class Framework:
 
     def _load_config(self, config: Config) -> None:
         self._flask.config.from_object(config)
-        self._flask.config.from_prefixed_env("CFG")
+        self._flask.config.from_prefixed_env(self._env_prefix())
+        self._config_defaults = config_defaults(config)
+        self._flask.config.update(
+            validate_config(self._config_defaults, self._flask.config)
+        )
+        self._config = ReadOnlyDict(self._flask.config)
 
         if self._flask.config["LOG_LEVEL"] in ["TRACE "]:
             logging.getLogger("werkzeug").setLevel(logging.DEBUG)
@@ -165,46 +571,110 @@ class Framework:
             logging.getLogger("werkzeug").setLevel(logging.ERROR)
         self._flask.logger.setLevel(self._flask.config["LOG_LEVEL"])
 
+    def _env_prefix(self) -> str:
+        """Added apps read settings from CFG_<APP NAME>_ env vars"""
+        if self._host:
+            return "CFG_" + re.sub(r"\W", "_", self._name).upper()
+        return "CFG"
+
+    def _job_id(self, name: str) -> str:
+        return self._job_id_prefix + name
+
     def _do_wait(self) -> None:
         self._trace_log("Start blocking")
-        while not self._flask.config["EXIT"]:
-            try:
-                time.sleep(1)
-            except KeyboardInterrupt:
-                self._trace_log("KeyboardInterrupt received")
-                self.shutdown()
-                break
+        try:
+            self._stopped.wait()
+        except KeyboardInterrupt:
+            self._trace_log("KeyboardInterrupt received")
+            self.shutdown()
         self._trace_log("End blocking")
 
-    def _add_scheduler_jobs(self, next_run_time) -> None:
-        update_interval = self._flask.config["UPDATE_INTERVAL"]
-        if update_interval > 0:
+    def _create_update_triggers(
+        self, config: Mapping[str, Any]
+    ) -> dict[TriggerSource, BaseTrigger]:
+        """
+        Return triggers of interval and cron do_update jobs for configuration.
+        Raise ValueError if schedule is invalid
+        """
+        triggers = {}
+        jitter = config["UPDATE_JITTER"] or None
+        if (update_interval := config["UPDATE_INTERVAL"]) > 0:
+            triggers[TriggerSource.INTERVAL] = IntervalTrigger(
+                seconds=update_interval, jitter=jitter
+            )
+        if cron_schedule := config["UPDATE_CRON_SCHEDULE"]:
+            if not isinstance(cron_schedule, str):
+                raise ValueError(f"Invalid cron schedule: {cron_schedule!r}")
+            triggers[TriggerSource.CRON] = self._create_cron_trigger(
+                cron_schedule, jitter
+            )
+        return triggers
+
+    def _add_scheduler_jobs(
+        self, triggers: Mapping[TriggerSource, BaseTrigger], next_run_time
+    ) -> None:
+        if trigger := triggers.get(TriggerSource.INTERVAL):
             self._trace_log(
-                f"Schedule interval job to happen in every {update_interval} sec"
+                "Schedule interval job to happen in every "
+                f"{self._flask.config['UPDATE_INTERVAL']} sec"
             )
             self._scheduler.add_job(
                 self._call_do_update,
                 name="INTERVAL",
-                trigger="interval",
+                trigger=trigger,
                 args=[TriggerSource.INTERVAL],
-                id="do_update_interval",
+                id=self._job_id("do_update_interval"),
                 max_instances=1,
-                seconds=self._flask.config["UPDATE_INTERVAL"],
-                next_run_time=next_run_time,
+                next_run_time=self._with_jitter(next_run_time),
+            )
+        if trigger := triggers.get(TriggerSource.CRON):
+            self._trace_log(
+                f"Schedule cron job: {self._flask.config['UPDATE_CRON_SCHEDULE']}"
             )
-        if cron_schedule := self._flask.config["UPDATE_CRON_SCHEDULE"]:
-            self._trace_log(f"Schedule cron job: {cron_schedule}")
             self._scheduler.add_job(
                 self._call_do_update,
                 name="CRON_SCHEDULE",
-                trigger=self._create_cron_trigger(),
+                trigger=trigger,
                 args=[TriggerSource.CRON],
-                id="do_update_cron",
+                id=self._job_id("do_update_cron"),
                 max_instances=1,
             )
 
-    def _create_cron_trigger(self) -> CronTrigger:
-        cron_schedule = self._flask.config["UPDATE_CRON_SCHEDULE"]
+    def _add_health_check_job(self) -> None:
+        if "health" not in self._job_executors:
+            # slow health checks must not wait for or block update jobs
+            self._scheduler.add_executor(
+                ThreadPoolExecutor(len(self._frameworks())), "health"
+            )
+            self._job_executors.add("health")
+        interval = self._flask.config["HEALTH_CHECK_INTERVAL"]
+        self._trace_log(f"Schedule health check to happen in every {interval} sec")
+        self._scheduler.add_job(
+            self._health_probe.run,
+            name="HEALTH_CHECK",
+            trigger="interval",
+            id=self._job_id("health_check"),
+            executor="health",
+            max_instances=1,
+            coalesce=True,
+            seconds=interval,
+            next_run_time=datetime.now(),
+        )
+
+    def _with_jitter(self, run_time: datetime) -> datetime:
+        """
+        Delay run time randomly up to UPDATE_JITTER seconds, so that instances
+        started together do not poll in lockstep
+        """
+        if jitter := self._flask.config["UPDATE_JITTER"]:
+            # spreads load only, not security sensitive
+            delay = random.uniform(0, jitter)  # nosec B311
+            return run_time + timedelta(seconds=delay)
+        return run_time
+
+    def _create_cron_trigger(self, cron_schedule: str, jitter: float | None = None):
+        from apscheduler.triggers.cron import CronTrigger
+
         values = cron_schedule.split()
         if len(values) == 6:
             return CronTrigger(
@@ -214,6 +684,7 @@ class Framework:
                 day=values[3],
                 month=values[4],
                 day_of_week=values[5],
+                jitter=jitter,
             )
         else:
             return CronTrigger.from_crontab(cron_schedule)
@@ -223,7 +694,10 @@ class Framework:
             self._flask.logger.debug("Application already started")
             return 1
 
+        if not self._name:
+            self._name = getattr(config, "app_name", "") or app.__class__.__name__
         self._load_config(config)
+        self._stopped.clear()
 
         if blocked:
             self._install_signal_handlers()
@@ -235,8 +709,11 @@ class Framework:
             def __init__(self, obj) -> None:
                 self.obj = obj
 
-            def get_config(self) -> dict:
-                return ReadOnlyDict(self.obj._flask.config)
+            def get_config(self) -> Mapping[str, Any]:
+                return self.obj._config
+
+            def add_config_listener(self, listener: Callable) -> None:
+                self.obj._config_listeners.append(listener)
 
             def get_logger(self) -> logging.Logger:
                 return self.obj._flask.logger
@@ -252,7 +729,7 @@ class Framework:
                 provide_automatic_options=None,
                 **options,
             ) -> None:
-                self.obj._flask.add_url_rule(
+                self.obj._add_url_rule(
                     rule,
                     endpoint=endpoint,
                     view_func=view_func,
@@ -265,23 +742,218 @@ class Framework:
                 topic: str,
                 value: str | bytes | bytearray | int | float,
                 retain=False,
+                properties: PublishProperties | None = None,
+            ) -> None:
+                self.obj._publish_value_to_mqtt_topic(
+                    topic, value, retain=retain, properties=properties
+                )
+
+            def publish_values_to_mqtt_topics(
+                self,
+                values: Mapping[str, MqttValue] | Iterable[tuple[str, MqttValue]],
+                retain=False,
+                qos=0,
+                properties: PublishProperties | None = None,
+            ) -> dict[str, str]:
+                return self.obj._publish_values_to_mqtt_topics(
+                    values, retain=retain, qos=qos, properties=properties
+                )
+
+            def publish_object_to_mqtt_topic(
+                self,
+                topic: str,
+                obj: Any,
+                retain=False,
+                codec="json",
+                properties: PublishProperties | None = None,
+            ) -> None:
+                self.obj._publish_object_to_mqtt_topic(
+                    topic, obj, retain=retain, codec=codec, properties=properties
+                )
+
+            def publish_objects_to_mqtt_topics(
+                self,
+                values: Mapping[str, Any] | Iterable[tuple[str, Any]],
+                retain=False,
+                qos=0,
+                codec="json",
+                properties: PublishProperties | None = None,
+            ) -> dict[str, str]:
+                return self.obj._publish_objects_to_mqtt_topics(
+                    values,
+                    retain=retain,
+                    qos=qos,
+                    codec=codec,
+                    properties=properties,
+                )
+
+            def set_publish_policy(
+                self, topic: str, policy: PublishPolicy | None
             ) -> None:
-                self.obj._publish_value_to_mqtt_topic(topic, value, retain=retain)
+                self.obj._last_value_cache.set_policy(topic, policy)
+
+            def add_update_job(
+                self,
+                name: str,
+                func: Callable,
+                interval: float | None = None,
+                cron: str | None = None,
+                max_instances=1,
+                executor="default",
+            ) -> None:
+                self.obj._add_update_job(
+                    name,
+                    func,
+                    interval=interval,
+                    cron=cron,
+                    max_instances=max_instances,
+                    executor=executor,
+                )
+
+            def remove_update_job(self, name: str) -> None:
+                self.obj._remove_update_job(name)
 
             def subscribe_to_mqtt_topic(
-                self, topic: str, callback: Callable[[str, str], None] | None = None
+                self,
+                topic: str,
+                callback: (
+                    Callable[[str, str], None] | Callable[[str, bytes], None] | None
+                ) = None,
+                raw=False,
+                process=False,
+                codec: str | None = None,
+                shared=True,
+                with_wildcards=False,
             ) -> None:
-                self.obj._subscribe_to_mqtt_topic(topic, callback)
+                self.obj._subscribe_to_mqtt_topic(
+                    topic,
+                    callback,
+                    raw=raw,
+                    process=process,
+                    codec=codec,
+                    shared=shared,
+                    with_wildcards=with_wildcards,
+                )
 
-        self._limiter.init_app(self._flask)
-        self._metrics.init_app(self._flask)
-        self._app.init(CallbacksImpl(self))
-        self._mqtt.init_app(self._flask)
+        class AsyncCallbacksImpl(CallbacksImpl):
+            async def publish_value_to_mqtt_topic(
+                self,
+                topic: str,
+                value: MqttValue,
+                retain=False,
+                properties: PublishProperties | None = None,
+            ) -> None:
+                await self.obj._call_publish_async(
+                    self.obj._publish_value_to_mqtt_topic,
+                    topic,
+                    value,
+                    retain,
+                    properties,
+                )
+
+            async def publish_values_to_mqtt_topics(
+                self,
+                values: Mapping[str, MqttValue] | Iterable[tuple[str, MqttValue]],
+                retain=False,
+                qos=0,
+                properties: PublishProperties | None = None,
+            ) -> dict[str, str]:
+                return await self.obj._call_publish_async(
+                    self.obj._publish_values_to_mqtt_topics,
+                    values,
+                    retain,
+                    qos,
+                    properties,
+                )
+
+            async def publish_object_to_mqtt_topic(
+                self,
+                topic: str,
+                obj: Any,
+                retain=False,
+                codec="json",
+                properties: PublishProperties | None = None,
+            ) -> None:
+                await self.obj._call_publish_async(
+                    self.obj._publish_object_to_mqtt_topic,
+                    topic,
+                    obj,
+                    retain,
+                    codec,
+                    properties,
+                )
+
+            async def publish_objects_to_mqtt_topics(
+                self,
+                values: Mapping[str, Any] | Iterable[tuple[str, Any]],
+                retain=False,
+                qos=0,
+                codec="json",
+                properties: PublishProperties | None = None,
+            ) -> dict[str, str]:
+                return await self.obj._call_publish_async(
+                    self.obj._publish_objects_to_mqtt_topics,
+                    values,
+                    retain,
+                    qos,
+                    codec,
+                    properties,
+                )
+
+            async def subscribe_to_mqtt_topic(
+                self,
+                topic: str,
+                callback: Callable[..., Awaitable[None]] | None = None,
+                raw=False,
+                process=False,
+                codec: str | None = None,
+                shared=True,
+                with_wildcards=False,
+            ) -> None:
+                self.obj._subscribe_to_mqtt_topic(
+                    topic,
+                    callback,
+                    raw=raw,
+                    process=process,
+                    codec=codec,
+                    shared=shared,
+                    with_wildcards=with_wildcards,
+                )
+
+        if self._flask.config["WEB_ENABLED"] and not self._host:
+            self._init_web()
+        self._start_dispatcher()
+        self._start_value_store()
+        self._start_history()
+        self._start_coalescer()
+        self._open_offline_queue()
+        self._start_leader_election()
+        if inspect.iscoroutinefunction(app.do_update):
+            self._start_event_loop()
+            self._app.init(AsyncCallbacksImpl(self))
+        else:
+            self._app.init(CallbacksImpl(self))
         self._add_scheduler_jobs(
+            self._create_update_triggers(self._flask.config),
             next_run_time=datetime.now()
-            + timedelta(seconds=self._flask.config["DELAY_BEFORE_FIRST_TRY"])
+            + timedelta(seconds=self._flask.config["DELAY_BEFORE_FIRST_TRY"]),
         )
-        self._start_flask()
+        self._add_health_check_job()
+        if self._host:
+            # connection, web server and scheduler are started by the host
+            self._flask.logger.info(
+                f"{app.__class__.__name__} version {app.get_version()} started"
+            )
+            self._started = True
+            return 0
+        self._start_guests()
+        self._start_event_stream()
+        self._init_mqtt_v5()
+        self._mqtt.init_app(self._flask)
+        if self._flask.config["WEB_ENABLED"]:
+            self._start_flask()
+        else:
+            self._start_metrics_server()
         self._flask.logger.critical(
             f"{app.__class__.__name__} version {app.get_version()} started, "
             f"framework version {__version__} "
@@ -291,53 +963,705 @@ class Framework:
         self._started = True
         return 0
 
+    def _start_guests(self) -> None:
+        prefixes = [self._flask.config["MQTT_TOPIC_PREFIX"]]
+        for guest, (app, config) in zip(self._guests, self._guest_apps):
+            guest._start(app, config)
+            prefix = guest._flask.config["MQTT_TOPIC_PREFIX"]
+            # messages are routed to one app by topic prefix
+            for other in prefixes:
+                if prefix.startswith(other) or other.startswith(prefix):
+                    raise ValueError(
+                        f"Topic prefix '{prefix}' of app {guest._name} "
+                        f"overlaps topic prefix '{other}'"
+                    )
+            prefixes.append(prefix)
+            self._guest_router.add(prefix + "#", guest)
+
     def _shutdown(self) -> None:
-        self._app.stop()
-        self._scheduler.shutdown(wait=True)
-        self._stop_flask()
-        self._mqtt.unsubscribe_all()
-        self._publish_value_to_mqtt_topic(self.TOPIC_STATUS, "offline", True)
-        self._mqtt._disconnect()
+        phases = (
+            ("stop intake", self._shutdown_stop_intake),
+            ("wait for jobs", self._shutdown_wait_for_jobs),
+            ("drain outbound", self._shutdown_drain_outbound),
+            ("publish offline", self._shutdown_publish_offline),
+            ("disconnect", self._shutdown_disconnect),
+        )
+        self._shutdown_durations = {}
+        for name, phase in phases:
+            start = time.monotonic()
+            try:
+                phase()
+            except Exception as e:
+                self._flask.logger.exception(
+                    "Error occurred in shutdown phase %s: %s", name, e
+                )
+            duration = time.monotonic() - start
+            self._shutdown_durations[name] = duration
+            self._flask.logger.info("Shutdown phase %s took %.3f s", name, duration)
         self._started = False
 
+    def _shutdown_stop_intake(self) -> None:
+        """Stop new jobs, requests and MQTT messages and handle queued messages"""
+        self._scheduler.pause()
+        if self._metrics_server:
+            self._stop_metrics_server()
+        else:
+            self._stop_flask()
+        self._stop_event_stream()
+        self._mqtt.unsubscribe_all()
+        deadline = time.monotonic() + self._flask.config["SHUTDOWN_DRAIN_TIMEOUT"]
+        for framework in self._frameworks():
+            framework._stop_dispatcher(max(deadline - time.monotonic(), 0))
+
+    def _shutdown_wait_for_jobs(self) -> None:
+        """Let apps and running jobs finish until the deadline"""
+        timeout = self._flask.config["SHUTDOWN_JOBS_TIMEOUT"]
+        deadline = time.monotonic() + timeout
+        for framework in self._frameworks():
+            try:
+                framework._call_app(framework._app.stop)
+            except Exception as e:
+                framework._flask.logger.exception("Error occurred in stop: %s", e)
+        if not self._run_with_timeout(
+            functools.partial(self._scheduler.shutdown, wait=True),
+            deadline - time.monotonic(),
+        ):
+            self._flask.logger.warning(
+                "Jobs still running after %s s, not waiting them anymore", timeout
+            )
+        for framework in self._frameworks():
+            framework._stop_event_loop(max(deadline - time.monotonic(), 0))
+        if not self._run_with_timeout(
+            self._stop_process_pools, deadline - time.monotonic()
+        ):
+            self._flask.logger.warning(
+                "Process pool still running after %s s, not waiting it anymore",
+                timeout,
+            )
+
+    def _shutdown_drain_outbound(self) -> None:
+        for framework in self._frameworks():
+            framework._stop_coalescer()
+
+    def _shutdown_publish_offline(self) -> None:
+        """
+        Publish offline status with QoS 1 and wait for acknowledgement, so
+        messages published before are delivered to broker too
+        """
+        deadline = time.monotonic() + self._flask.config["SHUTDOWN_DRAIN_TIMEOUT"]
+        infos = [
+            (framework, framework._publish_offline_status())
+            for framework in self._frameworks()
+        ]
+        for framework, info in infos:
+            if info is not None and info.rc == MQTT_ERR_SUCCESS:
+                info.wait_for_publish(max(deadline - time.monotonic(), 0))
+                if not info.is_published():
+                    framework._flask.logger.warning("Offline status not acknowledged")
+
+    def _shutdown_disconnect(self) -> None:
+        # network loop ends right after DISCONNECT is sent, stopping the loop
+        # first would leave the packet unsent and wait for the select timeout
+        self._mqtt.client.disconnect()
+        self._mqtt.client.loop_stop()
+        for framework in self._frameworks():
+            framework._close_offline_queue()
+
+    def _run_with_timeout(self, func: Callable, timeout: float) -> bool:
+        """Call func in own thread, return False if it did not complete in time"""
+        thread = threading.Thread(target=func, daemon=True)
+        thread.start()
+        thread.join(max(timeout, 0))
+        return not thread.is_alive()
+
+    def _start_dispatcher(self) -> None:
+        if (workers := self._flask.config["MQTT_DISPATCHER_WORKERS"]) > 0:
+            self._trace_log(f"Start MQTT message dispatcher with {workers} workers")
+            self._dispatcher = MessageDispatcher(
+                workers,
+                self._flask.config["MQTT_DISPATCHER_QUEUE_SIZE"],
+                self._metrics_registry,
+                self._flask.logger,
+            )
+            self._dispatcher.start()
+
+    def _stop_dispatcher(self, timeout: float | None = None) -> None:
+        if self._dispatcher:
+            self._trace_log("Stop MQTT message dispatcher")
+            if timeout is None:
+                timeout = self._flask.config["SHUTDOWN_DRAIN_TIMEOUT"]
+            if not self._dispatcher.stop(timeout):
+                self._flask.logger.warning("MQTT message dispatcher not drained")
+            self._dispatcher = None
+
+    def _init_mqtt_v5(self) -> None:
+        self._mqtt_v5 = self._flask.config["MQTT_PROTOCOL_VERSION"] == MQTTv5
+        maximum = self._flask.config["MQTT_TOPIC_ALIAS_MAXIMUM"]
+        aliases = None
+        if self._mqtt_v5 and maximum > 0:
+            self._trace_log(f"Use up to {maximum} MQTT topic aliases")
+            aliases = TopicAliases(maximum, self._metrics_registry)
+        for framework in self._frameworks():
+            framework._mqtt_v5 = self._mqtt_v5
+            framework._topic_aliases = aliases
+
+    def _start_value_store(self) -> None:
+        if self._flask.config["VALUE_STORE_ENABLED"] and self._value_store is None:
+            self._value_store = ValueStore(
+                self._flask.config["VALUE_STORE_MAX_TOPICS"], self._metrics_registry
+            )
+
+    def _start_history(self) -> None:
+        if not self._flask.config["HISTORY_ENABLED"] or self._history is not None:
+            return
+        from mqtt_framework.history import History
+
+        self._history = History(
+            {
+                "raw": self._flask.config["HISTORY_RAW_SIZE"],
+                "minute": self._flask.config["HISTORY_MINUTE_SIZE"],
+                "hour": self._flask.config["HISTORY_HOUR_SIZE"],
+            },
+            self._flask.config["HISTORY_MAX_MEMORY_MB"] * 1024 * 1024,
+            self._metrics_registry,
+        )
+
+    def _start_event_stream(self) -> None:
+        if not self._flask.config["STREAM_ENABLED"]:
+            return
+        from mqtt_framework.event_stream import EventStream
+
+        port = self._flask.config["STREAM_PORT"]
+        self._trace_log(f"Start event stream in port {port}")
+        self._start_event_loop()
+        stream = EventStream(
+            port,
+            self._flask.config["STREAM_BUFFER_SIZE"],
+            self._metrics_registry,
+            self._flask.logger,
+        )
+        stream.start(self._event_loop)
+        for framework in self._frameworks():
+            framework._event_stream = stream
+
+    def _stop_event_stream(self) -> None:
+        if self._event_stream:
+            self._trace_log("Stop event stream")
+            stream = self._event_stream
+            for framework in self._frameworks():
+                framework._event_stream = None
+            stream.stop(self._event_loop, self._flask.config["SHUTDOWN_DRAIN_TIMEOUT"])
+
+    def _start_coalescer(self) -> None:
+        if (interval := self._flask.config["MQTT_PUBLISH_COALESCE_INTERVAL"]) > 0:
+            self._trace_log(f"Start MQTT publish coalescer, interval {interval} sec")
+            self._coalescer = PublishCoalescer(
+                self._send_to_mqtt,
+                interval,
+                self._flask.config["MQTT_PUBLISH_COALESCE_MAX_PENDING"],
+                self._metrics_registry,
+                self._flask.logger,
+            )
+            self._coalescer.start()
+
+    def _stop_coalescer(self) -> None:
+        if self._coalescer:
+            self._trace_log("Stop MQTT publish coalescer")
+            coalescer = self._coalescer
+            self._coalescer = None
+            coalescer.stop(self._flask.config["SHUTDOWN_DRAIN_TIMEOUT"])
+
+    def _open_offline_queue(self) -> None:
+        if path := self._flask.config["MQTT_OFFLINE_QUEUE_FILE"]:
+            from mqtt_framework.offline_queue import OfflineQueue
+
+            self._offline_queue = OfflineQueue(
+                path,
+                self._flask.config["MQTT_OFFLINE_QUEUE_MAX_SIZE"],
+                self._flask.config["MQTT_OFFLINE_QUEUE_DROP_POLICY"],
+                self._metrics_registry,
+                self._flask.logger,
+            )
+            self._flask.logger.info(
+                "Offline queue %s opened, %d messages queued",
+                path,
+                len(self._offline_queue),
+            )
+
+    def _close_offline_queue(self) -> None:
+        if self._offline_queue is not None:
+            self._offline_queue_stop.set()
+            if thread := self._offline_queue_thread:
+                thread.join(self._flask.config["SHUTDOWN_DRAIN_TIMEOUT"])
+                if thread.is_alive():
+                    # replay thread still uses the database, leave it open
+                    self._flask.logger.warning("Offline queue replay not stopped")
+                    return
+            self._offline_queue.close()
+            self._offline_queue = None
+            self._offline_queue_replaying = False
+            self._offline_queue_thread = None
+
+    def _start_leader_election(self) -> None:
+        if not self._flask.config["CLUSTER_ENABLED"]:
+            return
+        import socket
+        import uuid
+
+        from mqtt_framework.leader_election import LeaderElection
+
+        node_id = self._flask.config["CLUSTER_NODE_ID"]
+        if not node_id:
+            node_id = f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+        # replicas must not kick each other out of the broker
+        self._flask.config["MQTT_CLIENT_ID"] = (
+            f"{self._flask.config['MQTT_CLIENT_ID']}-{node_id}"
+        )
+        self._config = ReadOnlyDict(self._flask.config)
+        lease_topic = self._to_full_mqtt_topic_name(self.TOPIC_LEADER)
+        self._trace_log(f"Start leader election, node {node_id}")
+        self._leader_election = LeaderElection(
+            node_id,
+            lambda payload: self._publish_lease(lease_topic, payload),
+            self._flask.config["CLUSTER_LEASE_INTERVAL"],
+            self._flask.config["CLUSTER_LEASE_TIMEOUT"],
+            self._leader_changed,
+            self._metrics_registry,
+            self._flask.logger,
+        )
+        self._leader_election.start()
+
+    def _publish_lease(self, lease_topic: str, payload: bytes) -> None:
+        self._mqtt.client.publish(lease_topic, payload, qos=1, retain=True)
+
+    def _leader_changed(self, is_leader: bool) -> None:
+        # replicas share the status topic, leader keeps it online
+        if is_leader:
+            self._publish_status("online")
+
+    def _publish_offline_status(self) -> MQTTMessageInfo | None:
+        """
+        Publish offline status. In clustered mode leadership is released first
+        and status is published only by the leader, as other replicas remain
+        """
+        if election := self._leader_election:
+            self._leader_election = None
+            was_leader = election.is_leader
+            election.stop()
+            if not was_leader:
+                return None
+        return self._publish_status("offline", qos=1)
+
+    def _start_event_loop(self) -> None:
+        with self._event_loop_lock:
+            if not self._event_loop:
+                self._trace_log("Start asyncio event loop")
+                self._event_loop = EventLoopThread(self._flask.logger)
+                self._event_loop.start()
+
+    def _stop_event_loop(self, timeout: float = 10) -> None:
+        with self._event_loop_lock:
+            if self._event_loop:
+                self._trace_log("Stop asyncio event loop")
+                event_loop = self._event_loop
+                self._event_loop = None
+                try:
+                    event_loop.stop(timeout)
+                except concurrent.futures.TimeoutError:
+                    # not the builtin TimeoutError before Python 3.11
+                    self._flask.logger.warning(
+                        "Coroutines still running after %s s", timeout
+                    )
+
     ###########################################################
     # Generic methods
     ###########################################################
 
+    def _call_app(self, func: Callable, *args):
+        """Call app function, coroutines are run in event loop until completed"""
+        if inspect.iscoroutinefunction(func):
+            return self._event_loop.run(func(*args))
+        return func(*args)
+
+    def _check_app_health(self) -> bool:
+        return self._call_app(self._app.do_healthy_check)
+
+    def _call_app_nowait(self, func: Callable, *args) -> None:
+        """Call app function, coroutines are scheduled to event loop"""
+        if inspect.iscoroutinefunction(func):
+            self._event_loop.submit(func(*args))
+        else:
+            func(*args)
+
+    async def _call_publish_async(self, func: Callable, *args):
+        # offline queue writes to disk, keep it out of the event loop thread
+        if self._offline_queue is not None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, functools.partial(func, *args))
+        return func(*args)
+
     def _call_do_update(self, trigger_source: TriggerSource) -> None:
+        if not self._is_run_allowed(trigger_source):
+            return
+        started = time.monotonic()
+        with self._update_lock:
+            if (
+                trigger_source != TriggerSource.MANUAL
+                and started < self._update_not_before
+            ):
+                self._trace_log(
+                    "Back off after errors, skip %s run", trigger_source.name
+                )
+                self._update_runs_skipped_metric.labels("do_update", "backoff").inc()
+                return
+            if self._update_running:
+                # run when the running update is done, once per trigger
+                if trigger_source in self._deferred_updates:
+                    self._update_runs_skipped_metric.labels(
+                        "do_update", "overrun"
+                    ).inc()
+                else:
+                    self._trace_log(
+                        "Update running, %s run deferred", trigger_source.name
+                    )
+                    self._deferred_updates.append(trigger_source)
+                return
+            if trigger_source == TriggerSource.MANUAL:
+                self._manual_update_pending = False
+            self._update_running = True
+
         @self._do_update_metric.time()
         @self._do_update_exception_metric.count_exceptions()
         def do():
-            self._app.do_update(trigger_source)
+            self._call_app(self._app.do_update, trigger_source)
+
+        try:
+            do()
+        except Exception:
+            self._back_off_updates(started)
+            raise
+        finally:
+            with self._update_lock:
+                self._update_running = False
+                follow_up = (
+                    self._deferred_updates.pop(0) if self._deferred_updates else None
+                )
+            if follow_up is not None:
+                self._schedule_update(follow_up, 0)
+        with self._update_lock:
+            failures = self._update_failures
+            self._update_failures = 0
+            self._update_not_before = 0.0
+        if failures:
+            self._flask.logger.info(
+                "do_update succeeded after %d errors, back to normal schedule",
+                failures,
+            )
+
+    def _back_off_updates(self, started: float) -> None:
+        """
+        Skip scheduled runs after consecutive do_update errors, so that the
+        delay from the start of the failed run doubles after each error up to
+        UPDATE_BACKOFF_MAX
+        """
+        interval = self._flask.config["UPDATE_INTERVAL"]
+        backoff_max = self._flask.config["UPDATE_BACKOFF_MAX"]
+        base = interval if interval > 0 else UPDATE_BACKOFF_BASE
+        with self._update_lock:
+            self._update_failures += 1
+            failures = self._update_failures
+            if backoff_max <= 0:
+                return
+            delay = min(base * 2**failures, backoff_max)
+            # half of the base as tolerance for schedule drift, so the run
+            # scheduled at the end of the delay is not skipped
+            self._update_not_before = max(
+                self._update_not_before, started + delay - base / 2
+            )
+        self._flask.logger.warning(
+            "%d consecutive do_update errors, next try in %d seconds",
+            failures,
+            delay,
+        )
+
+    def _scheduler_event(self, event: JobEvent) -> None:
+        """Measure update job scheduling, called by scheduler of the host"""
+        framework = next(
+            (
+                guest
+                for guest in self._guests
+                if event.job_id.startswith(guest._job_id_prefix)
+            ),
+            self,
+        )
+        job_id = event.job_id.removeprefix(framework._job_id_prefix)
+        if job_id.startswith("do_update_"):
+            job = "do_update"
+        elif job_id.startswith("job_"):
+            job = job_id.removeprefix("job_")
+        else:
+            return
+        if event.code == EVENT_JOB_SUBMITTED:
+            drift = datetime.now(timezone.utc) - event.scheduled_run_times[-1]
+            framework._update_schedule_drift_metric.labels(job).observe(
+                max(drift.total_seconds(), 0)
+            )
+        elif event.code == EVENT_JOB_MAX_INSTANCES:
+            # previous run still going
+            framework._update_runs_skipped_metric.labels(job, "overrun").inc()
+        else:
+            framework._update_runs_misfired_metric.labels(job).inc()
+
+    def _add_update_job(
+        self,
+        name: str,
+        func: Callable,
+        interval: float | None = None,
+        cron: str | None = None,
+        max_instances=1,
+        executor="default",
+    ) -> None:
+        if (interval is None) == (cron is None):
+            raise ValueError("Either interval or cron schedule must be given")
+        if interval is not None and interval <= 0:
+            raise ValueError("Interval must be positive")
+        process = executor == "process"
+        if process:
+            # job thread waits in default executor while worker process runs
+            executor = "default"
+        elif executor != "default" and executor not in self._job_executors:
+            self._trace_log(f"Add job executor {executor}")
+            self._scheduler.add_executor(ThreadPoolExecutor(max_instances), executor)
+            self._job_executors.add(executor)
+        options = {}
+        jitter = self._flask.config["UPDATE_JITTER"] or None
+        if interval is not None:
+            self._trace_log(f"Schedule job {name} to happen in every {interval} sec")
+            trigger = IntervalTrigger(seconds=interval, jitter=jitter)
+            trigger_source = TriggerSource.INTERVAL
+            options["next_run_time"] = self._with_jitter(
+                datetime.now()
+                + timedelta(seconds=self._flask.config["DELAY_BEFORE_FIRST_TRY"])
+            )
+        else:
+            self._trace_log(f"Schedule job {name}: {cron}")
+            trigger = self._create_cron_trigger(cron, jitter)
+            trigger_source = TriggerSource.CRON
+        self._scheduler.add_job(
+            self._call_update_job,
+            name=name,
+            trigger=trigger,
+            args=[name, func, trigger_source, process],
+            id=self._job_id(f"job_{name}"),
+            max_instances=max_instances,
+            executor=executor,
+            replace_existing=True,
+            **options,
+        )
+
+    def _remove_update_job(self, name: str) -> None:
+        with contextlib.suppress(JobLookupError):
+            self._scheduler.remove_job(self._job_id(f"job_{name}"))
+
+    def _call_update_job(
+        self, name: str, func: Callable, trigger_source: TriggerSource, process=False
+    ) -> None:
+        if not self._is_run_allowed(trigger_source):
+            return
+
+        @self._update_job_metric.labels(name).time()
+        @self._update_job_exception_metric.labels(name).count_exceptions()
+        def do():
+            if process:
+                future = self._get_process_pool().submit(func, trigger_source)
+                self._publish_process_result(future.result())
+            else:
+                self._call_app(func, trigger_source)
 
         do()
 
+    def _is_run_allowed(self, trigger_source: TriggerSource) -> bool:
+        """In clustered mode scheduled runs are done only by the leader"""
+        if trigger_source == TriggerSource.MANUAL or self._leader_election is None:
+            return True
+        if not self._leader_election.is_leader:
+            self._trace_log("Not cluster leader, skip %s run", trigger_source.name)
+            return False
+        return True
+
+    def _get_process_pool(self) -> "ProcessPool":
+        with self._process_pool_lock:
+            if not self._process_pool:
+                from mqtt_framework.process_pool import ProcessPool
+
+                workers = self._flask.config["PROCESS_POOL_WORKERS"]
+                self._trace_log(f"Start process pool with {workers} workers")
+                self._process_pool = ProcessPool(workers, self._metrics_registry)
+            return self._process_pool
+
+    def _stop_process_pools(self) -> None:
+        for framework in self._frameworks():
+            framework._stop_process_pool()
+
+    def _stop_process_pool(self) -> None:
+        with self._process_pool_lock:
+            if self._process_pool:
+                self._trace_log("Stop process pool")
+                self._process_pool.shutdown()
+                self._process_pool = None
+
+    def _publish_process_result(
+        self,
+        result: Mapping[str, MqttValue] | Iterable[tuple[str, MqttValue]] | None,
+    ) -> None:
+        if result:
+            self._publish_values_to_mqtt_topics(result)
+
     def _update_now(self) -> None:
-        self._scheduler.remove_all_jobs()
+        """
+        Run do_update after UPDATE_NOW_DEBOUNCE seconds. Triggers arriving
+        before it starts are merged to it, and triggers arriving while any
+        update runs queue one more run after it. Recurring jobs are not changed
+        """
+        with self._update_lock:
+            if self._manual_update_pending:
+                self._trace_log("Update already pending, trigger coalesced")
+                self._update_triggers_coalesced_metric.inc()
+                return
+            self._manual_update_pending = True
+            if self._update_running:
+                # started when the running update is done
+                self._deferred_updates.append(TriggerSource.MANUAL)
+                return
+        self._schedule_update(
+            TriggerSource.MANUAL, self._flask.config["UPDATE_NOW_DEBOUNCE"]
+        )
+
+    def _schedule_update(self, trigger_source: TriggerSource, delay: float) -> None:
+        """Run do_update once after delay seconds in a one-off scheduler job"""
+        manual = trigger_source == TriggerSource.MANUAL
         self._scheduler.add_job(
             self._call_do_update,
+            name=trigger_source.name,
             trigger="date",
-            args=[TriggerSource.MANUAL],
-            id="do_update_manual",
-            max_instances=1,
-            next_run_time=datetime.now(),
+            args=[trigger_source],
+            id=self._job_id("do_update_manual" if manual else "do_update_deferred"),
+            replace_existing=True,
+            next_run_time=datetime.now() + timedelta(seconds=delay),
         )
-        self._add_scheduler_jobs(
-            next_run_time=datetime.now()
-            + timedelta(seconds=self._flask.config["UPDATE_INTERVAL"])
+
+    def _reload_config(self, data: str) -> None:
+        """
+        Replace settings given as JSON object, e.g. {"UPDATE_INTERVAL": 30}.
+        Settings are validated and applied all or nothing
+        """
+        try:
+            changes = json.loads(data)
+            if not isinstance(changes, dict):
+                raise ValueError("JSON object expected")
+            for key in changes:
+                if key not in self._config_defaults:
+                    raise ValueError(f"Unknown setting {key}")
+                if not is_reloadable(key):
+                    raise ValueError(f"{key} can not be changed without restart")
+            values = validate_config(self._config_defaults, changes)
+            if values.get("LOG_LEVEL", "INFO") not in LOG_LEVELS:
+                raise ValueError(f"Invalid log level: {values['LOG_LEVEL']!r}")
+        except ValueError as e:
+            self._reject_config_reload(e)
+            return
+        with self._config_lock:
+            changed = {
+                key for key, value in values.items() if self._config[key] != value
+            }
+            if not changed:
+                return
+            config = ReadOnlyDict({**self._config, **values})
+            # everything that can fail is done before the snapshot is replaced
+            triggers = None
+            if changed & {"UPDATE_INTERVAL", "UPDATE_CRON_SCHEDULE", "UPDATE_JITTER"}:
+                try:
+                    triggers = self._create_update_triggers(config)
+                except ValueError as e:
+                    self._reject_config_reload(e)
+                    return
+            self._flask.config.update(values)
+            self._config = config
+        self._config_reloads_metric.labels("applied").inc()
+        self._flask.logger.info(
+            "Configuration reloaded: %s", ", ".join(sorted(changed))
         )
+        if "LOG_LEVEL" in changed:
+            self._flask.logger.setLevel(config["LOG_LEVEL"])
+        if triggers is not None:
+            for job_id in ("do_update_interval", "do_update_cron"):
+                with contextlib.suppress(JobLookupError):
+                    self._scheduler.remove_job(self._job_id(job_id))
+            self._add_scheduler_jobs(
+                triggers,
+                next_run_time=datetime.now()
+                + timedelta(seconds=config["UPDATE_INTERVAL"]),
+            )
+        for listener in self._config_listeners:
+            try:
+                self._call_app(listener, config, changed)
+            except Exception as e:
+                self._flask.logger.exception(
+                    "Error occurred in configuration listener: %s", e
+                )
+
+    def _reject_config_reload(self, error: Exception) -> None:
+        self._config_reloads_metric.labels("rejected").inc()
+        self._flask.logger.warning("Configuration reload rejected: %s", error)
 
     ###########################################################
     # REST interface methods
     ###########################################################
 
     def _rest_do_healthy_check(self) -> tuple[str, int]:
-        if self._app.do_healthy_check():
-            self._flask.logger.debug("Healthy check OK")
-            return "OK", 200
+        """Readiness from cached health check results, app is not called"""
+        if not self._guests:
+            report = self._health_report()
+        else:
+            # host is ready only if all added apps are ready too
+            apps = {
+                framework._name: framework._health_report()
+                for framework in self._frameworks()
+            }
+            ok = all(app["status"] == "OK" for app in apps.values())
+            report = {"status": "OK" if ok else "FAIL", "apps": apps}
+        return json.dumps(report), 200 if report["status"] == "OK" else 503
+
+    def _rest_do_liveness_check(self) -> tuple[str, int]:
+        """Liveness of the process, app health does not affect it"""
+        if self._stopped.is_set() or not self._scheduler.running:
+            return json.dumps({"status": "FAIL"}), 503
+        return json.dumps({"status": "OK"}), 200
+
+    def _health_report(self) -> dict[str, Any]:
+        status = self._health_probe.status()
+        if status.age is None:
+            result = "UNKNOWN"
+        elif not status.healthy:
+            result = "FAIL"
+        elif status.age > self._config["HEALTH_CHECK_TTL"]:
+            result = "STALE"
         else:
-            self._flask.logger.warning("Healthy check FAIL")
-            return "FAIL", 500
+            result = "OK"
+        return {
+            "status": result,
+            "age": None if status.age is None else round(status.age, 3),
+            "duration": None if status.duration is None else round(status.duration, 6),
+            "last_failure": status.last_failure,
+            "last_failure_time": (
+                None
+                if status.last_failure_time is None
+                else datetime.fromtimestamp(status.last_failure_time).isoformat()
+            ),
+        }
+
+    def _json_response(self, text: str, status: int) -> Response:
+        return Response(text, status, mimetype="application/json")
 
     def _rest_get_jobs(self) -> tuple[Response, int]:
         jobs = [
@@ -348,9 +1672,88 @@ class Framework:
                 "next_run": str(job.next_run_time),
             }
             for job in self._scheduler.get_jobs()
+            if job.id.startswith(self._job_id_prefix)
         ]
         return jsonify({"jobs": jobs}), 200
 
+    def _rest_get_values(self) -> Response:
+        """
+        Latest values of topics starting with prefix parameter and matching
+        filter parameter, with ETag and Last-Modified for conditional GET
+        """
+        if self._value_store is None:
+            abort(404)
+        try:
+            snapshot = self._value_store.query(
+                request.args.get("prefix", ""), request.args.get("filter")
+            )
+        except ValueError as e:
+            abort(400, str(e))
+        # If-None-Match takes precedence over If-Modified-Since
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains_weak(snapshot.etag)
+        else:
+            since = request.if_modified_since
+            not_modified = (
+                since is not None
+                and snapshot.last_modified is not None
+                and int(snapshot.last_modified) <= since.timestamp()
+            )
+        if not_modified:
+            response = Response(status=304)
+        else:
+            response = jsonify(
+                {
+                    "values": [
+                        {
+                            "topic": entry.topic,
+                            "value": to_json_value(entry.value),
+                            "time": entry.timestamp,
+                            "retain": entry.retain,
+                            "direction": entry.direction,
+                        }
+                        for entry in snapshot.values
+                    ]
+                }
+            )
+        response.set_etag(snapshot.etag)
+        if snapshot.last_modified is not None:
+            response.last_modified = snapshot.last_modified
+        response.cache_control.no_cache = True
+        return response
+
+    def _rest_get_history(self) -> tuple[Response, int]:
+        """
+        Recorded values of topic parameter between start and end parameters
+        (epoch seconds) in given resolution, or list of recorded topics
+        """
+        if self._history is None:
+            abort(404)
+        if (topic := request.args.get("topic")) is None:
+            return jsonify({"topics": self._history.topics()}), 200
+        try:
+            start, end = (
+                None if (arg := request.args.get(name)) is None else float(arg)
+                for name in ("start", "end")
+            )
+            series = self._history.query(
+                topic, start, end, request.args.get("resolution")
+            )
+        except ValueError as e:
+            abort(400, str(e))
+        if series is None:
+            abort(404)
+        return (
+            jsonify(
+                {
+                    "topic": topic,
+                    "resolution": series.resolution,
+                    **series.columns,
+                }
+            ),
+            200,
+        )
+
     def _rest_update_now(self) -> tuple[str, int]:
         self._update_now()
         return "OK", 200
@@ -359,69 +1762,627 @@ class Framework:
     # MQTT methods
     ###########################################################
 
+    def _add_url_rule(
+        self,
+        rule: str,
+        endpoint=None,
+        view_func=None,
+        provide_automatic_options=None,
+        **options,
+    ) -> None:
+        flask = self._flask
+        if self._host:
+            # added apps share web server of the host, under /<app name>/
+            flask = self._host._flask
+            rule = f"/{self._name}{rule}"
+            if endpoint is None and view_func is not None:
+                endpoint = view_func.__name__
+            endpoint = f"{self._name}.{endpoint}"
+        flask.add_url_rule(
+            rule,
+            endpoint=endpoint,
+            view_func=view_func,
+            provide_automatic_options=provide_automatic_options,
+            **options,
+        )
+
     def _to_full_mqtt_topic_name(self, topic: str) -> str:
         return self._flask.config["MQTT_TOPIC_PREFIX"] + topic
 
     def _subscribe_to_mqtt_topic(
-        self, topic: str, callback: Callable[[str, str], None] | None = None
+        self,
+        topic: str,
+        callback: (
+            Callable[[str, str], None] | Callable[[str, bytes], None] | None
+        ) = None,
+        raw=False,
+        process=False,
+        codec: str | None = None,
+        shared=True,
+        with_wildcards=False,
     ) -> None:
+        if codec is not None:
+            if raw:
+                raise ValueError("raw and codec can not be used together")
+            # fail early if codec is unknown or not installed
+            get_codec(codec)
         fulltopic = self._to_full_mqtt_topic_name(topic)
-        self._flask.logger.debug(f"Subscribe to MQTT topic: {fulltopic}")
+        if shared and self._flask.config["CLUSTER_ENABLED"]:
+            # messages are load balanced between replicas by the broker
+            group = self._flask.config["CLUSTER_GROUP"] or self._name
+            fulltopic = f"$share/{group}/{fulltopic}"
+        self._flask.logger.debug("Subscribe to MQTT topic: %s", fulltopic)
+        coroutine = inspect.iscoroutinefunction(callback)
+        if coroutine:
+            self._start_event_loop()
+        # subscriptions without callback are indexed too for metric labels,
+        # but must not replace a subscription with callback
+        if callback or self._mqtt_router.get(topic) is None:
+            self._mqtt_router.add(
+                topic,
+                MqttSubscription(
+                    callback, raw, coroutine, process, codec, with_wildcards
+                ),
+            )
         self._mqtt.subscribe(fulltopic)
-        if callback:
-            self._mqtt_callbacks[topic] = callback
 
     def _publish_value_to_mqtt_topic(
-        self, topic: str, value: str | bytes | bytearray | int | float, retain=False
+        self,
+        topic: str,
+        value: str | bytes | bytearray | int | float,
+        retain=False,
+        properties: PublishProperties | None = None,
     ) -> None:
-        self._mqtt_messages_sent_metric.inc()
-        fulltopic = self._to_full_mqtt_topic_name(topic)
-        self._flask.logger.debug(
-            f"Publish to topic '{fulltopic}' retain {retain}: '{value}'"
+        if self._event_stream or self._value_store or self._history:
+            self._record_published(((topic, value),), retain)
+        if self._coalescer:
+            self._coalescer.put(topic, value, retain, 0, properties)
+        else:
+            self._send_to_mqtt(((topic, value, retain, 0, properties),))
+
+    def _publish_values_to_mqtt_topics(
+        self,
+        values: Mapping[str, MqttValue] | Iterable[tuple[str, MqttValue]],
+        retain=False,
+        qos=0,
+        properties: PublishProperties | None = None,
+    ) -> dict[str, str]:
+        items = values.items() if isinstance(values, Mapping) else values
+        if self._event_stream or self._value_store or self._history:
+            items = list(items)
+            self._record_published(items, retain)
+        if self._coalescer:
+            for topic, value in items:
+                self._coalescer.put(topic, value, retain, qos, properties)
+            return {}
+        return self._send_to_mqtt(
+            [(topic, value, retain, qos, properties) for topic, value in items]
+        )
+
+    def _record_published(
+        self, items: Iterable[tuple[str, MqttValue]], retain: bool
+    ) -> None:
+        prefix = self._flask.config["MQTT_TOPIC_PREFIX"]
+        stream = self._event_stream
+        store = self._value_store
+        history = self._history
+        for topic, value in items:
+            if stream:
+                stream.record("published", prefix + topic, value)
+            if store:
+                store.update(prefix + topic, value, retain, "published")
+            if history:
+                history.record(prefix + topic, value)
+
+    def _publish_object_to_mqtt_topic(
+        self,
+        topic: str,
+        obj: Any,
+        retain=False,
+        codec="json",
+        properties: PublishProperties | None = None,
+    ) -> None:
+        self._publish_value_to_mqtt_topic(
+            topic, self._encode_payload(codec, obj), retain, properties
+        )
+
+    def _publish_objects_to_mqtt_topics(
+        self,
+        values: Mapping[str, Any] | Iterable[tuple[str, Any]],
+        retain=False,
+        qos=0,
+        codec="json",
+        properties: PublishProperties | None = None,
+    ) -> dict[str, str]:
+        items = values.items() if isinstance(values, Mapping) else values
+        encoded = []
+        failures = {}
+        for topic, obj in items:
+            try:
+                encoded.append((topic, self._encode_payload(codec, obj)))
+            except Exception as e:
+                failures[topic] = str(e)
+        if failures:
+            self._flask.logger.warning(
+                "Failed to encode %d values: %s", len(failures), failures
+            )
+        failures.update(
+            self._publish_values_to_mqtt_topics(encoded, retain, qos, properties)
+        )
+        return failures
+
+    def _encode_payload(self, codec: str, obj: Any) -> bytes:
+        encode = get_codec(codec).encode
+        start = time.perf_counter()
+        try:
+            payload = encode(obj)
+        except Exception:
+            self._codec_errors_metric.labels(codec, "encode").inc()
+            raise
+        self._codec_encode_metric.labels(codec).observe(time.perf_counter() - start)
+        return payload
+
+    def _decode_payload(self, codec: str, topic: str, payload: bytes) -> Any:
+        decode = get_codec(codec).decode
+        start = time.perf_counter()
+        try:
+            obj = decode(payload)
+        except Exception as e:
+            self._codec_errors_metric.labels(codec, "decode").inc()
+            self._flask.logger.warning(
+                "Failed to decode MQTT message with %s, topic=%s, data: %s: %s",
+                codec,
+                topic,
+                payload,
+                e,
+            )
+            return _DECODE_FAILED
+        self._codec_decode_metric.labels(codec).observe(time.perf_counter() - start)
+        return obj
+
+    def _send_to_mqtt(self, messages: Iterable[OutboundMessage]) -> dict[str, str]:
+        prefix = self._flask.config["MQTT_TOPIC_PREFIX"]
+        publish = self._mqtt.client.publish
+        should_publish = self._last_value_cache.should_publish
+        mark_published = self._last_value_cache.mark_published
+        debug = self._flask.logger.isEnabledFor(logging.DEBUG)
+        offline_queue = self._offline_queue
+        observe_payload_size = self._mqtt_published_payload_size_metric.observe
+        aliases = self._topic_aliases
+        mqtt_v5 = self._mqtt_v5
+        start = time.perf_counter()
+        failures = {}
+        count = 0
+        failed = 0
+        suppressed = 0
+        queued = 0
+        for topic, value, retain, qos, properties in messages:
+            if not should_publish(topic, value):
+                suppressed += 1
+                continue
+            # offline queue keeps only topic, payload and retain flag, so
+            # properties of queued messages are not sent
+            if offline_queue is not None and self._queue_if_offline(
+                prefix + topic, value, retain
+            ):
+                mark_published(topic, value)
+                queued += 1
+                continue
+            if debug:
+                self._flask.logger.debug(
+                    "Publish to topic '%s' retain %s qos %d: '%s'",
+                    prefix + topic,
+                    retain,
+                    qos,
+                    value,
+                )
+            try:
+                if aliases is not None:
+                    info = aliases.publish(
+                        publish, prefix + topic, value, qos, retain, properties
+                    )
+                elif mqtt_v5 and properties is not None:
+                    info = publish(
+                        prefix + topic,
+                        value,
+                        qos,
+                        retain,
+                        to_paho_properties(properties),
+                    )
+                else:
+                    info = publish(prefix + topic, value, qos, retain)
+                rc = info.rc
+            except Exception as e:
+                failures[topic] = str(e)
+                failed += 1
+                continue
+            observe_payload_size(_payload_size(value))
+            if rc == MQTT_ERR_SUCCESS:
+                count += 1
+            elif rc == MQTT_ERR_NO_CONN and qos == 0 and offline_queue is not None:
+                # connection lost after the check, paho queues only QoS > 0
+                offline_queue.put(prefix + topic, value, retain)
+                queued += 1
+            else:
+                failures[topic] = error_string(rc)
+                failed += 1
+                continue
+            # failed values are not recorded, so they are not suppressed later
+            mark_published(topic, value)
+        self._mqtt_publish_duration_metric.observe(time.perf_counter() - start)
+        self._mqtt_messages_sent_metric.inc(count)
+        if failed:
+            self._mqtt_messages_failed_metric.inc(failed)
+        if suppressed:
+            self._mqtt_messages_suppressed_metric.inc(suppressed)
+        if queued:
+            self._flask.logger.debug("%d values queued to offline queue", queued)
+        if failures:
+            self._flask.logger.warning(
+                "Failed to publish %d values to MQTT: %s", len(failures), failures
+            )
+        return failures
+
+    def _queue_if_offline(self, fulltopic: str, value: MqttValue, retain) -> bool:
+        with self._offline_queue_lock:
+            if self._mqtt.connected and not self._offline_queue_replaying:
+                return False
+            self._offline_queue.put(fulltopic, value, retain)
+            return True
+
+    def _start_offline_queue_replay(self) -> None:
+        with self._offline_queue_lock:
+            self._offline_queue_replaying = True
+            if self._offline_queue_thread and self._offline_queue_thread.is_alive():
+                return
+            self._offline_queue_stop.clear()
+            self._offline_queue_thread = threading.Thread(
+                target=self._replay_offline_queue,
+                name="mqtt-offline-queue-replay",
+                daemon=True,
+            )
+            self._offline_queue_thread.start()
+
+    def _replay_offline_queue(self) -> None:
+        qos = self._flask.config["MQTT_OFFLINE_QUEUE_QOS"]
+        publish = self._mqtt.client.publish
+        stop = self._offline_queue_stop
+        # sent but not yet acknowledged messages, never published twice
+        inflight: list[tuple[int, MQTTMessageInfo]] = []
+        # new publishes are queued until the queue is empty, so replay only
+        # ends when it is empty or the connection is gone
+        while True:
+            with self._offline_queue_lock:
+                if stop.is_set() or not self._mqtt.connected:
+                    # next connect starts a new replay
+                    self._offline_queue_thread = None
+                    left = len(self._offline_queue)
+                    break
+                after_id = inflight[-1][0] if inflight else 0
+                batch = self._offline_queue.peek(100 - len(inflight), after_id)
+                if not batch and not inflight:
+                    # new publishes go directly to broker from now on
+                    self._offline_queue_replaying = False
+                    self._offline_queue_thread = None
+                    return
+            for message_id, topic, payload, retain in batch:
+                info = publish(topic, payload, qos, retain)
+                if info.rc != MQTT_ERR_SUCCESS:
+                    break
+                inflight.append((message_id, info))
+            if not inflight:
+                self._flask.logger.warning(
+                    "Offline queue replay failed: %s, retrying in %d s",
+                    error_string(info.rc),
+                    OFFLINE_QUEUE_RETRY_DELAY,
+                )
+                stop.wait(OFFLINE_QUEUE_RETRY_DELAY)
+                continue
+            # messages are removed only when the broker has acknowledged them,
+            # which also keeps at most one batch in client memory
+            if not (acked := self._wait_for_acks(inflight)):
+                if self._mqtt.connected and not stop.is_set():
+                    self._flask.logger.warning(
+                        "Offline queue replay not acknowledged in %d s, "
+                        "still waiting",
+                        OFFLINE_QUEUE_ACK_TIMEOUT,
+                    )
+                continue
+            last_id = inflight[acked - 1][0]
+            del inflight[:acked]
+            self._offline_queue.remove(last_id)
+            self._trace_log("Replayed offline queue until message %d", last_id)
+        # unacknowledged messages stay queued and replay resumes from the first
+        # of them after reconnect
+        self._flask.logger.info(
+            "Offline queue replay interrupted, %d messages left", left
         )
-        with contextlib.suppress(Exception):
-            self._mqtt.publish(fulltopic, value, retain=retain)  # type: ignore
+
+    def _wait_for_acks(self, inflight: list[tuple[int, MQTTMessageInfo]]) -> int:
+        """Return how many messages from the start were acknowledged in order"""
+        deadline = time.monotonic() + OFFLINE_QUEUE_ACK_TIMEOUT
+        for acked, (_, info) in enumerate(inflight):
+            while not info.is_published():
+                remaining = deadline - time.monotonic()
+                if (
+                    remaining <= 0
+                    or self._offline_queue_stop.is_set()
+                    or not self._mqtt.connected
+                ):
+                    return acked
+                info.wait_for_publish(min(remaining, 1))
+        return len(inflight)
+
+    def _publish_status(self, status: str, qos=0) -> MQTTMessageInfo | None:
+        try:
+            info = self._mqtt.client.publish(
+                self._to_full_mqtt_topic_name(self.TOPIC_STATUS),
+                status,
+                qos=qos,
+                retain=True,
+            )
+        except Exception:
+            self._mqtt_messages_failed_metric.inc()
+            return None
+        if info.rc == MQTT_ERR_SUCCESS:
+            self._mqtt_messages_sent_metric.inc()
+        else:
+            self._mqtt_messages_failed_metric.inc()
+        return info
 
     def _mqtt_handle_connect(self, client, userdata, flags, rc) -> None:
-        self._publish_value_to_mqtt_topic(self.TOPIC_STATUS, "online", True)
+        if not self._count_reason_code("connect", rc):
+            return
+        if self._topic_aliases is not None and not self._host:
+            self._topic_aliases.reset(
+                getattr(self._mqtt.connect_properties, "TopicAliasMaximum", 0)
+            )
+        self._publish_status("online")
+        if self._offline_queue is not None:
+            self._start_offline_queue_replay()
         self._subscribe_to_mqtt_topic(self.TOPIC_UPDATE_NOW)
-        self._subscribe_to_mqtt_topic(self.TOPIC_SET_LOG_LEVEL)
+        self._subscribe_to_mqtt_topic(self.TOPIC_SET_LOG_LEVEL, shared=False)
+        if self._flask.config["CONFIG_RELOAD_ENABLED"]:
+            self._subscribe_to_mqtt_topic(self.TOPIC_RELOAD_CONFIG, shared=False)
+        if self._leader_election:
+            self._subscribe_to_mqtt_topic(self.TOPIC_LEADER, shared=False)
+            self._subscribe_to_mqtt_topic(self.TOPIC_STATUS, shared=False)
+            self._leader_election.connected()
         try:
-            self._app.subscribe_to_mqtt_topics()
+            self._call_app_nowait(self._app.subscribe_to_mqtt_topics)
         except Exception as e:
             self._flask.logger.exception(f"Error occurred: {e}")
+        for guest in self._guests:
+            guest._mqtt_handle_connect(client, userdata, flags, rc)
+
+    def _mqtt_handle_disconnect(self, rc) -> None:
+        self._flask.logger.info("Disconnected from MQTT broker: %s", rc)
+        if self._topic_aliases is not None:
+            # aliases of old connection must not be used before CONNACK
+            self._topic_aliases.reset(0)
+
+    def _count_reason_code(self, operation: str, rc) -> bool:
+        """Count reason code or MQTT v3 return code, return False on failure"""
+        self._mqtt_reason_codes_metric.labels(operation, str(rc)).inc()
+        if getattr(rc, "is_failure", rc != 0):
+            self._flask.logger.warning("MQTT %s failed: %s", operation, rc)
+            return False
+        return True
 
     def _mqtt_message_received(self, client, userdata, message) -> None:
+        if self._guests and (guests := self._guest_router.match(message.topic)):
+            for _, guest, _ in guests:
+                guest._mqtt_message_received(client, userdata, message)
+            return
         self._mqtt_messages_received_metric.inc()
-        data = str(message.payload.decode("utf-8"))
+        if stream := self._event_stream:
+            stream.record("received", message.topic, message.payload)
+        if store := self._value_store:
+            store.update(message.topic, message.payload, message.retain, "received")
+        received = time.monotonic()
+        prefix = self._flask.config["MQTT_TOPIC_PREFIX"]
+        if (
+            self._dispatcher
+            and message.topic.removeprefix(prefix) not in self._FRAMEWORK_TOPICS
+        ):
+            self._dispatcher.submit(
+                message.topic, self._handle_mqtt_message, message, received
+            )
+        else:
+            self._handle_mqtt_message(message, received)
+
+    def _handle_mqtt_message(self, message, received: float) -> None:
         self._flask.logger.debug(
-            f"MQTT message received: topic={message.topic}, "
-            f"qos={message.qos}, data: {data}"
+            "MQTT message received: topic=%s, qos=%s, data: %s",
+            message.topic,
+            message.qos,
+            message.payload,
         )
         topic = message.topic.removeprefix(self._flask.config["MQTT_TOPIC_PREFIX"])
+        matches = self._mqtt_router.match(topic)
+        # metrics are labelled by subscription filter to keep cardinality bounded
+        topic_filter = matches[0][0] if matches else ""
+        self._mqtt_received_payload_size_metric.labels(topic_filter).observe(
+            len(message.payload)
+        )
+        # handlers measure latency and count errors by their own filter, this
+        # catches errors before a handler is called
+        try:
+            self._dispatch_mqtt_message(topic, message.payload, matches, received)
+        except Exception as e:
+            self._mqtt_handler_errors_metric.labels(topic_filter).inc()
+            self._log_mqtt_message_exception(topic, message.payload, e)
+
+    def _dispatch_mqtt_message(
+        self,
+        topic: str,
+        payload: bytes,
+        matches: list[tuple[str, Any, list[str]]],
+        received: float,
+    ) -> None:
+        data = None
+        if topic in self._FRAMEWORK_TOPICS:
+            data = payload.decode("utf-8")
+            if self._handle_framework_mqtt_message(topic, data):
+                self._mqtt_message_latency_metric.labels(topic).observe(
+                    time.monotonic() - received
+                )
+                return
+        handled = False
+        decode_error = None
+        # payload is decoded only once per codec, even if several
+        # subscriptions match
+        decoded: dict[str, Any] = {}
+        for topic_filter, subscription, wildcards in matches:
+            if not subscription.callback:
+                continue
+            handled = True
+            if subscription.codec:
+                if subscription.codec not in decoded:
+                    decoded[subscription.codec] = self._decode_payload(
+                        subscription.codec, topic, payload
+                    )
+                obj = decoded[subscription.codec]
+                if obj is not _DECODE_FAILED:
+                    self._call_mqtt_subscription(
+                        subscription, topic_filter, topic, obj, wildcards, received
+                    )
+            elif subscription.raw:
+                self._call_mqtt_subscription(
+                    subscription, topic_filter, topic, payload, wildcards, received
+                )
+            else:
+                if data is None and decode_error is None:
+                    try:
+                        data = payload.decode("utf-8")
+                    except UnicodeDecodeError as e:
+                        decode_error = e
+                if decode_error is not None:
+                    self._mqtt_handler_errors_metric.labels(topic_filter).inc()
+                    self._log_mqtt_message_exception(topic, payload, decode_error)
+                    continue
+                self._call_mqtt_subscription(
+                    subscription, topic_filter, topic, data, wildcards, received
+                )
+        if not handled:
+            if data is None:
+                data = payload.decode("utf-8")
+            callback = self._app.mqtt_message_received
+            subscription = MqttSubscription(
+                callback, coroutine=inspect.iscoroutinefunction(callback)
+            )
+            topic_filter = matches[0][0] if matches else ""
+            self._call_mqtt_subscription(
+                subscription, topic_filter, topic, data, [], received
+            )
 
+    def _handle_framework_mqtt_message(self, topic: str, data: str) -> bool:
+        if topic == self.TOPIC_UPDATE_NOW and data.lower() in {"yes", "true", "1"}:
+            self._update_now()
+            return True
+        elif topic == self.TOPIC_SET_LOG_LEVEL and data.upper() in LOG_LEVELS:
+            self._flask.logger.setLevel(data.upper())
+            return True
+        elif (
+            topic == self.TOPIC_RELOAD_CONFIG
+            and self._flask.config["CONFIG_RELOAD_ENABLED"]
+        ):
+            self._reload_config(data)
+            return True
+        elif topic == self.TOPIC_LEADER and self._leader_election:
+            self._leader_election.handle_message(data)
+            return True
+        elif topic == self.TOPIC_STATUS and self._flask.config["CLUSTER_ENABLED"]:
+            # every replica registers offline will to the shared status topic,
+            # leader restores online status when another replica's will is sent
+            election = self._leader_election
+            if data == "offline" and election and election.is_leader:
+                self._publish_status("online")
+            return True
+        return False
+
+    def _call_mqtt_subscription(
+        self,
+        subscription: MqttSubscription,
+        topic_filter: str,
+        topic: str,
+        payload: Any,
+        wildcards: list[str],
+        received: float,
+    ) -> None:
+        args = (
+            (topic, payload, wildcards)
+            if subscription.with_wildcards
+            else (topic, payload)
+        )
+        start = time.perf_counter()
         try:
-            if topic == self.TOPIC_UPDATE_NOW and data.lower() in {"yes", "true", "1"}:
-                self._update_now()
-            elif topic == self.TOPIC_SET_LOG_LEVEL and data.upper() in {
-                "TRACE",
-                "DEBUG",
-                "INFO",
-                "WARNING",
-                "ERROR",
-                "CRITICAL",
-            }:
-                self._flask.logger.setLevel(data.upper())
+            if subscription.process:
+                future = self._get_process_pool().submit(subscription.callback, *args)
+            elif subscription.coroutine:
+                future = self._event_loop.submit(
+                    subscription.callback(*args), log_exceptions=False
+                )
             else:
-                if callback := self._mqtt_callbacks.get(topic):
-                    callback(topic, data)
-                else:
-                    self._app.mqtt_message_received(topic, data)
-        except Exception as e:
-            self._flask.logger.exception(
-                f"Error occurred while processing MQTT message, "
-                f"topic={topic}, data: {data}: {e}"
+                try:
+                    subscription.callback(*args)
+                finally:
+                    self._mqtt_handler_finished(topic_filter, start, received)
+                return
+            future.add_done_callback(
+                functools.partial(
+                    self._mqtt_subscription_done,
+                    subscription,
+                    topic_filter,
+                    topic,
+                    payload,
+                    start,
+                    received,
+                )
             )
+        except Exception as e:
+            self._mqtt_handler_errors_metric.labels(topic_filter).inc()
+            self._log_mqtt_message_exception(topic, payload, e)
+
+    def _mqtt_subscription_done(
+        self,
+        subscription: MqttSubscription,
+        topic_filter: str,
+        topic: str,
+        payload: Any,
+        start: float,
+        received: float,
+        future: Future,
+    ) -> None:
+        self._mqtt_handler_finished(topic_filter, start, received)
+        try:
+            result = future.result()
+            if subscription.process:
+                self._publish_process_result(result)
+        except Exception as e:
+            self._mqtt_handler_errors_metric.labels(topic_filter).inc()
+            self._log_mqtt_message_exception(topic, payload, e)
+
+    def _mqtt_handler_finished(
+        self, topic_filter: str, start: float, received: float
+    ) -> None:
+        self._mqtt_handler_duration_metric.labels(topic_filter).observe(
+            time.perf_counter() - start
+        )
+        self._mqtt_message_latency_metric.labels(topic_filter).observe(
+            time.monotonic() - received
+        )
+
+    def _log_mqtt_message_exception(
+        self, topic: str, payload: Any, e: Exception
+    ) -> None:
+        self._flask.logger.error(
+            "Error occurred while processing MQTT message, topic=%s, data: %s: %s",
+            topic,
+            payload,
+            e,
+            exc_info=e,
+        )
 
     ###########################################################
     # Public methods
@@ -457,6 +2418,26 @@ class Framework:
             self._do_wait()
         return 0
 
+    def add_app(self, app: App, config: Config) -> None:
+        """
+        Add app to be run in the same process. Added apps share MQTT connection,
+        scheduler and web server of the main app, but have own topic prefix,
+        status topic, URLs under /<app name>/ and metrics labelled by app.
+        Settings of added apps are read from env vars CFG_<APP NAME>_<SETTING>,
+        MQTT connection and web server settings come from the main app config
+
+        :param app: The application to add
+        :param config: The configuration of the added app
+        """
+        with self._lock:
+            if self._started or self._host:
+                raise RuntimeError("Apps can be added only to main app before start")
+            name = getattr(config, "app_name", "") or app.__class__.__name__
+            if any(guest._name == name for guest in self._guests):
+                raise ValueError(f"App {name} already added")
+            self._guests.append(Framework(host=self, name=name))
+            self._guest_apps.append((app, config))
+
     def shutdown(self) -> None:
         """
         Stop the application
@@ -470,5 +2451,6 @@ class Framework:
                 except Exception as e:
                     self._flask.logger.exception(f"Error occurred: {e}")
                 self._flask.logger.critical("Application stopped")
+                self._stopped.set()
             else:
                 self._flask.logger.debug("Application already stopped")
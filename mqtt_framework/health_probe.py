@@ -0,0 +1,93 @@
+import logging
+import threading
+import time
+from typing import Callable, NamedTuple
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+
+
+class HealthStatus(NamedTuple):
+    """
+    Result of the latest health check. healthy and age are None until the
+    first check is done, last failure is kept until next failure
+    """
+
+    healthy: bool | None
+    age: float | None
+    duration: float | None
+    last_failure: str | None
+    last_failure_time: float | None
+
+
+class HealthProbe:
+    """
+    Runs app health check when scheduled and caches the result, so that
+    health endpoints can answer without calling the app
+    """
+
+    def __init__(
+        self,
+        check: Callable[[], bool],
+        registry: CollectorRegistry,
+        logger: logging.Logger,
+    ) -> None:
+        self._check = check
+        self._logger = logger
+        self._lock = threading.Lock()
+        self._healthy: bool | None = None
+        self._checked: float | None = None
+        self._duration: float | None = None
+        self._last_failure: str | None = None
+        self._last_failure_time: float | None = None
+        self._duration_metric = Histogram(
+            "health_check_duration_seconds",
+            "Time spent in app health check",
+            registry=registry,
+        )
+        self._failures_metric = Counter(
+            "health_check_failures",
+            "How many health checks failed",
+            registry=registry,
+        )
+        healthy_metric = Gauge(
+            "health_check_healthy",
+            "1 if the latest health check succeeded",
+            registry=registry,
+        )
+        healthy_metric.set_function(lambda: bool(self._healthy))
+
+    def run(self) -> bool:
+        """Run health check and cache the result"""
+        start = time.perf_counter()
+        try:
+            healthy = bool(self._check())
+            failure = None if healthy else "Health check returned false"
+        except Exception as e:
+            healthy = False
+            failure = f"{e.__class__.__name__}: {e}"
+        duration = time.perf_counter() - start
+        self._duration_metric.observe(duration)
+        with self._lock:
+            if not healthy:
+                self._failures_metric.inc()
+                self._last_failure = failure
+                self._last_failure_time = time.time()
+            if healthy != self._healthy:
+                if healthy:
+                    self._logger.info("Health check OK")
+                else:
+                    self._logger.warning("Health check FAIL: %s", failure)
+            self._healthy = healthy
+            self._checked = time.monotonic()
+            self._duration = duration
+        return healthy
+
+    def status(self) -> HealthStatus:
+        with self._lock:
+            return HealthStatus(
+                self._healthy,
+                None if self._checked is None else time.monotonic() - self._checked,
+                self._duration,
+                self._last_failure,
+                self._last_failure_time,
+            )
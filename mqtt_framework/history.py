@@ -0,0 +1,226 @@
+import array
+import bisect
+import math
+import threading
+import time
+from typing import NamedTuple
+
+from prometheus_client import CollectorRegistry, Counter, Gauge
+
+# tier name, bucket length in seconds (0 = raw values)
+TIERS = (("raw", 0), ("minute", 60), ("hour", 3600))
+ITEM_SIZE = array.array("d").itemsize
+
+
+class Series(NamedTuple):
+    """
+    Values of a tier in time order. Raw tier has only value column,
+    downsampled tiers have min, max and avg of each bucket, time is the
+    bucket start
+    """
+
+    resolution: str
+    columns: dict[str, list[float]]
+
+
+class _Ring:
+    """Fixed size ring buffer of float columns, the first column is time"""
+
+    def __init__(self, columns: tuple[str, ...], size: int) -> None:
+        self.columns = columns
+        self._size = size
+        self._data = [array.array("d", bytes(size * ITEM_SIZE)) for _ in columns]
+        self._next = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int) -> float:
+        # time of index:th oldest item, makes ring searchable with bisect
+        return self._data[0][(self._next - self._count + index) % self._size]
+
+    def append(self, *values: float) -> None:
+        for column, value in zip(self._data, values):
+            column[self._next] = value
+        self._next = (self._next + 1) % self._size
+        self._count = min(self._count + 1, self._size)
+
+    def select(self, start: float, end: float) -> dict[str, list[float]]:
+        """Items with start <= time < end"""
+        first = bisect.bisect_left(self, start)
+        last = bisect.bisect_left(self, end, first)
+        begin = (self._next - self._count + first) % self._size
+        stop = begin + last - first
+        result = {}
+        for name, column in zip(self.columns, self._data):
+            if stop <= self._size:
+                result[name] = column[begin:stop].tolist()
+            else:
+                result[name] = (column[begin:] + column[: stop - self._size]).tolist()
+        return result
+
+    @property
+    def oldest(self) -> float | None:
+        return self[0] if self._count else None
+
+    @property
+    def full(self) -> bool:
+        return self._count == self._size
+
+    @staticmethod
+    def memory(columns: int, size: int) -> int:
+        return columns * size * ITEM_SIZE
+
+
+class _Bucket:
+    __slots__ = ("start", "min", "max", "sum", "count")
+
+    def __init__(self, start: float, value: float) -> None:
+        self.start = start
+        self.min = self.max = self.sum = value
+        self.count = 1
+
+    def add(self, value: float) -> None:
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.sum += value
+        self.count += 1
+
+
+class _TopicHistory:
+    def __init__(self, sizes: dict[str, int]) -> None:
+        self.raw = _Ring(("time", "value"), sizes["raw"])
+        self.tiers = {
+            name: (length, _Ring(("time", "min", "max", "avg"), sizes[name]))
+            for name, length in TIERS[1:]
+        }
+        # buckets being filled, added to rings when next bucket starts
+        self.buckets: dict[str, _Bucket] = {}
+
+    def add(self, timestamp: float, value: float) -> None:
+        self.raw.append(timestamp, value)
+        for name, (length, ring) in self.tiers.items():
+            start = timestamp - timestamp % length
+            bucket = self.buckets.get(name)
+            if bucket is not None and bucket.start == start:
+                bucket.add(value)
+                continue
+            if bucket is not None:
+                ring.append(
+                    bucket.start, bucket.min, bucket.max, bucket.sum / bucket.count
+                )
+            self.buckets[name] = _Bucket(start, value)
+
+    def select(self, resolution: str, start: float, end: float) -> Series:
+        if resolution == "raw":
+            return Series(resolution, self.raw.select(start, end))
+        _, ring = self.tiers[resolution]
+        columns = ring.select(start, end)
+        # partially filled bucket is returned too
+        bucket = self.buckets.get(resolution)
+        if bucket is not None and start <= bucket.start < end:
+            for name, value in zip(
+                ring.columns,
+                (bucket.start, bucket.min, bucket.max, bucket.sum / bucket.count),
+            ):
+                columns[name].append(value)
+        return Series(resolution, columns)
+
+    def finest_resolution(self, start: float) -> str:
+        """Finest tier which still has values from start"""
+        rings = [("raw", self.raw)]
+        rings += [(name, ring) for name, (_, ring) in self.tiers.items()]
+        for name, ring in rings:
+            # older values have been dropped only when ring is full
+            if not ring.full or ring.oldest <= start:
+                return name
+        return rings[-1][0]
+
+
+class History:
+    """
+    Recent numeric values of published topics.
+
+    Each topic has fixed size ring buffers of raw values, and of min, max and
+    avg per minute and per hour, stored in arrays of floats. Buffers are
+    allocated in full when a topic is first seen, so memory use is known in
+    advance: new topics are not recorded when they would not fit in
+    max_memory bytes. Raise ValueError if a tier size is not positive.
+    """
+
+    def __init__(
+        self, sizes: dict[str, int], max_memory: int, registry: CollectorRegistry
+    ) -> None:
+        for name, _ in TIERS:
+            if sizes[name] < 1:
+                raise ValueError(f"History size of {name} tier must be positive")
+        self._sizes = sizes
+        self._topic_memory = _Ring.memory(2, sizes["raw"]) + sum(
+            _Ring.memory(4, sizes[name]) for name, _ in TIERS[1:]
+        )
+        self._max_topics = max_memory // self._topic_memory
+        self._lock = threading.Lock()
+        self._topics: dict[str, _TopicHistory] = {}
+        topics_metric = Gauge(
+            "history_topics",
+            "Number of topics in value history",
+            registry=registry,
+        )
+        topics_metric.set_function(lambda: len(self._topics))
+        memory_metric = Gauge(
+            "history_memory_bytes",
+            "Memory allocated for value history buffers",
+            registry=registry,
+        )
+        memory_metric.set_function(lambda: len(self._topics) * self._topic_memory)
+        self._rejected_metric = Counter(
+            "history_rejected",
+            "How many values of new topics not recorded because memory was full",
+            registry=registry,
+        )
+
+    def record(self, topic: str, value: object) -> None:
+        """Record value if it is a number, other values are ignored"""
+        if (
+            isinstance(value, bool)
+            or not isinstance(value, (int, float))
+            or not math.isfinite(value)
+        ):
+            return
+        timestamp = time.time()
+        with self._lock:
+            if (history := self._topics.get(topic)) is None:
+                if len(self._topics) >= self._max_topics:
+                    self._rejected_metric.inc()
+                    return
+                history = self._topics[topic] = _TopicHistory(self._sizes)
+            history.add(timestamp, float(value))
+
+    def topics(self) -> list[str]:
+        with self._lock:
+            return sorted(self._topics)
+
+    def query(
+        self,
+        topic: str,
+        start: float | None = None,
+        end: float | None = None,
+        resolution: str | None = None,
+    ) -> Series | None:
+        """
+        Return values of topic between start and end. Resolution defaults to
+        the finest tier covering start. Return None if topic is not recorded,
+        raise ValueError if resolution is unknown
+        """
+        if resolution is not None and resolution not in dict(TIERS):
+            raise ValueError(f"Unknown resolution {resolution}")
+        end = math.inf if end is None else end
+        with self._lock:
+            if (history := self._topics.get(topic)) is None:
+                return None
+            if start is None:
+                start = -math.inf
+            if resolution is None:
+                resolution = history.finest_resolution(start)
+            return history.select(resolution, start, end)
@@ -0,0 +1,154 @@
+import json
+import logging
+import threading
+import time
+from typing import Callable
+
+from prometheus_client import CollectorRegistry, Counter, Gauge
+
+
+class LeaderElection:
+    """
+    Lease based leader election over a retained MQTT topic.
+
+    Leader refreshes the lease by publishing its node id every lease_interval
+    seconds. Other nodes take over when the lease is not refreshed in
+    lease_timeout seconds, and leader steps down if it does not receive its
+    own lease back in that time, e.g. when disconnected. The latest lease
+    message on the topic wins, so simultaneous claims are resolved by the
+    order in which the broker delivers them. Leader releases the lease on
+    stop by clearing the retained message, so other nodes take over at once.
+    """
+
+    def __init__(
+        self,
+        node_id: str,
+        publish: Callable[[bytes], None],
+        lease_interval: float,
+        lease_timeout: float,
+        on_change: Callable[[bool], None],
+        registry: CollectorRegistry,
+        logger: logging.Logger,
+    ) -> None:
+        self._node_id = node_id
+        self._publish = publish
+        self._lease_interval = lease_interval
+        self._lease_timeout = lease_timeout
+        self._on_change = on_change
+        self._logger = logger
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._running = False
+        self._is_leader = False
+        self._leader: str | None = None
+        self._last_seen = 0.0
+        self._connected_at: float | None = None
+        self._thread = threading.Thread(
+            target=self._run, name="leader-election", daemon=True
+        )
+        self._leader_metric = Gauge(
+            "cluster_leader",
+            "1 if this node is the leader of the cluster",
+            registry=registry,
+        )
+        self._leader_metric.set_function(lambda: self._is_leader)
+        self._leader_changes_metric = Counter(
+            "cluster_leader_changes",
+            "How many times this node became leader or lost leadership",
+            registry=registry,
+        )
+
+    @property
+    def node_id(self) -> str:
+        return self._node_id
+
+    @property
+    def is_leader(self) -> bool:
+        return self._is_leader
+
+    def start(self) -> None:
+        self._running = True
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop and release the lease if this node is the leader"""
+        self._running = False
+        self._wakeup.set()
+        self._thread.join()
+        with self._lock:
+            release = self._leader == self._node_id
+            changed = self._set_leader(False)
+        if changed:
+            self._on_change(False)
+        if release:
+            self._logger.info("Releasing cluster leadership")
+            self._publish(b"")
+
+    def connected(self) -> None:
+        """
+        Call after lease topic is subscribed. Retained lease of the current
+        leader arrives then, so claiming is delayed by lease_interval
+        """
+        with self._lock:
+            self._connected_at = time.monotonic()
+
+    def handle_message(self, payload: str) -> None:
+        """Handle message received from lease topic"""
+        try:
+            leader = json.loads(payload)["node"] if payload else None
+        except (ValueError, TypeError, KeyError) as e:
+            self._logger.warning("Invalid cluster lease %s: %s", payload, e)
+            return
+        with self._lock:
+            self._leader = leader
+            self._last_seen = time.monotonic()
+            changed = self._set_leader(leader == self._node_id)
+        if changed:
+            self._on_change(leader == self._node_id)
+        if leader is None:
+            # lease released, take over without waiting it to expire
+            self._wakeup.set()
+
+    def _run(self) -> None:
+        while self._running:
+            self._wakeup.wait(self._lease_interval)
+            self._wakeup.clear()
+            if self._running:
+                self._tick()
+
+    def _tick(self) -> None:
+        now = time.monotonic()
+        changed = False
+        with self._lock:
+            if self._connected_at is None:
+                return
+            expired = now - self._last_seen > self._lease_timeout
+            if self._leader == self._node_id:
+                if expired:
+                    self._logger.warning("Cluster lease not refreshed in time")
+                    changed = self._set_leader(False)
+                publish = True
+            elif self._leader is None:
+                publish = now - self._connected_at >= self._lease_interval
+            else:
+                publish = expired
+        if changed:
+            self._on_change(False)
+        if publish:
+            try:
+                self._publish(json.dumps({"node": self._node_id}).encode())
+            except Exception as e:
+                self._logger.warning("Failed to publish cluster lease: %s", e)
+
+    def _set_leader(self, is_leader: bool) -> bool:
+        """Update leader state, return True if it changed"""
+        if is_leader == self._is_leader:
+            return False
+        self._is_leader = is_leader
+        self._leader_changes_metric.inc()
+        self._logger.info(
+            "Node %s %s cluster leader",
+            self._node_id,
+            "became" if is_leader else "is no longer",
+        )
+        return True
@@ -0,0 +1,73 @@
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Mapping
+
+from prometheus_client import CollectorRegistry
+from prometheus_client.exposition import choose_encoder
+
+
+class MetricsServer:
+    """
+    Minimal HTTP server for headless mode, serves only Prometheus metrics
+    (/metrics) and health checks, which return JSON text and HTTP status.
+    Based on standard library, so web framework and WSGI server are not
+    needed.
+    """
+
+    def __init__(
+        self,
+        port: int,
+        registry: CollectorRegistry,
+        health_checks: Mapping[str, Callable[[], tuple[str, int]]],
+        logger: logging.Logger,
+    ) -> None:
+        self._logger = logger
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                path = self.path.split("?")[0]
+                if path == "/metrics":
+                    encoder, content_type = choose_encoder(self.headers.get("Accept"))
+                    self._send(200, encoder(registry), content_type)
+                elif check := health_checks.get(path):
+                    try:
+                        text, status = check()
+                    except Exception as e:
+                        server._logger.exception("Health check failed: %s", e)
+                        text, status = '{"status": "FAIL"}', 500
+                    self._send(status, text.encode(), "application/json")
+                else:
+                    self._send(404, b"Not Found", "text/plain; charset=utf-8")
+
+            def _send(self, status: int, body: bytes, content_type: str) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args) -> None:
+                server._logger.debug("Metrics server: " + format, *args)
+
+        self._httpd = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever,
+            args=(0.1,),
+            name="metrics-server",
+            daemon=True,
+        )
+
+    @property
+    def port(self) -> int:
+        return self._httpd.server_address[1]
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
@@ -0,0 +1,33 @@
+import warnings
+
+from flask_mqtt import Mqtt
+from paho.mqtt.client import CallbackAPIVersion, Client
+from paho.mqtt.properties import Properties
+
+
+class MqttClient(Mqtt):
+    """
+    Flask-MQTT extension using paho callback API version 2, which gives
+    reason codes and MQTT v5 properties to callbacks. Connect and disconnect
+    handlers are called with reason code in place of the return code.
+    """
+
+    def __init__(self) -> None:
+        with warnings.catch_warnings():
+            # client created by Flask-MQTT with deprecated API is replaced
+            warnings.simplefilter("ignore", DeprecationWarning)
+            super().__init__()
+        self.client = Client(CallbackAPIVersion.VERSION2)
+        # properties of the latest CONNACK, None with MQTT v3.1.1
+        self.connect_properties: Properties | None = None
+
+    def _handle_connect(
+        self, client, userdata, flags, reason_code, properties=None
+    ) -> None:
+        self.connect_properties = properties
+        super()._handle_connect(client, userdata, flags, reason_code)
+
+    def _handle_disconnect(
+        self, client, userdata, flags, reason_code=None, properties=None
+    ) -> None:
+        super()._handle_disconnect(client, userdata, reason_code)
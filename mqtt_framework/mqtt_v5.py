@@ -0,0 +1,135 @@
+import threading
+from typing import Callable, Mapping, NamedTuple
+
+from paho.mqtt.client import MQTT_ERR_SUCCESS, MQTTMessageInfo
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+from prometheus_client import CollectorRegistry, Counter, Gauge
+
+# topic is given an alias when it is published this many times
+ALIAS_AFTER_PUBLISHES = 2
+# limit for topics counted but not yet aliased, counts are cleared when full
+MAX_COUNTED_TOPICS = 10000
+# topic alias property takes identifier byte and two byte value
+ALIAS_PROPERTY_SIZE = 3
+
+
+class PublishProperties(NamedTuple):
+    """
+    MQTT v5 properties of a published message. Ignored with MQTT v3.1.1.
+
+    :param expiry: Message expiry interval in seconds. Broker discards the
+                   message if it is not delivered to a subscriber in time
+    :param user_properties: Name value pairs delivered to subscribers
+    """
+
+    expiry: int | None = None
+    user_properties: Mapping[str, str] | None = None
+
+
+def to_paho_properties(
+    properties: PublishProperties | None, alias: int | None = None
+) -> Properties | None:
+    if properties is None and alias is None:
+        return None
+    result = Properties(PacketTypes.PUBLISH)
+    if properties is not None:
+        if properties.expiry is not None:
+            result.MessageExpiryInterval = properties.expiry
+        if properties.user_properties:
+            result.UserProperty = list(properties.user_properties.items())
+    if alias is not None:
+        result.TopicAlias = alias
+    return result
+
+
+class TopicAliases:
+    """
+    Assigns MQTT v5 topic aliases to frequently published topics.
+
+    Topic gets an alias on its second publish while free aliases are left,
+    unless the topic is not longer than the alias property.
+    First message with the alias carries also the topic name, later messages
+    only the alias. Aliases are valid per connection, so they are cleared on
+    disconnect and the number of aliases is limited by the broker in CONNACK.
+    Only QoS 0 messages use aliases, because QoS > 0 messages may be resent
+    on a new connection where the alias is unknown.
+    """
+
+    def __init__(self, maximum: int, registry: CollectorRegistry) -> None:
+        self._maximum = maximum
+        self._limit = 0
+        self._lock = threading.Lock()
+        self._aliases: dict[str, int] = {}
+        self._sent: set[str] = set()
+        self._counts: dict[str, int] = {}
+        self._aliases_metric = Gauge(
+            "mqtt_topic_aliases",
+            "Number of topic aliases in use",
+            registry=registry,
+        )
+        self._aliases_metric.set_function(lambda: len(self._aliases))
+        self._bytes_saved_metric = Counter(
+            "mqtt_topic_alias_bytes_saved",
+            "Bytes of topic names not sent because of topic aliases",
+            registry=registry,
+        )
+
+    def reset(self, broker_maximum: int) -> None:
+        """Clear aliases, call on connect with broker topic alias maximum"""
+        with self._lock:
+            self._limit = min(self._maximum, broker_maximum)
+            self._aliases.clear()
+            self._sent.clear()
+            self._counts.clear()
+
+    def publish(
+        self,
+        publish: Callable[..., MQTTMessageInfo],
+        topic: str,
+        payload: str | bytes | bytearray | int | float,
+        qos: int,
+        retain: bool,
+        properties: PublishProperties | None,
+    ) -> MQTTMessageInfo:
+        """Publish with client publish function using alias when possible"""
+        if qos:
+            return publish(topic, payload, qos, retain, to_paho_properties(properties))
+        with self._lock:
+            if (alias := self._aliases.get(topic)) is None:
+                alias = self._assign(topic)
+            if alias is None:
+                return publish(
+                    topic, payload, qos, retain, to_paho_properties(properties)
+                )
+            # publish while locked, so that the message carrying topic name
+            # is queued before messages carrying only the alias
+            sent = topic in self._sent
+            info = publish(
+                "" if sent else topic,
+                payload,
+                qos,
+                retain,
+                to_paho_properties(properties, alias),
+            )
+            if info.rc == MQTT_ERR_SUCCESS:
+                if sent:
+                    self._bytes_saved_metric.inc(
+                        len(topic.encode()) - ALIAS_PROPERTY_SIZE
+                    )
+                else:
+                    self._sent.add(topic)
+            return info
+
+    def _assign(self, topic: str) -> int | None:
+        if len(self._aliases) >= self._limit or len(topic) <= ALIAS_PROPERTY_SIZE:
+            return None
+        count = self._counts.get(topic, 0) + 1
+        if count < ALIAS_AFTER_PUBLISHES:
+            if len(self._counts) >= MAX_COUNTED_TOPICS:
+                self._counts.clear()
+            self._counts[topic] = count
+            return None
+        self._counts.pop(topic, None)
+        alias = self._aliases[topic] = len(self._aliases) + 1
+        return alias
@@ -0,0 +1,139 @@
+import logging
+import sqlite3
+import threading
+
+from prometheus_client import CollectorRegistry, Counter, Gauge
+
+from mqtt_framework.callbacks import MqttValue
+
+DROP_OLDEST = "oldest"
+DROP_NEWEST = "newest"
+
+
+def _to_bytes(value: MqttValue | None) -> bytes:
+    if value is None:
+        return b""
+    if isinstance(value, str):
+        return value.encode("utf-8")
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    return str(value).encode("ascii")
+
+
+class OfflineQueue:
+    """
+    Persistent FIFO queue for MQTT messages published while the broker is
+    unreachable. Messages are stored in a SQLite database in WAL mode, so only
+    the batch being replayed is kept in memory and queue survives restarts.
+
+    :param path: SQLite database file
+    :param max_size: Maximum number of queued messages
+    :param drop_policy: Which message to drop when queue is full, "oldest" or
+                        "newest" (the message being queued)
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_size: int,
+        drop_policy: str,
+        registry: CollectorRegistry,
+        logger: logging.Logger,
+    ) -> None:
+        if drop_policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Invalid drop policy: {drop_policy}")
+        self._max_size = max_size
+        self._drop_policy = drop_policy
+        self._logger = logger
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "topic TEXT NOT NULL, "
+            "payload BLOB NOT NULL, "
+            "retain INTEGER NOT NULL)"
+        )
+        (self._size,) = self._db.execute("SELECT COUNT(*) FROM messages").fetchone()
+        self._queued_metric = Counter(
+            "mqtt_offline_queue_queued",
+            "How many MQTT messages queued while broker was unreachable",
+            registry=registry,
+        )
+        self._replayed_metric = Counter(
+            "mqtt_offline_queue_replayed",
+            "How many queued MQTT messages sent after reconnect",
+            registry=registry,
+        )
+        self._dropped_metric = Counter(
+            "mqtt_offline_queue_dropped",
+            "How many queued MQTT messages dropped because queue was full",
+            registry=registry,
+        )
+        self._size_metric = Gauge(
+            "mqtt_offline_queue_size",
+            "Number of MQTT messages in offline queue",
+            registry=registry,
+        )
+        self._size_metric.set_function(lambda: self._size)
+
+    def put(self, topic: str, value: MqttValue | None, retain=False) -> bool:
+        """Queue message for full topic name. Return False if message was dropped"""
+        payload = _to_bytes(value)
+        with self._lock:
+            if self._size >= self._max_size:
+                if self._drop_policy == DROP_NEWEST:
+                    self._dropped_metric.inc()
+                    self._logger.warning("Offline queue full, message dropped")
+                    return False
+                dropped = self._db.execute(
+                    "DELETE FROM messages WHERE id IN "
+                    "(SELECT id FROM messages ORDER BY id LIMIT ?)",
+                    (self._size - self._max_size + 1,),
+                ).rowcount
+                self._size -= dropped
+                self._dropped_metric.inc(dropped)
+                self._logger.warning(
+                    "Offline queue full, %d oldest messages dropped", dropped
+                )
+            self._db.execute(
+                "INSERT INTO messages (topic, payload, retain) VALUES (?, ?, ?)",
+                (topic, payload, int(retain)),
+            )
+            self._size += 1
+        self._queued_metric.inc()
+        return True
+
+    def peek(self, limit: int, after_id=0) -> list[tuple[int, str, bytes, bool]]:
+        """
+        Return up to limit oldest messages as (id, topic, payload, retain),
+        starting after message after_id
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, topic, payload, retain FROM messages WHERE id > ? "
+                "ORDER BY id LIMIT ?",
+                (after_id, limit),
+            ).fetchall()
+        return [
+            (message_id, topic, payload, bool(retain))
+            for message_id, topic, payload, retain in rows
+        ]
+
+    def remove(self, last_id: int) -> None:
+        """Remove replayed messages up to and including last_id"""
+        with self._lock:
+            removed = self._db.execute(
+                "DELETE FROM messages WHERE id <= ?", (last_id,)
+            ).rowcount
+            self._size -= removed
+        self._replayed_metric.inc(removed)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def __len__(self) -> int:
+        return self._size
@@ -0,0 +1,106 @@
+import json
+import threading
+from typing import Any, Callable, Protocol, runtime_checkable
+
+
+@runtime_checkable
+class PayloadCodec(Protocol):
+    """
+    Encodes objects to MQTT payloads and decodes payloads back to objects.
+    Implement and register with register_codec to add own formats.
+    """
+
+    name: str
+
+    def encode(self, obj: Any) -> bytes:
+        """Encode object to payload"""
+        ...
+
+    def decode(self, payload: bytes) -> Any:
+        """Decode payload to object"""
+        ...
+
+
+class JsonCodec:
+    """JSON codec based on standard library"""
+
+    name = "json"
+
+    def __init__(self) -> None:
+        self._encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False)
+
+    def encode(self, obj: Any) -> bytes:
+        return self._encoder.encode(obj).encode("utf-8")
+
+    def decode(self, payload: bytes) -> Any:
+        return json.loads(payload)
+
+
+class OrjsonCodec:
+    """JSON codec based on orjson, requires orjson package"""
+
+    name = "orjson"
+
+    def __init__(self) -> None:
+        import orjson
+
+        self.encode = orjson.dumps
+        self.decode = orjson.loads
+
+
+class MsgpackCodec:
+    """MessagePack codec, requires msgpack package"""
+
+    name = "msgpack"
+
+    def __init__(self) -> None:
+        import msgpack
+
+        self._packer = msgpack.Packer(use_bin_type=True)
+        self._msgpack = msgpack
+        self._lock = threading.Lock()
+
+    def encode(self, obj: Any) -> bytes:
+        # Packer is not thread safe, but faster than packb when reused
+        with self._lock:
+            return self._packer.pack(obj)
+
+    def decode(self, payload: bytes) -> Any:
+        return self._msgpack.unpackb(payload, raw=False)
+
+
+# codecs are created on first use, so optional packages are imported only
+# when the codec is needed
+_factories: dict[str, Callable[[], PayloadCodec]] = {
+    JsonCodec.name: JsonCodec,
+    OrjsonCodec.name: OrjsonCodec,
+    MsgpackCodec.name: MsgpackCodec,
+}
+_codecs: dict[str, PayloadCodec] = {}
+_lock = threading.Lock()
+
+
+def register_codec(name: str, factory: Callable[[], PayloadCodec]) -> None:
+    """Register codec factory by name, replaces existing codec with same name"""
+    with _lock:
+        _factories[name] = factory
+        _codecs.pop(name, None)
+
+
+def get_codec(name: str) -> PayloadCodec:
+    """
+    Get codec by name. Raise ValueError if codec is unknown or its optional
+    package is not installed
+    """
+    if (codec := _codecs.get(name)) is not None:
+        return codec
+    with _lock:
+        if (codec := _codecs.get(name)) is not None:
+            return codec
+        if (factory := _factories.get(name)) is None:
+            raise ValueError(f"Unknown payload codec: {name}")
+        try:
+            codec = _codecs[name] = factory()
+        except ImportError as e:
+            raise ValueError(f"Payload codec {name} is not available: {e}") from e
+        return codec
@@ -0,0 +1,129 @@
+import concurrent.futures
+import multiprocessing
+import threading
+from typing import Callable
+
+from prometheus_client import CollectorRegistry
+from prometheus_client.metrics_core import Metric
+
+# (metric name, type, documentation, sample name, labels)
+_SampleKey = tuple[str, str, str, str, tuple[tuple[str, str], ...]]
+
+# metric types whose samples only grow and can be summed over processes
+_CUMULATIVE_TYPES = {"counter", "histogram", "summary"}
+
+_worker_registry: CollectorRegistry | None = None
+
+
+def get_worker_metrics_registry() -> CollectorRegistry:
+    """
+    Provide Prometheus metrics registry for custom metrics in functions run in
+    the process pool. Changes are sent to the main process after each call and
+    merged to the framework registry
+    """
+    global _worker_registry
+    if _worker_registry is None:
+        _worker_registry = CollectorRegistry()
+    return _worker_registry
+
+
+def _snapshot() -> dict[_SampleKey, float]:
+    samples = {}
+    if _worker_registry is None:
+        return samples
+    for metric in _worker_registry.collect():
+        for sample in metric.samples:
+            if sample.name.endswith("_created"):
+                continue
+            labels = tuple(sorted(sample.labels.items()))
+            key = (metric.name, metric.type, metric.documentation, sample.name, labels)
+            samples[key] = sample.value
+    return samples
+
+
+def _metric_changes(before: dict[_SampleKey, float]) -> list[tuple[_SampleKey, float]]:
+    changes = []
+    for key, value in _snapshot().items():
+        if key[1] in _CUMULATIVE_TYPES:
+            if delta := value - before.get(key, 0):
+                changes.append((key, delta))
+        else:
+            changes.append((key, value))
+    return changes
+
+
+def _run_in_worker(func: Callable, args: tuple) -> tuple:
+    before = _snapshot()
+    try:
+        result = func(*args)
+    except Exception as e:
+        return False, e, _metric_changes(before)
+    return True, result, _metric_changes(before)
+
+
+class WorkerMetricsCollector:
+    """Prometheus collector for metrics reported by worker processes"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._values: dict[_SampleKey, float] = {}
+
+    def update(self, changes: list[tuple[_SampleKey, float]]) -> None:
+        with self._lock:
+            for key, value in changes:
+                if key[1] in _CUMULATIVE_TYPES:
+                    self._values[key] = self._values.get(key, 0) + value
+                else:
+                    self._values[key] = value
+
+    def collect(self):
+        metrics: dict[tuple[str, str, str], Metric] = {}
+        with self._lock:
+            for (name, typ, doc, sample_name, labels), value in self._values.items():
+                if (metric := metrics.get((name, typ, doc))) is None:
+                    metric = metrics[(name, typ, doc)] = Metric(name, doc, typ)
+                metric.add_sample(sample_name, dict(labels), value)
+        return list(metrics.values())
+
+
+class ProcessPool:
+    """
+    Process pool for CPU bound work. Worker processes are started with spawn
+    method, so functions and arguments must be picklable, e.g. module level
+    functions.
+    """
+
+    def __init__(self, workers: int, registry: CollectorRegistry) -> None:
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        self._metrics_collector = WorkerMetricsCollector()
+        registry.register(self._metrics_collector)
+
+    def submit(self, func: Callable, *args) -> concurrent.futures.Future:
+        """Run func(*args) in a worker process"""
+        future = concurrent.futures.Future()
+        worker_future = self._executor.submit(_run_in_worker, func, args)
+        worker_future.add_done_callback(lambda f: self._set_result(f, future))
+        return future
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _set_result(
+        self,
+        worker_future: concurrent.futures.Future,
+        future: concurrent.futures.Future,
+    ) -> None:
+        if worker_future.cancelled():
+            future.cancel()
+            return
+        if e := worker_future.exception():
+            future.set_exception(e)
+            return
+        ok, result, changes = worker_future.result()
+        self._metrics_collector.update(changes)
+        if ok:
+            future.set_result(result)
+        else:
+            future.set_exception(result)
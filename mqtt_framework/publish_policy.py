@@ -0,0 +1,111 @@
+import threading
+import time
+
+from mqtt_framework.topic_router import TopicRouter
+
+
+class PublishPolicy:
+    """
+    Rules to suppress unnecessary publishes of a topic.
+
+    :param only_on_change: Publish only if value differs from the last published
+    :param deadband: Numeric values are considered changed only if they differ
+                     more than deadband from the last published value
+    :param min_interval: Minimum time in seconds between publishes
+    :param heartbeat: Publish even unchanged value if last publish is older
+                      than heartbeat seconds. 0 = disabled
+    """
+
+    def __init__(
+        self,
+        only_on_change=True,
+        deadband: float = 0,
+        min_interval: float = 0,
+        heartbeat: float = 0,
+    ) -> None:
+        self.only_on_change = only_on_change
+        self.deadband = deadband
+        self.min_interval = min_interval
+        self.heartbeat = heartbeat
+
+    def is_changed(self, old, new) -> bool:
+        if self.deadband and _is_number(old) and _is_number(new):
+            return abs(new - old) > self.deadband
+        return old != new
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _literal_levels(topic_filter: str) -> int:
+    return sum(level not in ("+", "#") for level in topic_filter.split("/"))
+
+
+class LastValueCache:
+    """Last published value per topic and publish policies by topic filter"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._policies = TopicRouter()
+        # resolved policy per topic, cleared when policies change
+        self._topic_policies: dict[str, PublishPolicy | None] = {}
+        self._last_values: dict[str, tuple[object, float]] = {}
+
+    def set_policy(self, topic_filter: str, policy: PublishPolicy | None) -> None:
+        """Set policy for topics matching the filter, None removes the policy"""
+        with self._lock:
+            if policy:
+                self._policies.add(topic_filter, policy)
+            else:
+                self._policies.remove(topic_filter)
+            self._topic_policies.clear()
+
+    def should_publish(self, topic: str, value, now: float | None = None) -> bool:
+        """
+        Return True if value should be published. Value is compared to the
+        last value recorded with mark_published
+        """
+        if not self._policies:
+            return True
+        with self._lock:
+            if (policy := self._resolve_policy(topic)) is None:
+                return True
+            if now is None:
+                now = time.monotonic()
+            if last := self._last_values.get(topic):
+                last_value, last_time = last
+                elapsed = now - last_time
+                if not (policy.heartbeat and elapsed >= policy.heartbeat):
+                    if elapsed < policy.min_interval:
+                        return False
+                    if policy.only_on_change and not policy.is_changed(
+                        last_value, value
+                    ):
+                        return False
+            return True
+
+    def mark_published(self, topic: str, value, now: float | None = None) -> None:
+        """Record value as the last published value of the topic"""
+        if not self._policies:
+            return
+        with self._lock:
+            if self._resolve_policy(topic) is None:
+                return
+            if isinstance(value, bytearray):
+                # caller may reuse the buffer
+                value = bytes(value)
+            self._last_values[topic] = (value, time.monotonic() if now is None else now)
+
+    def _resolve_policy(self, topic: str) -> PublishPolicy | None:
+        try:
+            return self._topic_policies[topic]
+        except KeyError:
+            pass
+        # most specific filter, the one with most non-wildcard levels, wins
+        matches = self._policies.match(topic)
+        policy = (
+            max(matches, key=lambda m: _literal_levels(m[0]))[1] if matches else None
+        )
+        self._topic_policies[topic] = policy
+        return policy
@@ -0,0 +1,119 @@
+import threading
+from typing import Any
+
+
+class _Node:
+    __slots__ = ("children", "entry")
+
+    def __init__(self) -> None:
+        self.children: dict[str, _Node] = {}
+        # (topic filter, value), replaced as a whole so readers see a consistent pair
+        self.entry: tuple[str, Any] | None = None
+
+
+class TopicRouter:
+    """
+    Index of MQTT topic filters supporting + and # wildcards.
+
+    Filters are stored in a trie keyed by topic level, so lookup cost depends
+    on the topic depth, not on the number of filters. Updates are serialized
+    by a lock. Lookups don't take the lock: they only do single dict reads,
+    which are atomic, so they can run while the index is being updated.
+    """
+
+    def __init__(self) -> None:
+        self._root = _Node()
+        self._lock = threading.Lock()
+        self._count = 0
+
+    @staticmethod
+    def validate(topic_filter: str) -> None:
+        """Raise ValueError if topic filter is not a valid MQTT topic filter"""
+        levels = topic_filter.split("/")
+        for i, level in enumerate(levels):
+            if "#" in level and (level != "#" or i != len(levels) - 1):
+                raise ValueError(f"Invalid topic filter: {topic_filter}")
+            if "+" in level and level != "+":
+                raise ValueError(f"Invalid topic filter: {topic_filter}")
+
+    @staticmethod
+    def has_wildcards(topic_filter: str) -> bool:
+        return "+" in topic_filter or "#" in topic_filter
+
+    def add(self, topic_filter: str, value: Any) -> None:
+        """Add or replace value for the topic filter"""
+        self.validate(topic_filter)
+        with self._lock:
+            node = self._root
+            for level in topic_filter.split("/"):
+                child = node.children.get(level)
+                if child is None:
+                    child = _Node()
+                    node.children[level] = child
+                node = child
+            if node.entry is None:
+                self._count += 1
+            node.entry = (topic_filter, value)
+
+    def remove(self, topic_filter: str) -> bool:
+        """Remove the topic filter. Return False if filter was not found"""
+        with self._lock:
+            path = [self._root]
+            levels = topic_filter.split("/")
+            for level in levels:
+                if (child := path[-1].children.get(level)) is None:
+                    return False
+                path.append(child)
+            node = path[-1]
+            if node.entry is None:
+                return False
+            node.entry = None
+            self._count -= 1
+            # prune branches which do not lead to any filter anymore
+            for level, parent, child in zip(
+                reversed(levels), reversed(path[:-1]), reversed(path)
+            ):
+                if child.children or child.entry is not None:
+                    break
+                del parent.children[level]
+            return True
+
+    def get(self, topic_filter: str) -> Any:
+        """Return value stored for the exact topic filter or None"""
+        node = self._root
+        for level in topic_filter.split("/"):
+            if (node := node.children.get(level)) is None:
+                return None
+        return node.entry[1] if node.entry else None
+
+    def match(self, topic: str) -> list[tuple[str, Any, list[str]]]:
+        """
+        Return (topic filter, value, wildcard segments) for every filter
+        matching the topic. Wildcard segments contain the topic levels matched
+        by + and, as the last item, the remaining topic matched by #.
+        """
+        levels = topic.split("/")
+        count = len(levels)
+        matches = []
+        stack = [(self._root, 0, [])]
+        while stack:
+            node, index, wildcards = stack.pop()
+            # topics starting with $ are not matched by wildcards at first level
+            wildcards_allowed = index > 0 or not topic.startswith("$")
+            if wildcards_allowed and (multi := node.children.get("#")):
+                if entry := multi.entry:
+                    remaining = "/".join(levels[index:])
+                    matches.append((entry[0], entry[1], wildcards + [remaining]))
+            if index == count:
+                if entry := node.entry:
+                    matches.append((entry[0], entry[1], wildcards))
+                continue
+            level = levels[index]
+            if wildcards_allowed and (single := node.children.get("+")) is not None:
+                stack.append((single, index + 1, wildcards + [level]))
+            if (exact := node.children.get(level)) is not None:
+                stack.append((exact, index + 1, wildcards))
+        return matches
+
+    def __len__(self) -> int:
+        return self._count
@@ -0,0 +1,156 @@
+import threading
+import time
+from typing import Iterator, NamedTuple
+
+from prometheus_client import CollectorRegistry, Counter, Gauge
+
+from mqtt_framework.callbacks import MqttValue
+from mqtt_framework.topic_router import TopicRouter
+
+
+def to_json_value(value: MqttValue) -> str | int | float:
+    """Payloads are shown as text, invalid UTF-8 is replaced"""
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode("utf-8", errors="replace")
+    return value
+
+
+class StoredValue(NamedTuple):
+    topic: str
+    value: MqttValue
+    timestamp: float
+    retain: bool
+    direction: str
+    # increases on every change in the store, used for ETags
+    version: int
+
+
+class Snapshot(NamedTuple):
+    values: list[StoredValue]
+    # unquoted entity tag
+    etag: str
+    last_modified: float | None
+
+
+class _Node:
+    __slots__ = ("children", "entry")
+
+    def __init__(self) -> None:
+        self.children: dict[str, _Node] = {}
+        self.entry: StoredValue | None = None
+
+
+class ValueStore:
+    """
+    Latest value, timestamp and retain flag of published and received topics.
+
+    Topics are indexed by level, so queries by topic filter or prefix visit
+    only matching branches. Snapshot ETag is made of the number of matching
+    topics and their highest version, so it changes whenever any of them is
+    updated or a new matching topic appears.
+    """
+
+    def __init__(self, max_topics: int, registry: CollectorRegistry) -> None:
+        self._max_topics = max_topics
+        self._lock = threading.Lock()
+        self._root = _Node()
+        self._nodes: dict[str, _Node] = {}
+        self._version = 0
+        topics_metric = Gauge(
+            "value_store_topics",
+            "Number of topics in latest value store",
+            registry=registry,
+        )
+        topics_metric.set_function(lambda: len(self._nodes))
+        self._rejected_metric = Counter(
+            "value_store_rejected",
+            "How many values of new topics not stored because store was full",
+            registry=registry,
+        )
+
+    def update(
+        self, topic: str, value: MqttValue, retain: bool, direction: str
+    ) -> None:
+        with self._lock:
+            if (node := self._nodes.get(topic)) is None:
+                if len(self._nodes) >= self._max_topics:
+                    self._rejected_metric.inc()
+                    return
+                node = self._nodes[topic] = self._add_node(topic)
+            self._version += 1
+            node.entry = StoredValue(
+                topic, value, time.time(), retain, direction, self._version
+            )
+
+    def query(self, prefix="", topic_filter: str | None = None) -> Snapshot:
+        """
+        Return values of topics starting with prefix and matching the topic
+        filter. Raise ValueError if topic filter is invalid
+        """
+        if topic_filter is not None:
+            TopicRouter.validate(topic_filter)
+        with self._lock:
+            if topic_filter is None:
+                values = list(self._find_prefix(prefix))
+            else:
+                values = [
+                    entry
+                    for entry in self._find_filter(topic_filter.split("/"))
+                    if entry.topic.startswith(prefix)
+                ]
+        values.sort(key=lambda entry: entry.topic)
+        version = max((entry.version for entry in values), default=0)
+        return Snapshot(
+            values,
+            f"{len(values)}-{version}",
+            max((entry.timestamp for entry in values), default=None),
+        )
+
+    def _add_node(self, topic: str) -> _Node:
+        node = self._root
+        for level in topic.split("/"):
+            if (child := node.children.get(level)) is None:
+                child = node.children[level] = _Node()
+            node = child
+        return node
+
+    def _find_prefix(self, prefix: str) -> Iterator[StoredValue]:
+        *levels, last = prefix.split("/")
+        node = self._root
+        for level in levels:
+            if (node := node.children.get(level)) is None:
+                return
+        for key, child in node.children.items():
+            if key.startswith(last):
+                yield from self._subtree(child)
+
+    def _find_filter(
+        self, levels: list[str], node: _Node | None = None, depth=0
+    ) -> Iterator[StoredValue]:
+        node = node or self._root
+        if depth == len(levels):
+            if node.entry:
+                yield node.entry
+            return
+        level = levels[depth]
+        if level == "#":
+            # topic filter a/# matches also topic a
+            if node.entry and depth:
+                yield node.entry
+            for key, child in node.children.items():
+                if depth or not key.startswith("$"):
+                    yield from self._subtree(child)
+        elif level == "+":
+            for key, child in node.children.items():
+                if depth or not key.startswith("$"):
+                    yield from self._find_filter(levels, child, depth + 1)
+        elif (child := node.children.get(level)) is not None:
+            yield from self._find_filter(levels, child, depth + 1)
+
+    def _subtree(self, node: _Node) -> Iterator[StoredValue]:
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.entry:
+                yield node.entry
+            stack.extend(node.children.values())
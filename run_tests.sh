@@ -21,6 +21,7 @@ export CFG_LOG_LEVEL=TRACE
 export CFG_UPDATE_INTERVAL=1
 export CFG_UPDATE_CRON_SCHEDULE="* * * * * *"
 export CFG_DELAY_BEFORE_FIRST_TRY=1
+export CFG_HEALTH_CHECK_INTERVAL=1
 
 TEST_APP_PID=
 
@@ -53,6 +53,10 @@ else:
             "prometheus-flask-exporter",
             "Flask-Limiter",
         ],
+        extras_require={
+            "orjson": ["orjson"],
+            "msgpack": ["msgpack"],
+        },
         classifiers=[
             "Development Status :: 5 - Production/Stable",
             "Intended Audience :: Developers",
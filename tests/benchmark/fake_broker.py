@@ -0,0 +1,438 @@
+"""
+Minimal in-process MQTT 3.1.1 and 5 broker for benchmarks.
+
+Supports CONNECT, PUBLISH (QoS 0 and 1 inbound, delivered as QoS 0),
+SUBSCRIBE, UNSUBSCRIBE, PINGREQ, DISCONNECT, retained messages, will
+messages and shared subscriptions ($share/<group>/<filter>, delivered round
+robin in a group). With MQTT 5 inbound topic aliases are resolved and publish
+properties are forwarded to MQTT 5 subscribers. No authentication, TLS or
+sessions.
+"""
+
+import collections
+import socket
+import struct
+import threading
+from typing import Any
+
+from mqtt_framework.topic_router import TopicRouter
+
+CONNECT = 1
+PUBLISH = 3
+SUBSCRIBE = 8
+UNSUBSCRIBE = 10
+PINGREQ = 12
+DISCONNECT = 14
+
+# property identifier -> (name, type) of supported MQTT 5 publish properties
+_PROPERTIES = {
+    0x01: ("payload_format", "byte"),
+    0x02: ("expiry", "int32"),
+    0x03: ("content_type", "string"),
+    0x08: ("response_topic", "string"),
+    0x09: ("correlation_data", "binary"),
+    0x23: ("topic_alias", "int16"),
+    0x26: ("user_properties", "string_pair"),
+}
+
+
+def _encode_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def _decode_length(data: bytes, offset: int) -> tuple[int, int]:
+    """Decode variable byte integer, return value and next offset"""
+    value = 0
+    multiplier = 1
+    while True:
+        byte = data[offset]
+        offset += 1
+        value += (byte & 0x7F) * multiplier
+        if not byte & 0x80:
+            return value, offset
+        multiplier *= 128
+
+
+def _decode_properties(data: bytes, offset: int) -> tuple[dict[str, Any], bytes, int]:
+    """
+    Decode MQTT 5 publish properties, return them as dict, encoded properties
+    to forward to subscribers (without topic alias) and next offset
+    """
+    length, offset = _decode_length(data, offset)
+    end = offset + length
+    properties: dict[str, Any] = {}
+    forwarded = bytearray()
+    while offset < end:
+        start = offset
+        if (identifier := data[offset]) not in _PROPERTIES:
+            raise ValueError(f"Unsupported property {identifier}")
+        name, kind = _PROPERTIES[identifier]
+        offset += 1
+        if kind == "byte":
+            value, offset = data[offset], offset + 1
+        elif kind == "int16":
+            (value,), offset = struct.unpack_from("!H", data, offset), offset + 2
+        elif kind == "int32":
+            (value,), offset = struct.unpack_from("!I", data, offset), offset + 4
+        else:
+            value, offset = _decode_string(data, offset, kind == "binary")
+            if kind == "string_pair":
+                second, offset = _decode_string(data, offset)
+                value = (value, second)
+        if kind == "string_pair":
+            properties.setdefault(name, []).append(value)
+        else:
+            properties[name] = value
+        if identifier != 0x23:
+            forwarded += data[start:offset]
+    return properties, bytes(forwarded), end
+
+
+def _decode_string(data: bytes, offset: int, binary=False) -> tuple[Any, int]:
+    (length,) = struct.unpack_from("!H", data, offset)
+    value = data[offset + 2 : offset + 2 + length]
+    return (value if binary else value.decode("utf-8")), offset + 2 + length
+
+
+def _encode_publish(
+    topic: str, payload: bytes, retain: bool, properties: bytes | None = None
+) -> bytes:
+    """Encode QoS 0 PUBLISH, properties are given only for MQTT 5 receivers"""
+    topic_bytes = topic.encode("utf-8")
+    body = struct.pack("!H", len(topic_bytes)) + topic_bytes
+    if properties is not None:
+        body += _encode_length(len(properties)) + properties
+    body += payload
+    return bytes([0x30 | int(retain)]) + _encode_length(len(body)) + body
+
+
+class _Connection:
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock = sock
+        self.reader = sock.makefile("rb")
+        self.lock = threading.Lock()
+        self.topic_filters: set[str] = set()
+        self.protocol = 4
+        self.client_id = ""
+        # (topic, payload, retain) published if connection is lost
+        self.will: tuple[str, bytes, bool] | None = None
+        # inbound topic aliases of MQTT 5 client
+        self.aliases: dict[int, str] = {}
+
+    @property
+    def v5(self) -> bool:
+        return self.protocol == 5
+
+    def send(self, data: bytes) -> None:
+        with self.lock:
+            self.sock.sendall(data)
+
+    def read_packet(self) -> tuple[int, int, bytes] | None:
+        header = self.reader.read(1)
+        if not header:
+            return None
+        length = 0
+        multiplier = 1
+        while True:
+            byte = self.reader.read(1)
+            if not byte:
+                return None
+            length += (byte[0] & 0x7F) * multiplier
+            if not byte[0] & 0x80:
+                break
+            multiplier *= 128
+        body = self.reader.read(length)
+        if len(body) < length:
+            return None
+        return header[0] >> 4, header[0] & 0x0F, body
+
+    def close(self) -> None:
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.reader.close()
+        self.sock.close()
+
+
+class FakeBroker:
+    """
+    MQTT broker listening on loopback interface, port 0 = any free port.
+    Latest received publishes and published will messages are kept in
+    received as (topic as sent, resolved topic, payload, properties) tuples.
+    """
+
+    def __init__(self, port: int = 0, topic_alias_maximum: int = 10) -> None:
+        self._topic_alias_maximum = topic_alias_maximum
+        self.received: collections.deque[tuple[str, str, bytes, dict]] = (
+            collections.deque(maxlen=1000)
+        )
+        self._server = socket.create_server(("127.0.0.1", port))
+        self._lock = threading.Lock()
+        self._subscriptions = TopicRouter()
+        # filter -> group -> subscribers in subscription order
+        self._shared_subscriptions = TopicRouter()
+        self._shared_deliveries = 0
+        self._retained: dict[str, bytes] = {}
+        self._connections: set[_Connection] = set()
+        self._running = False
+        self._thread = threading.Thread(
+            target=self._accept, name="fake-broker", daemon=True
+        )
+
+    @property
+    def port(self) -> int:
+        return self._server.getsockname()[1]
+
+    def start(self) -> None:
+        self._running = True
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._running = False
+        try:
+            # wakes up the accept call
+            self._server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._server.close()
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            connection.close()
+        self._thread.join()
+
+    def retained(self, topic: str) -> bytes | None:
+        with self._lock:
+            return self._retained.get(topic)
+
+    def drop_client(self, client_id: str) -> None:
+        """Close connection of client without DISCONNECT, as if it crashed"""
+        with self._lock:
+            connections = [c for c in self._connections if c.client_id == client_id]
+        for connection in connections:
+            connection.close()
+
+    def has_subscribers(self, topic: str) -> bool:
+        return bool(
+            self._subscriptions.match(topic) or self._shared_subscriptions.match(topic)
+        )
+
+    def _accept(self) -> None:
+        while self._running:
+            try:
+                sock, _ = self._server.accept()
+            except OSError:
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection = _Connection(sock)
+            with self._lock:
+                self._connections.add(connection)
+            threading.Thread(
+                target=self._serve, args=(connection,), daemon=True
+            ).start()
+
+    def _serve(self, connection: _Connection) -> None:
+        try:
+            while packet := connection.read_packet():
+                if not self._handle_packet(connection, *packet):
+                    break
+        except (OSError, ValueError):
+            pass
+        finally:
+            self._drop_connection(connection)
+
+    def _handle_packet(
+        self, connection: _Connection, packet_type: int, flags: int, body: bytes
+    ) -> bool:
+        if packet_type == CONNECT:
+            self._handle_connect(connection, body)
+        elif packet_type == PUBLISH:
+            self._handle_publish(connection, flags, body)
+        elif packet_type == SUBSCRIBE:
+            self._handle_subscribe(connection, body)
+        elif packet_type == UNSUBSCRIBE:
+            self._handle_unsubscribe(connection, body)
+        elif packet_type == PINGREQ:
+            connection.send(b"\xd0\x00")
+        elif packet_type == DISCONNECT:
+            # will is not published on normal disconnect
+            connection.will = None
+            return False
+        return True
+
+    def _handle_connect(self, connection: _Connection, body: bytes) -> None:
+        (name_length,) = struct.unpack_from("!H", body)
+        offset = 2 + name_length
+        connection.protocol = body[offset]
+        flags = body[offset + 1]
+        # skip protocol level, flags and keep alive
+        offset += 4
+        if connection.v5:
+            length, offset = _decode_length(body, offset)
+            offset += length
+        connection.client_id, offset = _decode_string(body, offset)
+        if flags & 0x04:
+            if connection.v5:
+                length, offset = _decode_length(body, offset)
+                offset += length
+            will_topic, offset = _decode_string(body, offset)
+            will_payload, offset = _decode_string(body, offset, binary=True)
+            connection.will = (will_topic, will_payload, bool(flags & 0x20))
+        if connection.v5:
+            # CONNACK with topic alias maximum property
+            properties = b"\x22" + struct.pack("!H", self._topic_alias_maximum)
+            body = b"\x00\x00" + _encode_length(len(properties)) + properties
+            connection.send(b"\x20" + _encode_length(len(body)) + body)
+        else:
+            connection.send(b"\x20\x02\x00\x00")
+
+    def _handle_publish(self, connection: _Connection, flags: int, body: bytes) -> None:
+        qos = (flags >> 1) & 0x03
+        retain = bool(flags & 0x01)
+        sent_topic, offset = _decode_string(body, 0)
+        if qos:
+            packet_id = body[offset : offset + 2]
+            offset += 2
+            connection.send(b"\x40\x02" + packet_id)
+        properties: dict[str, Any] = {}
+        forwarded = b""
+        topic = sent_topic
+        if connection.v5:
+            properties, forwarded, offset = _decode_properties(body, offset)
+            if (alias := properties.get("topic_alias")) is not None:
+                if topic:
+                    connection.aliases[alias] = topic
+                else:
+                    topic = connection.aliases[alias]
+        payload = body[offset:]
+        self.received.append((sent_topic, topic, payload, properties))
+        self._publish(topic, payload, retain, forwarded)
+
+    def _publish(self, topic: str, payload: bytes, retain: bool, forwarded=b"") -> None:
+        if retain:
+            with self._lock:
+                if payload:
+                    self._retained[topic] = payload
+                else:
+                    self._retained.pop(topic, None)
+        data = {
+            4: _encode_publish(topic, payload, False),
+            5: _encode_publish(topic, payload, False, forwarded),
+        }
+        subscribers = set()
+        with self._lock:
+            for _, connections, _ in self._subscriptions.match(topic):
+                subscribers |= connections
+            for _, groups, _ in self._shared_subscriptions.match(topic):
+                for members in groups.values():
+                    self._shared_deliveries += 1
+                    subscribers.add(members[self._shared_deliveries % len(members)])
+        for subscriber in subscribers:
+            try:
+                subscriber.send(data[subscriber.protocol])
+            except OSError:
+                pass
+
+    def _handle_subscribe(self, connection: _Connection, body: bytes) -> None:
+        packet_id = body[:2]
+        offset = 2
+        if connection.v5:
+            length, offset = _decode_length(body, offset)
+            offset += length
+        topic_filters = []
+        while offset < len(body):
+            (length,) = struct.unpack_from("!H", body, offset)
+            topic_filters.append(body[offset + 2 : offset + 2 + length].decode())
+            offset += 2 + length + 1
+        with self._lock:
+            for topic_filter in topic_filters:
+                connection.topic_filters.add(topic_filter)
+                if topic_filter.startswith("$share/"):
+                    _, group, topic_filter = topic_filter.split("/", 2)
+                    groups = self._shared_subscriptions.get(topic_filter) or {}
+                    members = groups.get(group, [])
+                    if connection not in members:
+                        groups[group] = members + [connection]
+                    self._shared_subscriptions.add(topic_filter, groups)
+                    continue
+                subscribers = self._subscriptions.get(topic_filter) or set()
+                self._subscriptions.add(topic_filter, subscribers | {connection})
+            retained = [
+                _encode_publish(topic, payload, True, b"" if connection.v5 else None)
+                for topic, payload in self._retained.items()
+                if any(
+                    self._matches(topic_filter, topic) for topic_filter in topic_filters
+                )
+            ]
+        granted = b"\x00" * len(topic_filters)
+        if connection.v5:
+            # empty properties
+            granted = b"\x00" + granted
+        connection.send(
+            b"\x90" + _encode_length(2 + len(granted)) + packet_id + granted
+        )
+        for data in retained:
+            connection.send(data)
+
+    def _handle_unsubscribe(self, connection: _Connection, body: bytes) -> None:
+        packet_id = body[:2]
+        offset = 2
+        if connection.v5:
+            length, offset = _decode_length(body, offset)
+            offset += length
+        count = 0
+        with self._lock:
+            while offset < len(body):
+                topic_filter, offset = _decode_string(body, offset)
+                self._unsubscribe(topic_filter, connection)
+                count += 1
+        if connection.v5:
+            # empty properties and success reason code for each filter
+            reasons = b"\x00" + b"\x00" * count
+            connection.send(
+                b"\xb0" + _encode_length(2 + len(reasons)) + packet_id + reasons
+            )
+        else:
+            connection.send(b"\xb0\x02" + packet_id)
+
+    def _unsubscribe(self, topic_filter: str, connection: _Connection) -> None:
+        connection.topic_filters.discard(topic_filter)
+        if topic_filter.startswith("$share/"):
+            _, group, topic_filter = topic_filter.split("/", 2)
+            groups = self._shared_subscriptions.get(topic_filter) or {}
+            if members := [c for c in groups.pop(group, []) if c is not connection]:
+                groups[group] = members
+            if groups:
+                self._shared_subscriptions.add(topic_filter, groups)
+            else:
+                self._shared_subscriptions.remove(topic_filter)
+            return
+        subscribers = self._subscriptions.get(topic_filter) or set()
+        if subscribers := subscribers - {connection}:
+            self._subscriptions.add(topic_filter, subscribers)
+        else:
+            self._subscriptions.remove(topic_filter)
+
+    def _drop_connection(self, connection: _Connection) -> None:
+        with self._lock:
+            self._connections.discard(connection)
+            for topic_filter in list(connection.topic_filters):
+                self._unsubscribe(topic_filter, connection)
+        connection.close()
+        if (will := connection.will) is not None:
+            connection.will = None
+            topic, payload, retain = will
+            self.received.append((topic, topic, payload, {}))
+            self._publish(topic, payload, retain)
+
+    @staticmethod
+    def _matches(topic_filter: str, topic: str) -> bool:
+        router = TopicRouter()
+        router.add(topic_filter, None)
+        return bool(router.match(topic))
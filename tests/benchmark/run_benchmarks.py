@@ -0,0 +1,469 @@
+"""
+Offline benchmarks for MQTT-Framework.
+
+Hot paths are measured in-process against a loopback MQTT client, end-to-end
+round trips and startup of the integration test app against an in-process
+fake broker, so neither Docker nor a real broker is needed.
+
+Usage:
+    python tests/benchmark/run_benchmarks.py [-n MESSAGES] [-o results.json]
+    python tests/benchmark/run_benchmarks.py --compare old.json new.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import socket
+import statistics
+import subprocess  # nosec B404
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+TESTAPP_DIR = BENCHMARK_DIR.parent / "integration" / "testapp"
+
+# results where a smaller value is better, used by --compare
+LOWER_IS_BETTER = ("_seconds", "_us", "_bytes")
+
+
+def _percentiles(samples: list[float]) -> dict[str, float]:
+    quantiles = statistics.quantiles(samples, n=100, method="inclusive")
+    return {"p50": quantiles[49], "p99": quantiles[98]}
+
+
+def _latency_result(samples_ns: list[int]) -> dict[str, float]:
+    percentiles = _percentiles([sample / 1000 for sample in samples_ns])
+    return {
+        "latency_p50_us": round(percentiles["p50"], 3),
+        "latency_p99_us": round(percentiles["p99"], 3),
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LoopbackMessageInfo:
+    rc = 0
+
+
+class LoopbackClient:
+    """Stand-in for paho client, publishes are counted and discarded"""
+
+    def __init__(self) -> None:
+        self.published = 0
+        self._message_info = LoopbackMessageInfo()
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        self.published += 1
+        return self._message_info
+
+
+class Message:
+    def __init__(self, topic: str, payload: bytes, qos=0) -> None:
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+
+
+def _create_framework(**settings):
+    from mqtt_framework import Config, Framework
+
+    class BenchmarkConfig(Config):
+        def __init__(self) -> None:
+            super().__init__(self.APP_NAME)
+
+        APP_NAME = "bench"
+        LOG_LEVEL = "WARNING"
+
+    config = BenchmarkConfig()
+    for key, value in settings.items():
+        setattr(config, key, value)
+    framework = Framework()
+    framework._load_config(config)
+    framework._mqtt.client = LoopbackClient()
+    framework._mqtt.subscribe = lambda topic: None
+    return framework
+
+
+###########################################################
+# In-process benchmarks
+###########################################################
+
+
+def bench_receive(messages: int) -> dict:
+    """Inbound message handling in MQTT client thread, no dispatcher"""
+    framework = _create_framework()
+    framework._subscribe_to_mqtt_topic("sensors/+/value", lambda *args: None)
+    received = framework._mqtt_message_received
+    message = Message("bench/sensors/kitchen/value", b"21.5")
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(messages):
+        call_start = time.perf_counter_ns()
+        received(None, None, message)
+        latencies.append(time.perf_counter_ns() - call_start)
+    elapsed = time.perf_counter() - start
+    return {
+        "messages_per_second": round(messages / elapsed),
+        **_latency_result(latencies),
+    }
+
+
+def bench_receive_dispatcher(messages: int) -> dict:
+    """
+    Inbound message handling through the worker pool dispatcher. Messages are
+    sent as a burst, so latency includes waiting in the dispatcher queue
+    """
+    framework = _create_framework(
+        MQTT_DISPATCHER_WORKERS=4, MQTT_DISPATCHER_QUEUE_SIZE=messages
+    )
+    framework._start_dispatcher()
+    latencies = []
+    done = threading.Event()
+
+    def handler(topic: str, data: str) -> None:
+        latencies.append(time.perf_counter_ns() - int(data))
+        if len(latencies) == messages:
+            done.set()
+
+    framework._subscribe_to_mqtt_topic("sensors/#", handler)
+    received = framework._mqtt_message_received
+    start = time.perf_counter()
+    for i in range(messages):
+        payload = str(time.perf_counter_ns()).encode()
+        received(None, None, Message(f"bench/sensors/{i % 100}", payload))
+    done.wait(60)
+    elapsed = time.perf_counter() - start
+    framework._stop_dispatcher()
+    return {
+        "messages_per_second": round(len(latencies) / elapsed),
+        "handled": len(latencies),
+        **_latency_result(latencies),
+    }
+
+
+def bench_publish(messages: int) -> dict:
+    """Single value publishes"""
+    framework = _create_framework()
+    publish = framework._publish_value_to_mqtt_topic
+    latencies = []
+    start = time.perf_counter()
+    for i in range(messages):
+        call_start = time.perf_counter_ns()
+        publish("sensors/value", i)
+        latencies.append(time.perf_counter_ns() - call_start)
+    elapsed = time.perf_counter() - start
+    return {
+        "messages_per_second": round(messages / elapsed),
+        **_latency_result(latencies),
+    }
+
+
+def bench_publish_batch(messages: int, batch_size=100) -> dict:
+    """Batch publishes of batch_size topics"""
+    framework = _create_framework()
+    batch = {f"sensors/{i}/value": i for i in range(batch_size)}
+    batches = max(messages // batch_size, 1)
+    start = time.perf_counter()
+    for _ in range(batches):
+        framework._publish_values_to_mqtt_topics(batch)
+    elapsed = time.perf_counter() - start
+    return {"messages_per_second": round(batches * batch_size / elapsed)}
+
+
+def bench_scheduling(calls: int) -> dict:
+    """Overhead of a do_update call made by the scheduler"""
+    from mqtt_framework.app import TriggerSource
+
+    class App:
+        def do_update(self, trigger_source) -> None:
+            pass
+
+    framework = _create_framework()
+    framework._app = App()
+    latencies = []
+    for _ in range(calls):
+        call_start = time.perf_counter_ns()
+        framework._call_do_update(TriggerSource.INTERVAL)
+        latencies.append(time.perf_counter_ns() - call_start)
+    return _latency_result(latencies)
+
+
+def bench_memory(messages: int) -> dict:
+    """Memory held per message waiting in the dispatcher queue"""
+    framework = _create_framework(
+        MQTT_DISPATCHER_WORKERS=1, MQTT_DISPATCHER_QUEUE_SIZE=messages + 1
+    )
+    framework._start_dispatcher()
+    release = threading.Event()
+    framework._subscribe_to_mqtt_topic("sensors/#", lambda *args: release.wait())
+    received = framework._mqtt_message_received
+    # first message blocks the worker, rest stay queued
+    received(None, None, Message("bench/sensors/0", b"0"))
+    payloads = [str(i).encode() for i in range(messages)]
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    for i in range(messages):
+        received(None, None, Message(f"bench/sensors/{i % 100}", payloads[i]))
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    release.set()
+    framework._stop_dispatcher()
+    return {"queued_message_bytes": round((after - before) / messages)}
+
+
+###########################################################
+# Benchmarks against the fake broker
+###########################################################
+
+
+def bench_roundtrip(messages: int, broker) -> dict:
+    """Request-response round trips through the test app and fake broker"""
+    import paho.mqtt.client as mqtt
+
+    sys.path.insert(0, str(TESTAPP_DIR))
+    from myapp import MyApp
+    from myconfig import MyConfig
+
+    from mqtt_framework import Framework
+
+    config = MyConfig()
+    config.LOG_LEVEL = "WARNING"
+    config.MQTT_BROKER_PORT = broker.port
+    config.WEB_PORT = _free_port()
+    config.UPDATE_INTERVAL = 0
+    framework = Framework()
+    framework.start(MyApp(), config)
+    _wait_for(lambda: _web_server_ready(framework), 10)
+
+    latencies = []
+    subscribed = threading.Event()
+    response = threading.Event()
+    done = threading.Event()
+
+    def on_connect(client, userdata, flags, reason_code, properties) -> None:
+        client.subscribe("myapp/callback_response")
+
+    def on_subscribe(client, userdata, mid, reason_codes, properties) -> None:
+        subscribed.set()
+
+    def on_message(client, userdata, message) -> None:
+        latencies.append(time.perf_counter_ns() - int(message.payload))
+        response.set()
+        if len(latencies) == messages:
+            done.set()
+
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id="bench")
+    client.on_connect = on_connect
+    client.on_subscribe = on_subscribe
+    client.on_message = on_message
+    client.connect("127.0.0.1", broker.port)
+    client.loop_start()
+    try:
+        subscribed.wait(10)
+        _wait_for(lambda: broker.has_subscribers("myapp/callback_request"), 10)
+        # latency of a single request at a time
+        for _ in range(min(messages, 1000)):
+            response.clear()
+            client.publish("myapp/callback_request", str(time.perf_counter_ns()))
+            response.wait(10)
+        latency = _latency_result(latencies)
+        # throughput with all requests sent at once
+        latencies.clear()
+        done.clear()
+        start = time.perf_counter()
+        for _ in range(messages):
+            client.publish("myapp/callback_request", str(time.perf_counter_ns()))
+        done.wait(60)
+        elapsed = time.perf_counter() - start
+    finally:
+        client.loop_stop()
+        client.disconnect()
+        framework.shutdown()
+    return {
+        "messages_per_second": round(len(latencies) / elapsed),
+        "handled": len(latencies),
+        **latency,
+    }
+
+
+def bench_startup(port: int, rounds=3, **settings: str) -> dict:
+    """Startup of the test app in a fresh interpreter, best of rounds"""
+    env = dict(
+        os.environ,
+        CFG_MQTT_BROKER_PORT=str(port),
+        CFG_UPDATE_INTERVAL="0",
+        CFG_LOG_LEVEL="WARNING",
+        **{f"CFG_{key}": value for key, value in settings.items()},
+    )
+    results = []
+    for _ in range(rounds):
+        env["CFG_WEB_PORT"] = str(_free_port())
+        start = time.perf_counter()
+        output = subprocess.run(  # nosec B603
+            [sys.executable, __file__, "--startup-child"],
+            env=env,
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout
+        result = json.loads(output.splitlines()[-1])
+        result["process_seconds"] = time.perf_counter() - start
+        results.append(result)
+    return {key: round(min(result[key] for result in results), 4) for key in results[0]}
+
+
+def _startup_child() -> None:
+    """Run in subprocess by bench_startup, prints timings as json"""
+    start = time.perf_counter()
+    sys.path.insert(0, str(TESTAPP_DIR))
+    from myapp import MyApp
+    from myconfig import MyConfig
+
+    from mqtt_framework import Framework
+
+    imported = time.perf_counter()
+    framework = Framework()
+    framework.start(MyApp(), MyConfig())
+    started = time.perf_counter()
+    try:
+        _wait_for(
+            lambda: framework._mqtt.connected and _web_server_ready(framework), 10
+        )
+        ready = time.perf_counter()
+        rss = _rss_bytes()
+    finally:
+        framework.shutdown()
+    stopped = time.perf_counter()
+    result = {
+        "import_seconds": imported - start,
+        "start_seconds": started - imported,
+        "ready_seconds": ready - imported,
+        "shutdown_seconds": stopped - ready,
+        "rss_bytes": rss,
+    }
+    print(json.dumps(result))
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # peak instead of current resident set size, kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _web_server_ready(framework) -> bool:
+    if getattr(framework, "_metrics_server", None):
+        return True
+    server = getattr(framework, "_WSGIServer", None)
+    return server is not None and server.ready
+
+
+def _wait_for(condition, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError("Condition not met")
+        time.sleep(0.001)
+
+
+###########################################################
+# Main
+###########################################################
+
+
+def run(messages: int) -> dict:
+    from fake_broker import FakeBroker
+
+    from mqtt_framework.framework import __version__
+
+    results = {
+        "receive": bench_receive(messages),
+        "receive_dispatcher": bench_receive_dispatcher(messages),
+        "publish": bench_publish(messages),
+        "publish_batch": bench_publish_batch(messages),
+        "scheduling": bench_scheduling(messages),
+        "memory": bench_memory(messages),
+    }
+    broker = FakeBroker()
+    broker.start()
+    try:
+        results["roundtrip"] = bench_roundtrip(min(messages, 10000), broker)
+        results["startup"] = bench_startup(broker.port)
+        results["startup_headless"] = bench_startup(broker.port, WEB_ENABLED="false")
+    finally:
+        broker.stop()
+    return {
+        "framework_version": __version__,
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "messages": messages,
+        "results": results,
+    }
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(  # nosec B603 B607
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BENCHMARK_DIR,
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old: dict, new: dict) -> None:
+    """Print relative change of each result, positive = improvement"""
+    print(f"{'benchmark':<40}{'old':>14}{'new':>14}{'change':>10}")
+    for bench, values in new["results"].items():
+        for key, value in values.items():
+            old_value = old["results"].get(bench, {}).get(key)
+            name = f"{bench}.{key}"
+            if not old_value:
+                print(f"{name:<40}{'-':>14}{value:>14}")
+                continue
+            if key.endswith(LOWER_IS_BETTER):
+                change = (old_value - value) / old_value * 100
+            else:
+                change = (value - old_value) / old_value * 100
+            print(f"{name:<40}{old_value:>14}{value:>14}{change:>+9.1f}%")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", "--messages", type=int, default=20000)
+    parser.add_argument("-o", "--output", help="write results to json file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    parser.add_argument("--startup-child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.startup_child:
+        _startup_child()
+    elif args.compare:
+        old, new = (json.loads(Path(path).read_text()) for path in args.compare)
+        compare(old, new)
+    else:
+        results = json.dumps(run(args.messages), indent=2)
+        if args.output:
+            Path(args.output).write_text(results + "\n")
+        print(results)
+
+
+if __name__ == "__main__":
+    main()
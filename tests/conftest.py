@@ -0,0 +1,32 @@
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent / "benchmark"))
+from fake_broker import FakeBroker  # noqa: E402
+
+
+def _wait_for(condition, timeout=5) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def wait_for():
+    """Poll condition until it is true, return False on timeout"""
+    return _wait_for
+
+
+@pytest.fixture
+def broker():
+    """In-process MQTT broker listening on a free port"""
+    broker = FakeBroker()
+    broker.start()
+    yield broker
+    broker.stop()
@@ -1,4 +1,4 @@
-from mqtt_framework.app import App
+from mqtt_framework.app import App, AsyncApp
 
 
 class MyApp:
@@ -41,3 +41,30 @@ def test_app():
 
 def test_notapp():
     assert not issubclass(NotApp, App)
+
+
+class MyAsyncApp:
+    def init(self, callbacks) -> None:
+        pass
+
+    def get_version(self) -> str:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def subscribe_to_mqtt_topics(self) -> None:
+        pass
+
+    async def mqtt_message_received(self, topic: str, message: str) -> None:
+        pass
+
+    async def do_healthy_check(self) -> bool:
+        return True
+
+    async def do_update(self, trigger_source) -> None:
+        pass
+
+
+def test_async_app():
+    assert issubclass(MyAsyncApp, AsyncApp)
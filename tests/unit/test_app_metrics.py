@@ -0,0 +1,15 @@
+from prometheus_client import CollectorRegistry, Counter, generate_latest
+
+from mqtt_framework.app_metrics import AppMetricsCollector
+
+
+def test_metrics_labelled_by_app():
+    registries = {"a": CollectorRegistry(), "b": CollectorRegistry()}
+    Counter("messages", "", ["topic"], registry=registries["a"]).labels("x").inc()
+    Counter("messages", "", ["topic"], registry=registries["b"]).labels("x").inc(2)
+    registry = CollectorRegistry()
+    registry.register(AppMetricsCollector(registries))
+
+    assert registry.get_sample_value("messages_total", {"app": "a", "topic": "x"}) == 1
+    assert registry.get_sample_value("messages_total", {"app": "b", "topic": "x"}) == 2
+    assert generate_latest(registry).count(b"# TYPE messages_total counter") == 1
@@ -0,0 +1,41 @@
+import logging
+import threading
+
+from prometheus_client import CollectorRegistry
+
+from mqtt_framework.coalescer import PublishCoalescer
+
+
+def create_coalescer(flush_func, interval=60, max_pending=100):
+    registry = CollectorRegistry()
+    coalescer = PublishCoalescer(
+        flush_func, interval, max_pending, registry, logging.getLogger("test")
+    )
+    coalescer.start()
+    return coalescer, registry
+
+
+def test_latest_value_wins():
+    flushed = []
+    coalescer, registry = create_coalescer(flushed.extend)
+
+    for i in range(10):
+        coalescer.put("a", i)
+    coalescer.put("b", "x", retain=True, qos=1)
+    assert registry.get_sample_value("mqtt_publish_pending") == 2
+    coalescer.stop(timeout=5)
+
+    assert flushed == [("a", 9, False, 0, None), ("b", "x", True, 1, None)]
+    assert registry.get_sample_value("mqtt_publish_coalesced_total") == 9
+    assert registry.get_sample_value("mqtt_publish_pending") == 0
+
+
+def test_flush_when_max_pending_reached():
+    flushed = threading.Event()
+    coalescer, _ = create_coalescer(lambda messages: flushed.set(), max_pending=2)
+
+    coalescer.put("a", 1)
+    assert not flushed.wait(timeout=0.1)
+    coalescer.put("b", 2)
+    assert flushed.wait(timeout=5)
+    coalescer.stop(timeout=5)
@@ -1,4 +1,6 @@
 from mqtt_framework import Config
+from mqtt_framework.config import config_defaults, is_reloadable, validate_config
+import pytest
 import ssl
 
 
@@ -20,9 +22,34 @@ def test_config():
     assert myconfig.LOG_LEVEL == "INFO"
     assert myconfig.UPDATE_INTERVAL == 60
     assert myconfig.DELAY_BEFORE_FIRST_TRY == 5
+    assert myconfig.UPDATE_JITTER == 0
+    assert myconfig.UPDATE_BACKOFF_MAX == 600
+    assert myconfig.UPDATE_NOW_DEBOUNCE == 1
+    assert myconfig.PROCESS_POOL_WORKERS == 2
+    assert myconfig.CONFIG_RELOAD_ENABLED is False
+    assert myconfig.HEALTH_CHECK_INTERVAL == 10
+    assert myconfig.HEALTH_CHECK_TTL == 30
+    assert myconfig.CLUSTER_ENABLED is False
+    assert myconfig.CLUSTER_GROUP is None
+    assert myconfig.CLUSTER_NODE_ID is None
+    assert myconfig.CLUSTER_LEASE_INTERVAL == 2
+    assert myconfig.CLUSTER_LEASE_TIMEOUT == 6
+    assert myconfig.SHUTDOWN_DRAIN_TIMEOUT == 5
+    assert myconfig.SHUTDOWN_JOBS_TIMEOUT == 10
+    assert myconfig.WEB_ENABLED is True
     assert myconfig.WEB_PORT == 5000
     assert myconfig.WEB_STATIC_DIR == "/web/static"
     assert myconfig.WEB_TEMPLATE_DIR == "/web/templates"
+    assert myconfig.STREAM_ENABLED is False
+    assert myconfig.STREAM_PORT == 5001
+    assert myconfig.STREAM_BUFFER_SIZE == 1000
+    assert myconfig.VALUE_STORE_ENABLED is False
+    assert myconfig.VALUE_STORE_MAX_TOPICS == 10000
+    assert myconfig.HISTORY_ENABLED is False
+    assert myconfig.HISTORY_RAW_SIZE == 3600
+    assert myconfig.HISTORY_MINUTE_SIZE == 1440
+    assert myconfig.HISTORY_HOUR_SIZE == 168
+    assert myconfig.HISTORY_MAX_MEMORY_MB == 16
 
     assert myconfig.MQTT_BROKER_URL == "127.0.0.1"
     assert myconfig.MQTT_BROKER_PORT == 1883
@@ -37,6 +64,16 @@ def test_config():
     assert myconfig.MQTT_TLS_INSECURE is False
     assert myconfig.MQTT_LAST_WILL_MESSAGE == "offline"
     assert myconfig.MQTT_LAST_WILL_RETAIN is True
+    assert myconfig.MQTT_DISPATCHER_WORKERS == 0
+    assert myconfig.MQTT_DISPATCHER_QUEUE_SIZE == 1000
+    assert myconfig.MQTT_PUBLISH_COALESCE_INTERVAL == 0
+    assert myconfig.MQTT_PUBLISH_COALESCE_MAX_PENDING == 1000
+    assert myconfig.MQTT_OFFLINE_QUEUE_FILE is None
+    assert myconfig.MQTT_OFFLINE_QUEUE_MAX_SIZE == 10000
+    assert myconfig.MQTT_OFFLINE_QUEUE_DROP_POLICY == "oldest"
+    assert myconfig.MQTT_OFFLINE_QUEUE_QOS == 1
+    assert myconfig.MQTT_PROTOCOL_VERSION == 4
+    assert myconfig.MQTT_TOPIC_ALIAS_MAXIMUM == 10
 
     assert myconfig.MQTT_CLIENT_ID == "myapp"
     assert myconfig.MQTT_TOPIC_PREFIX == "myapp/"
@@ -44,3 +81,40 @@ def test_config():
 
     assert myconfig.APP_NAME == "myapp"
     assert myconfig.TEST_VARIABLE == 123456
+
+
+def test_validate_config():
+    defaults = config_defaults(MyConfig())
+
+    assert defaults["TEST_VARIABLE"] == 123456
+    assert defaults["MQTT_TOPIC_PREFIX"] == "myapp/"
+    assert validate_config(
+        defaults,
+        {
+            "MQTT_TLS_ENABLED": "False",
+            "UPDATE_INTERVAL": "30",
+            "MQTT_PUBLISH_COALESCE_INTERVAL": "0.5",
+            "MQTT_USERNAME": "user",
+            "TEST_VARIABLE": 1.5,
+            "UNKNOWN": "x",
+        },
+    ) == {
+        "MQTT_TLS_ENABLED": False,
+        "UPDATE_INTERVAL": 30,
+        "MQTT_PUBLISH_COALESCE_INTERVAL": 0.5,
+        "MQTT_USERNAME": "user",
+        "TEST_VARIABLE": 1.5,
+    }
+    with pytest.raises(ValueError, match="UPDATE_INTERVAL"):
+        validate_config(defaults, {"UPDATE_INTERVAL": "often"})
+    with pytest.raises(ValueError, match="WEB_ENABLED"):
+        validate_config(defaults, {"WEB_ENABLED": "maybe"})
+
+
+def test_is_reloadable():
+    assert is_reloadable("UPDATE_INTERVAL")
+    assert is_reloadable("TEST_VARIABLE")
+    assert not is_reloadable("MQTT_BROKER_URL")
+    assert not is_reloadable("WEB_PORT")
+    assert not is_reloadable("PROCESS_POOL_WORKERS")
+    assert not is_reloadable("CLUSTER_ENABLED")
@@ -0,0 +1,73 @@
+import logging
+import threading
+import time
+
+from prometheus_client import CollectorRegistry
+
+from mqtt_framework.dispatcher import MessageDispatcher
+
+
+def create_dispatcher(workers=4, queue_size=100) -> MessageDispatcher:
+    dispatcher = MessageDispatcher(
+        workers, queue_size, CollectorRegistry(), logging.getLogger("test")
+    )
+    dispatcher.start()
+    return dispatcher
+
+
+def test_dispatcher_keeps_order_per_topic():
+    dispatcher = create_dispatcher()
+    handled = []
+
+    def handler(topic, value):
+        time.sleep(0.001)
+        handled.append((topic, value))
+
+    for i in range(20):
+        for topic in ("a", "b", "c"):
+            assert dispatcher.submit(topic, handler, topic, i)
+
+    assert dispatcher.stop(timeout=5)
+    for topic in ("a", "b", "c"):
+        assert [v for t, v in handled if t == topic] == list(range(20))
+
+
+def test_dispatcher_runs_topics_in_parallel():
+    dispatcher = create_dispatcher(workers=2)
+    release = threading.Event()
+    handled = threading.Event()
+
+    dispatcher.submit("slow", release.wait, 5)
+    dispatcher.submit("fast", handled.set)
+
+    assert handled.wait(timeout=5)
+    release.set()
+    assert dispatcher.stop(timeout=5)
+
+
+def test_dispatcher_drops_when_queue_full():
+    registry = CollectorRegistry()
+    dispatcher = MessageDispatcher(1, 2, registry, logging.getLogger("test"))
+    dispatcher.start()
+    release = threading.Event()
+
+    assert dispatcher.submit("a", release.wait, 5)
+    assert dispatcher.submit("a", lambda: None)
+    assert not dispatcher.submit("b", lambda: None)
+    assert registry.get_sample_value("mqtt_dispatcher_queue_depth") == 2
+    assert registry.get_sample_value("mqtt_dispatcher_dropped_total") == 1
+
+    release.set()
+    assert dispatcher.stop(timeout=5)
+    assert registry.get_sample_value("mqtt_dispatcher_queue_depth") == 0
+    assert not dispatcher.submit("c", lambda: None)
+
+
+def test_dropped_message_warnings_rate_limited(caplog):
+    dispatcher = MessageDispatcher(1, 1, CollectorRegistry(), logging.getLogger("test"))
+
+    with caplog.at_level(logging.WARNING, logger="test"):
+        for _ in range(5):
+            assert not dispatcher.submit("a", lambda: None)
+
+    assert len(caplog.records) == 1
@@ -0,0 +1,135 @@
+import json
+import logging
+import socket
+import time
+
+import pytest
+from prometheus_client import CollectorRegistry
+
+from mqtt_framework.event_loop import EventLoopThread
+from mqtt_framework.event_stream import EventStream
+
+
+@pytest.fixture
+def stream_factory():
+    started = []
+
+    def create(buffer_size=100):
+        event_loop = EventLoopThread(logging.getLogger("test"))
+        event_loop.start()
+        registry = CollectorRegistry()
+        stream = EventStream(0, buffer_size, registry, logging.getLogger("test"))
+        stream.start(event_loop)
+        started.append((stream, event_loop))
+        return stream, registry
+
+    yield create
+    for stream, event_loop in started:
+        stream.stop(event_loop)
+        event_loop.stop()
+
+
+class Client:
+    def __init__(self, port, path="/stream", headers="") -> None:
+        self.sock = socket.create_connection(("127.0.0.1", port), timeout=5)
+        self.sock.sendall(f"GET {path} HTTP/1.1\r\nHost: x\r\n{headers}\r\n".encode())
+        self.data = b""
+
+    def read_headers(self) -> str:
+        while b"\r\n\r\n" not in self.data:
+            self.data += self.sock.recv(4096)
+        headers, self.data = self.data.split(b"\r\n\r\n", 1)
+        return headers.decode()
+
+    def read_events(self, count):
+        events = []
+        while len(events) < count:
+            while b"\n\n" not in self.data:
+                self.data += self.sock.recv(4096)
+            block, self.data = self.data.split(b"\n\n", 1)
+            event = dict(line.split(": ", 1) for line in block.decode().split("\n"))
+            event["data"] = json.loads(event["data"])
+            events.append(event)
+        return events
+
+    def close(self) -> None:
+        self.sock.close()
+
+
+def wait_for_clients(registry, count) -> None:
+    deadline = time.monotonic() + 5
+    while registry.get_sample_value("stream_clients") != count:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_stream_filtered_values(stream_factory):
+    stream, registry = stream_factory()
+    client = Client(stream.port, "/stream?topic=app/a/%23&topic=app/c")
+    try:
+        assert "Content-Type: text/event-stream" in client.read_headers()
+        wait_for_clients(registry, 1)
+
+        stream.record("published", "app/a/x", 1)
+        stream.record("published", "app/b/y", 2)
+        stream.record("received", "app/c", b"on")
+
+        events = client.read_events(2)
+        assert [(e["id"], e["event"]) for e in events] == [
+            ("1", "published"),
+            ("3", "received"),
+        ]
+        assert events[0]["data"]["topic"] == "app/a/x"
+        assert events[0]["data"]["value"] == 1
+        assert events[1]["data"]["value"] == "on"
+    finally:
+        client.close()
+
+
+def test_resume_reports_overflow(stream_factory):
+    stream, registry = stream_factory(buffer_size=3)
+    first = Client(stream.port)
+    first.read_headers()
+    wait_for_clients(registry, 1)
+    for i in range(5):
+        stream.record("published", "app/value", i)
+        assert first.read_events(1)[0]["id"] == str(i + 1)
+
+    second = Client(stream.port, headers="Last-Event-ID: 1\r\n")
+    try:
+        second.read_headers()
+        events = second.read_events(4)
+        assert events[0]["event"] == "overflow"
+        assert events[0]["data"] == {"dropped": 1}
+        assert [e["id"] for e in events[1:]] == ["3", "4", "5"]
+        assert registry.get_sample_value("stream_events_dropped_total") == 1
+    finally:
+        first.close()
+        second.close()
+
+
+def test_resume_reports_values_lost_without_clients(stream_factory):
+    stream, _ = stream_factory(buffer_size=3)
+    # recorded while nobody listens, oldest ones are pushed out
+    for i in range(6):
+        stream.record("published", "app/value", i)
+
+    second = Client(stream.port, headers="Last-Event-ID: 1\r\n")
+    try:
+        second.read_headers()
+        events = second.read_events(4)
+        assert events[0]["event"] == "overflow"
+        assert events[0]["data"] == {"dropped": 2}
+        assert [e["id"] for e in events[1:]] == ["4", "5", "6"]
+        assert [e["data"]["value"] for e in events[1:]] == [3, 4, 5]
+    finally:
+        second.close()
+
+
+def test_unknown_path(stream_factory):
+    stream, _ = stream_factory()
+    client = Client(stream.port, "/other")
+    try:
+        assert client.read_headers().startswith("HTTP/1.1 404")
+    finally:
+        client.close()
@@ -0,0 +1,1071 @@
+import asyncio
+import contextlib
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from apscheduler.events import (
+    EVENT_JOB_MAX_INSTANCES,
+    EVENT_JOB_MISSED,
+    EVENT_JOB_SUBMITTED,
+    JobExecutionEvent,
+    JobSubmissionEvent,
+)
+from paho.mqtt.client import MQTT_ERR_NO_CONN, MQTT_ERR_SUCCESS
+
+from mqtt_framework import Config, Framework
+from mqtt_framework.app import TriggerSource
+from mqtt_framework.coalescer import PublishCoalescer
+from mqtt_framework.publish_policy import PublishPolicy
+
+
+class MyConfig(Config):
+    def __init__(self):
+        super().__init__(self.APP_NAME)
+
+    APP_NAME = "myapp"
+
+
+class FakeMessageInfo:
+    def __init__(self, rc, published=lambda: True) -> None:
+        self.rc = rc
+        self.published = published
+
+    def wait_for_publish(self, timeout=None):
+        if not self.is_published():
+            time.sleep(timeout)
+
+    def is_published(self):
+        return self.published()
+
+
+class FakeClient:
+    def __init__(self) -> None:
+        self.published = []
+        self.failing_topics = set()
+        self.unacknowledged_topics = set()
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        if topic in self.failing_topics:
+            return FakeMessageInfo(MQTT_ERR_NO_CONN)
+        if payload is not None and not isinstance(
+            payload, (str, bytes, bytearray, int, float)
+        ):
+            raise TypeError("payload must be a string, bytearray, int, float or None.")
+        self.published.append((topic, payload, qos, retain))
+        return FakeMessageInfo(
+            MQTT_ERR_SUCCESS, lambda: topic not in self.unacknowledged_topics
+        )
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+
+def create_framework() -> Framework:
+    framework = Framework()
+    framework._load_config(MyConfig())
+    framework._mqtt.client = FakeClient()
+    return framework
+
+
+def test_publish_values_to_mqtt_topics():
+    framework = create_framework()
+
+    failures = framework._publish_values_to_mqtt_topics(
+        {"a": 1, "b": "two"}, retain=True, qos=1
+    )
+
+    assert failures == {}
+    assert framework._mqtt.client.published == [
+        ("myapp/a", 1, 1, True),
+        ("myapp/b", "two", 1, True),
+    ]
+    assert framework._mqtt_messages_sent_metric._value.get() == 2
+
+
+def test_publish_values_to_mqtt_topics_reports_failures():
+    framework = create_framework()
+    framework._mqtt.client.failing_topics.add("myapp/b")
+
+    failures = framework._publish_values_to_mqtt_topics(
+        [("a", 1), ("b", 2), ("c", object())]
+    )
+
+    assert set(failures) == {"b", "c"}
+    assert framework._mqtt.client.published == [("myapp/a", 1, 0, False)]
+    registry = framework._metrics_registry
+    assert registry.get_sample_value("mqtt_messages_sent_total") == 1
+    assert registry.get_sample_value("mqtt_messages_failed_total") == 2
+
+
+class FakeMessage:
+    def __init__(self, topic, payload, qos=0, retain=False) -> None:
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+
+
+def test_raw_subscription_receives_undecoded_payload():
+    framework = create_framework()
+    framework._mqtt.subscribe = lambda topic: None
+    received = []
+    framework._subscribe_to_mqtt_topic(
+        "image", lambda topic, data: received.append((topic, data)), raw=True
+    )
+    framework._subscribe_to_mqtt_topic(
+        "text", lambda topic, data: received.append((topic, data))
+    )
+
+    framework._mqtt_message_received(None, None, FakeMessage("myapp/image", b"\xff"))
+    framework._mqtt_message_received(None, None, FakeMessage("myapp/text", b"abc"))
+
+    assert received == [("image", b"\xff"), ("text", "abc")]
+
+
+def test_wildcard_subscription_receives_wildcard_segments():
+    framework = create_framework()
+    framework._mqtt.subscribe = lambda topic: None
+    framework._app = None
+    received = []
+    framework._subscribe_to_mqtt_topic(
+        "sensors/+/temperature",
+        lambda topic, data, wildcards: received.append((topic, data, wildcards)),
+        with_wildcards=True,
+    )
+    framework._subscribe_to_mqtt_topic(
+        "sensors/#", lambda topic, data: received.append((topic, data))
+    )
+
+    framework._mqtt_message_received(
+        None, None, FakeMessage("myapp/sensors/kitchen/temperature", b"21.5")
+    )
+
+    # wildcard segments are given only when asked
+    assert sorted(received, key=len) == [
+        ("sensors/kitchen/temperature", "21.5"),
+        ("sensors/kitchen/temperature", "21.5", ["kitchen"]),
+    ]
+
+
+def test_framework_topics_not_dropped_by_full_dispatcher():
+    framework = create_framework()
+    framework._flask.config["MQTT_DISPATCHER_WORKERS"] = 1
+    framework._flask.config["MQTT_DISPATCHER_QUEUE_SIZE"] = 1
+    framework._start_dispatcher()
+    release = threading.Event()
+    framework._dispatcher.submit("busy", release.wait, 5)
+    log_levels = []
+    framework._flask.logger.setLevel = log_levels.append
+
+    framework._mqtt_message_received(
+        None, None, FakeMessage("myapp/setLogLevel", b"DEBUG")
+    )
+
+    assert log_levels == ["DEBUG"]
+    release.set()
+    framework._stop_dispatcher()
+
+
+def test_mqtt_handler_metrics_labelled_by_filter():
+    framework = create_framework()
+    framework._mqtt.subscribe = lambda topic: None
+
+    def failing_handler(topic, data):
+        raise ValueError(data)
+
+    framework._subscribe_to_mqtt_topic("ok/#", lambda topic, data: None)
+    framework._subscribe_to_mqtt_topic("fail/+", failing_handler)
+
+    framework._mqtt_message_received(None, None, FakeMessage("myapp/ok/a/b", b"abc"))
+    framework._mqtt_message_received(None, None, FakeMessage("myapp/fail/x", b"1"))
+    framework._mqtt_message_received(None, None, FakeMessage("myapp/fail/y", b"2"))
+
+    registry = framework._metrics_registry
+    ok_labels = {"filter": "ok/#"}
+    fail_labels = {"filter": "fail/+"}
+    sample = registry.get_sample_value
+    assert sample("mqtt_handler_duration_seconds_count", ok_labels) == 1
+    assert sample("mqtt_message_latency_seconds_count", ok_labels) == 1
+    assert sample("mqtt_received_payload_bytes_sum", ok_labels) == 3
+    assert sample("mqtt_handler_errors_total", ok_labels) is None
+    assert sample("mqtt_handler_errors_total", fail_labels) == 2
+    assert sample("mqtt_message_latency_seconds_count", fail_labels) == 2
+
+
+def test_mqtt_handler_errors_labelled_by_failing_filter():
+    framework = create_framework()
+    framework._mqtt.subscribe = lambda topic: None
+    framework._subscribe_to_mqtt_topic("a/#", lambda topic, data: None, raw=True)
+    framework._subscribe_to_mqtt_topic("a/+", lambda topic, data: None)
+
+    framework._mqtt_message_received(None, None, FakeMessage("myapp/a/b", b"\xff"))
+
+    sample = framework._metrics_registry.get_sample_value
+    assert sample("mqtt_handler_errors_total", {"filter": "a/+"}) == 1
+    assert sample("mqtt_handler_errors_total", {"filter": "a/#"}) is None
+
+
+def test_stop_event_loop_does_not_wait_hung_coroutines():
+    framework = create_framework()
+    framework._start_event_loop()
+    release = threading.Event()
+
+    async def hung():
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            # ignores cancellation until released
+            await asyncio.get_running_loop().run_in_executor(None, release.wait, 5)
+
+    framework._event_loop.submit(hung())
+    time.sleep(0.1)
+
+    framework._stop_event_loop(timeout=0.1)
+
+    assert framework._event_loop is None
+    release.set()
+
+
+def test_coroutine_handler_latency_measured_when_done():
+    framework = create_framework()
+    framework._mqtt.subscribe = lambda topic: None
+    release = threading.Event()
+
+    async def handler(topic, data):
+        await asyncio.get_running_loop().run_in_executor(None, release.wait, 5)
+
+    framework._subscribe_to_mqtt_topic("a", handler)
+    framework._mqtt_message_received(None, None, FakeMessage("myapp/a", b"1"))
+
+    sample = framework._metrics_registry.get_sample_value
+    labels = {"filter": "a"}
+    assert sample("mqtt_message_latency_seconds_count", labels) is None
+    release.set()
+    deadline = time.monotonic() + 5
+    while not sample("mqtt_message_latency_seconds_count", labels):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    framework._stop_event_loop()
+
+
+def test_publish_metrics():
+    framework = create_framework()
+
+    framework._publish_values_to_mqtt_topics({"a": "abcd", "b": 12.5})
+
+    registry = framework._metrics_registry
+    assert registry.get_sample_value("mqtt_publish_duration_seconds_count") == 1
+    assert registry.get_sample_value("mqtt_published_payload_bytes_count") == 2
+    assert registry.get_sample_value("mqtt_published_payload_bytes_sum") == 8
+
+
+def test_publish_policy_suppresses_unchanged_values():
+    framework = create_framework()
+    framework._last_value_cache.set_policy("#", PublishPolicy())
+
+    framework._publish_value_to_mqtt_topic("a", 1)
+    framework._publish_value_to_mqtt_topic("a", 1)
+    framework._publish_values_to_mqtt_topics({"a": 1, "b": 2})
+
+    assert framework._mqtt.client.published == [
+        ("myapp/a", 1, 0, False),
+        ("myapp/b", 2, 0, False),
+    ]
+    registry = framework._metrics_registry
+    assert registry.get_sample_value("mqtt_messages_sent_total") == 2
+    assert registry.get_sample_value("mqtt_messages_suppressed_total") == 2
+
+
+def test_publish_policy_does_not_suppress_failed_values():
+    framework = create_framework()
+    framework._last_value_cache.set_policy("#", PublishPolicy())
+    framework._mqtt.client.failing_topics.add("myapp/a")
+
+    framework._publish_value_to_mqtt_topic("a", 1)
+    framework._mqtt.client.failing_topics.clear()
+    framework._publish_value_to_mqtt_topic("a", 1)
+
+    assert framework._mqtt.client.published == [("myapp/a", 1, 0, False)]
+
+
+def test_coalesced_publish():
+    framework = create_framework()
+    framework._coalescer = PublishCoalescer(
+        framework._send_to_mqtt,
+        60,
+        100,
+        framework._metrics_registry,
+        framework._flask.logger,
+    )
+
+    framework._publish_value_to_mqtt_topic("a", 1)
+    framework._publish_values_to_mqtt_topics({"a": 2, "b": 3}, retain=True)
+    assert framework._mqtt.client.published == []
+    framework._coalescer.flush()
+
+    assert framework._mqtt.client.published == [
+        ("myapp/a", 2, 0, True),
+        ("myapp/b", 3, 0, True),
+    ]
+
+
+def test_offline_queue_replayed_after_connect(tmp_path, wait_for):
+    framework = create_framework()
+    framework._flask.config["MQTT_OFFLINE_QUEUE_FILE"] = str(tmp_path / "queue.db")
+    framework._open_offline_queue()
+    framework._mqtt.connected = False
+
+    failures = framework._publish_values_to_mqtt_topics({"a": 1, "b": 2})
+    assert failures == {}
+    assert framework._mqtt.client.published == []
+
+    framework._mqtt.connected = True
+    framework._app = None
+    framework._start_offline_queue_replay()
+    assert wait_for(lambda: not framework._offline_queue_replaying)
+    framework._publish_value_to_mqtt_topic("c", 3)
+
+    assert framework._mqtt.client.published == [
+        ("myapp/a", b"1", 1, False),
+        ("myapp/b", b"2", 1, False),
+        ("myapp/c", 3, 0, False),
+    ]
+    assert len(framework._offline_queue) == 0
+    framework._close_offline_queue()
+
+
+def test_offline_queue_replay_waits_for_acknowledgement(
+    tmp_path, monkeypatch, wait_for
+):
+    monkeypatch.setattr("mqtt_framework.framework.OFFLINE_QUEUE_ACK_TIMEOUT", 0.05)
+    framework = create_framework()
+    framework._flask.config["MQTT_OFFLINE_QUEUE_FILE"] = str(tmp_path / "queue.db")
+    framework._open_offline_queue()
+    framework._mqtt.connected = False
+    framework._publish_values_to_mqtt_topics({"a": 1, "b": 2, "c": 3})
+
+    framework._mqtt.connected = True
+    framework._mqtt.client.unacknowledged_topics.add("myapp/b")
+    framework._start_offline_queue_replay()
+    # acknowledged message before the first unacknowledged one is removed
+    assert wait_for(lambda: len(framework._offline_queue) == 2)
+    time.sleep(0.2)
+    framework._publish_value_to_mqtt_topic("d", 4)
+
+    # in-flight messages are not published again after ack timeouts and new
+    # publishes keep their order behind the queue
+    assert [topic for topic, _, _, _ in framework._mqtt.client.published] == [
+        "myapp/a",
+        "myapp/b",
+        "myapp/c",
+    ]
+    assert framework._offline_queue_replaying
+
+    framework._mqtt.client.unacknowledged_topics.clear()
+    assert wait_for(lambda: not framework._offline_queue_replaying)
+    framework._publish_value_to_mqtt_topic("e", 5)
+
+    assert [topic for topic, _, _, _ in framework._mqtt.client.published] == [
+        "myapp/a",
+        "myapp/b",
+        "myapp/c",
+        "myapp/d",
+        "myapp/e",
+    ]
+    assert len(framework._offline_queue) == 0
+    framework._close_offline_queue()
+
+
+def test_offline_queue_replay_interrupted_by_disconnect(tmp_path, wait_for):
+    framework = create_framework()
+    framework._flask.config["MQTT_OFFLINE_QUEUE_FILE"] = str(tmp_path / "queue.db")
+    framework._open_offline_queue()
+    framework._mqtt.connected = False
+    framework._publish_values_to_mqtt_topics({"a": 1, "b": 2, "c": 3})
+
+    framework._mqtt.connected = True
+    framework._mqtt.client.unacknowledged_topics.add("myapp/b")
+    framework._start_offline_queue_replay()
+    assert wait_for(lambda: len(framework._mqtt.client.published) == 3)
+    framework._mqtt.connected = False
+
+    assert wait_for(lambda: framework._offline_queue_thread is None)
+    # acknowledged message is removed, the rest is replayed after reconnect
+    assert [topic for _, topic, _, _ in framework._offline_queue.peek(10)] == [
+        "myapp/b",
+        "myapp/c",
+    ]
+    framework._close_offline_queue()
+
+
+def test_offline_queue_replay_retries_failed_publish(tmp_path, monkeypatch, wait_for):
+    monkeypatch.setattr("mqtt_framework.framework.OFFLINE_QUEUE_RETRY_DELAY", 0.01)
+    framework = create_framework()
+    framework._flask.config["MQTT_OFFLINE_QUEUE_FILE"] = str(tmp_path / "queue.db")
+    framework._open_offline_queue()
+    framework._mqtt.connected = False
+    framework._publish_values_to_mqtt_topics({"a": 1, "b": 2})
+
+    framework._mqtt.connected = True
+    framework._mqtt.client.failing_topics.add("myapp/a")
+    framework._start_offline_queue_replay()
+    time.sleep(0.1)
+
+    assert framework._mqtt.client.published == []
+    assert framework._offline_queue_replaying
+    framework._mqtt.client.failing_topics.clear()
+    assert wait_for(lambda: not framework._offline_queue_replaying)
+    assert [topic for topic, _, _, _ in framework._mqtt.client.published] == [
+        "myapp/a",
+        "myapp/b",
+    ]
+    framework._close_offline_queue()
+
+
+def test_close_offline_queue_waits_replay_thread(tmp_path):
+    framework = create_framework()
+    framework._flask.config["MQTT_OFFLINE_QUEUE_FILE"] = str(tmp_path / "queue.db")
+    framework._flask.config["SHUTDOWN_DRAIN_TIMEOUT"] = 0.1
+    framework._open_offline_queue()
+    offline_queue = framework._offline_queue
+    release = threading.Event()
+    framework._offline_queue_thread = threading.Thread(target=release.wait)
+    framework._offline_queue_thread.start()
+
+    framework._close_offline_queue()
+
+    # database is still open while replay thread runs
+    assert framework._offline_queue is offline_queue
+    assert framework._offline_queue_stop.is_set()
+    assert offline_queue.peek(1) == []
+    release.set()
+    framework._close_offline_queue()
+    assert framework._offline_queue is None
+
+
+def test_async_app_coroutines_run_in_event_loop():
+    framework = create_framework()
+    framework._mqtt.subscribe = lambda topic: None
+    updates = []
+    received = []
+    done = threading.Event()
+
+    class MyAsyncApp:
+        async def do_update(self, trigger_source):
+            await asyncio.sleep(0)
+            updates.append(trigger_source)
+
+        async def mqtt_message_received(self, topic, message):
+            received.append((topic, message))
+            done.set()
+
+    framework._app = MyAsyncApp()
+    framework._start_event_loop()
+    framework._call_do_update(TriggerSource.MANUAL)
+    framework._mqtt_message_received(None, None, FakeMessage("myapp/test", b"abc"))
+
+    assert done.wait(timeout=5)
+    assert updates == [TriggerSource.MANUAL]
+    assert received == [("test", "abc")]
+    framework._stop_event_loop()
+
+
+def test_update_jobs():
+    framework = create_framework()
+    framework._flask.config["DELAY_BEFORE_FIRST_TRY"] = 0
+    called = threading.Event()
+    framework._add_update_job("fast", lambda trigger_source: called.set(), interval=1)
+    framework._add_update_job(
+        "slow", lambda trigger_source: None, cron="*/10 * * * *", executor="slow"
+    )
+    framework._scheduler.start()
+
+    assert called.wait(timeout=5)
+    jobs = {job.id: job for job in framework._scheduler.get_jobs()}
+    assert set(jobs) == {"job_fast", "job_slow"}
+    assert jobs["job_slow"].executor == "slow"
+
+    framework._update_now()
+    assert {job.id for job in framework._scheduler.get_jobs()} >= {
+        "job_fast",
+        "job_slow",
+    }
+    framework._remove_update_job("slow")
+    framework._scheduler.shutdown(wait=True)
+
+    registry = framework._metrics_registry
+    assert registry.get_sample_value("update_job_count", {"job": "fast"}) >= 1
+    assert (
+        registry.get_sample_value("update_job_exceptions_total", {"job": "fast"}) == 0
+    )
+
+
+@pytest.mark.parametrize(
+    "schedule",
+    [{}, {"interval": 10, "cron": "* * * * *"}, {"interval": 0}, {"interval": -1}],
+)
+def test_update_job_schedule_validation(schedule):
+    framework = create_framework()
+
+    with pytest.raises(ValueError):
+        framework._add_update_job("job", lambda trigger_source: None, **schedule)
+
+
+def test_shutdown_does_not_wait_hung_jobs():
+    framework = create_framework()
+    framework._flask.config["WEB_ENABLED"] = False
+    framework._flask.config["WEB_PORT"] = 0
+    framework._flask.config["DELAY_BEFORE_FIRST_TRY"] = 0
+    framework._flask.config["SHUTDOWN_JOBS_TIMEOUT"] = 0.5
+    stopped = []
+    running = threading.Event()
+    release = threading.Event()
+
+    class MyApp:
+        def stop(self):
+            stopped.append(True)
+
+    def hung_job(trigger_source):
+        running.set()
+        release.wait()
+
+    framework._app = MyApp()
+    framework._start_metrics_server()
+    framework._add_update_job("hung", hung_job, interval=60)
+    framework._scheduler.start()
+    framework._started = True
+    assert running.wait(timeout=5)
+
+    start = time.monotonic()
+    framework.shutdown()
+    duration = time.monotonic() - start
+    release.set()
+
+    assert duration < 3
+    assert stopped == [True]
+    assert framework._stopped.is_set()
+    assert list(framework._shutdown_durations) == [
+        "stop intake",
+        "wait for jobs",
+        "drain outbound",
+        "publish offline",
+        "disconnect",
+    ]
+    assert framework._shutdown_durations["wait for jobs"] >= 0.5
+    assert framework._mqtt.client.published[-1] == ("myapp/status", "offline", 1, True)
+
+
+def start_for_shutdown(framework) -> None:
+    framework._flask.config["WEB_ENABLED"] = False
+    framework._flask.config["WEB_PORT"] = 0
+
+    class MyApp:
+        def stop(self):
+            pass
+
+    framework._app = MyApp()
+    framework._start_metrics_server()
+    framework._start_dispatcher()
+    framework._start_coalescer()
+    framework._scheduler.start()
+    framework._started = True
+
+
+def test_shutdown_flushes_coalesced_publishes():
+    framework = create_framework()
+    framework._flask.config["MQTT_DISPATCHER_WORKERS"] = 1
+    framework._flask.config["MQTT_PUBLISH_COALESCE_INTERVAL"] = 60
+    start_for_shutdown(framework)
+    framework._publish_value_to_mqtt_topic("a", 1)
+
+    framework.shutdown()
+
+    assert framework._mqtt.client.published == [
+        ("myapp/a", 1, 0, False),
+        ("myapp/status", "offline", 1, True),
+    ]
+
+
+def test_shutdown_closes_offline_queue(tmp_path):
+    framework = create_framework()
+    framework._flask.config["MQTT_DISPATCHER_WORKERS"] = 1
+    framework._flask.config["MQTT_OFFLINE_QUEUE_FILE"] = str(tmp_path / "queue.db")
+    framework._open_offline_queue()
+    framework._mqtt.connected = False
+    framework._publish_value_to_mqtt_topic("a", 1)
+    offline_queue = framework._offline_queue
+    start_for_shutdown(framework)
+
+    framework.shutdown()
+
+    assert framework._offline_queue is None
+    with pytest.raises(sqlite3.ProgrammingError):
+        offline_queue.peek(1)
+    with contextlib.closing(sqlite3.connect(tmp_path / "queue.db")) as db:
+        assert db.execute("SELECT topic FROM messages").fetchall() == [("myapp/a",)]
+
+
+def test_reload_config():
+    framework = create_framework()
+    framework._flask.config["CONFIG_RELOAD_ENABLED"] = True
+    framework._app = None
+    snapshot = framework._config
+    notifications = []
+    framework._config_listeners.append(
+        lambda config, changed: notifications.append((config, changed))
+    )
+
+    framework._mqtt_message_received(
+        None,
+        None,
+        FakeMessage(
+            "myapp/reloadConfig", b'{"UPDATE_INTERVAL": "30", "LOG_LEVEL": "INFO"}'
+        ),
+    )
+    framework._mqtt_message_received(
+        None, None, FakeMessage("myapp/reloadConfig", b'{"MQTT_BROKER_PORT": 1}')
+    )
+
+    assert snapshot["UPDATE_INTERVAL"] == 60
+    with pytest.raises(RuntimeError):
+        snapshot["UPDATE_INTERVAL"] = 30
+    assert framework._config["UPDATE_INTERVAL"] == 30
+    assert framework._flask.config["UPDATE_INTERVAL"] == 30
+    assert framework._config["MQTT_BROKER_PORT"] == 1883
+    assert notifications == [(framework._config, {"UPDATE_INTERVAL"})]
+    job = framework._scheduler.get_job("do_update_interval")
+    assert job.trigger.interval.total_seconds() == 30
+    registry = framework._metrics_registry
+    assert registry.get_sample_value("config_reloads_total", {"result": "applied"}) == 1
+    assert (
+        registry.get_sample_value("config_reloads_total", {"result": "rejected"}) == 1
+    )
+
+
+def test_reload_config_rejects_invalid_schedule():
+    class MyCronConfig(MyConfig):
+        CONFIG_RELOAD_ENABLED = True
+        UPDATE_CRON_SCHEDULE = "0 * * * *"
+
+    framework = Framework()
+    framework._load_config(MyCronConfig())
+    framework._mqtt.client = FakeClient()
+    framework._app = None
+    framework._add_scheduler_jobs(
+        framework._create_update_triggers(framework._config), datetime.now()
+    )
+    snapshot = framework._config
+    notifications = []
+    framework._config_listeners.append(
+        lambda config, changed: notifications.append(changed)
+    )
+
+    for data in (
+        b'{"UPDATE_CRON_SCHEDULE": "bogus"}',
+        b'{"UPDATE_INTERVAL": 30, "UPDATE_CRON_SCHEDULE": 5}',
+        b'{"LOG_LEVEL": "LOUD"}',
+    ):
+        framework._mqtt_message_received(
+            None, None, FakeMessage("myapp/reloadConfig", data)
+        )
+
+    assert framework._config is snapshot
+    assert framework._flask.config["UPDATE_CRON_SCHEDULE"] == "0 * * * *"
+    assert framework._flask.config["UPDATE_INTERVAL"] == 60
+    assert framework._scheduler.get_job("do_update_cron") is not None
+    assert notifications == []
+    registry = framework._metrics_registry
+    assert not registry.get_sample_value("config_reloads_total", {"result": "applied"})
+    assert (
+        registry.get_sample_value("config_reloads_total", {"result": "rejected"}) == 3
+    )
+
+
+def test_codec_subscription_decodes_payload_once():
+    framework = create_framework()
+    framework._mqtt.subscribe = lambda topic: None
+    received = []
+    framework._subscribe_to_mqtt_topic(
+        "sensors/#", lambda topic, data: received.append(data), codec="json"
+    )
+    framework._subscribe_to_mqtt_topic(
+        "sensors/+", lambda topic, data: received.append(data), codec="json"
+    )
+
+    framework._mqtt_message_received(
+        None, None, FakeMessage("myapp/sensors/a", b'{"value": 1}')
+    )
+    framework._mqtt_message_received(None, None, FakeMessage("myapp/sensors/b", b"{"))
+
+    assert received == [{"value": 1}, {"value": 1}]
+    assert received[0] is received[1]
+    sample = framework._metrics_registry.get_sample_value
+    assert sample("mqtt_codec_decode_seconds_count", {"codec": "json"}) == 1
+    assert (
+        sample("mqtt_codec_errors_total", {"codec": "json", "operation": "decode"}) == 1
+    )
+
+
+def test_codec_subscription_validation():
+    framework = create_framework()
+    framework._mqtt.subscribe = lambda topic: None
+
+    with pytest.raises(ValueError):
+        framework._subscribe_to_mqtt_topic("a", lambda topic, data: None, codec="xml")
+    with pytest.raises(ValueError):
+        framework._subscribe_to_mqtt_topic(
+            "a", lambda topic, data: None, raw=True, codec="json"
+        )
+
+
+def test_publish_objects():
+    framework = create_framework()
+
+    framework._publish_object_to_mqtt_topic("state", {"power": True})
+    failures = framework._publish_objects_to_mqtt_topics(
+        {"a": [1, 2], "b": object()}, qos=1
+    )
+
+    assert framework._mqtt.client.published == [
+        ("myapp/state", b'{"power":true}', 0, False),
+        ("myapp/a", b"[1,2]", 1, False),
+    ]
+    assert list(failures) == ["b"]
+    sample = framework._metrics_registry.get_sample_value
+    assert sample("mqtt_codec_encode_seconds_count", {"codec": "json"}) == 2
+    assert (
+        sample("mqtt_codec_errors_total", {"codec": "json", "operation": "encode"}) == 1
+    )
+
+
+def test_added_apps_share_connection():
+    framework = create_framework()
+    framework._mqtt.subscribe = lambda topic: None
+    framework._name = "myapp"
+    received = []
+
+    class GuestApp:
+        def init(self, callbacks):
+            self.callbacks = callbacks
+
+        def get_version(self):
+            return "1.0.0"
+
+        def subscribe_to_mqtt_topics(self):
+            self.callbacks.subscribe_to_mqtt_topic("command")
+
+        def mqtt_message_received(self, topic, message):
+            received.append((self.callbacks.get_config()["APP_NAME"], topic, message))
+
+        def do_healthy_check(self):
+            return True
+
+        def do_update(self, trigger_source):
+            pass
+
+    class GuestConfig(Config):
+        APP_NAME = "bridge"
+
+    framework._app = GuestApp()
+    framework.add_app(GuestApp(), GuestConfig("bridge"))
+    framework._start_guests()
+    framework._mqtt_handle_connect(None, None, None, 0)
+
+    framework._mqtt_message_received(None, None, FakeMessage("bridge/command", b"on"))
+
+    guest = framework._guests[0]
+    assert guest._mqtt is framework._mqtt
+    assert guest._scheduler is framework._scheduler
+    assert received == [("bridge", "command", "on")]
+    assert ("bridge/status", "online", 0, True) in framework._mqtt.client.published
+    assert framework._scheduler.get_job("bridge.do_update_interval")
+    assert framework._scheduler.get_job("do_update_interval") is None
+    for app in framework._frameworks():
+        app._health_probe.run()
+    text, status = framework._rest_do_healthy_check()
+    assert status == 200
+    assert json.loads(text)["apps"]["bridge"]["status"] == "OK"
+    registry = framework._create_exposed_metrics_registry()
+    assert (
+        registry.get_sample_value("mqtt_messages_received_total", {"app": "bridge"})
+        == 1
+    )
+    assert (
+        registry.get_sample_value("mqtt_messages_received_total", {"app": "myapp"}) == 0
+    )
+
+
+def test_added_app_topic_prefix_must_not_overlap():
+    framework = create_framework()
+
+    class GuestApp:
+        def init(self, callbacks):
+            pass
+
+        def get_version(self):
+            return "1.0.0"
+
+        def do_update(self, trigger_source):
+            pass
+
+    class GuestConfig(Config):
+        MQTT_TOPIC_PREFIX = "myapp/garage/"
+
+    framework.add_app(GuestApp(), GuestConfig("garage"))
+
+    with pytest.raises(ValueError, match="overlaps topic prefix 'myapp/'"):
+        framework._start_guests()
+
+
+def test_published_and_received_values_recorded_to_stream():
+    framework = create_framework()
+    framework._mqtt.subscribe = lambda topic: None
+    recorded = []
+
+    class Stream:
+        def record(self, direction, topic, value):
+            recorded.append((direction, topic, value))
+
+    framework._event_stream = Stream()
+    framework._publish_value_to_mqtt_topic("a", 1)
+    framework._publish_values_to_mqtt_topics((("b", 2),))
+    framework._mqtt_message_received(None, None, FakeMessage("myapp/c", b"on"))
+
+    assert recorded == [
+        ("published", "myapp/a", 1),
+        ("published", "myapp/b", 2),
+        ("received", "myapp/c", b"on"),
+    ]
+
+
+def test_rest_values_conditional_get():
+    framework = create_framework()
+    framework._flask.config["VALUE_STORE_ENABLED"] = True
+    framework._start_value_store()
+    framework._publish_value_to_mqtt_topic("a", 1)
+    framework._mqtt_message_received(None, None, FakeMessage("myapp/b", b"on", 0, True))
+
+    with framework._flask.test_request_context("/values?prefix=myapp/"):
+        response = framework._rest_get_values()
+    assert response.status_code == 200
+    assert [(v["topic"], v["value"], v["retain"]) for v in response.json["values"]] == [
+        ("myapp/a", 1, False),
+        ("myapp/b", "on", True),
+    ]
+
+    with framework._flask.test_request_context(
+        "/values?prefix=myapp/", headers={"If-None-Match": response.headers["ETag"]}
+    ):
+        assert framework._rest_get_values().status_code == 304
+
+    framework._publish_value_to_mqtt_topic("a", 2)
+    with framework._flask.test_request_context(
+        "/values?prefix=myapp/", headers={"If-None-Match": response.headers["ETag"]}
+    ):
+        assert framework._rest_get_values().status_code == 200
+
+
+def test_rest_history():
+    framework = create_framework()
+    framework._flask.config["HISTORY_ENABLED"] = True
+    framework._start_history()
+    framework._publish_value_to_mqtt_topic("a", 1)
+    framework._publish_values_to_mqtt_topics({"a": 2.5, "b": "text"})
+
+    with framework._flask.test_request_context("/history"):
+        response, _ = framework._rest_get_history()
+    assert response.json == {"topics": ["myapp/a"]}
+
+    with framework._flask.test_request_context("/history?topic=myapp/a&start=0"):
+        response, _ = framework._rest_get_history()
+    assert response.json["resolution"] == "raw"
+    assert response.json["value"] == [1.0, 2.5]
+
+
+def call_do_update_every(framework, monkeypatch, trigger_source, interval, results):
+    """
+    Call do_update interval seconds apart until results are used, runs
+    succeed or fail by results. Return which calls ran
+    """
+    now = [1000.0]
+    monkeypatch.setattr("mqtt_framework.framework.time.monotonic", lambda: now[0])
+    runs = []
+
+    class MyApp:
+        def do_update(self, trigger_source):
+            runs.append(trigger_source)
+            if not results.pop(0):
+                raise RuntimeError("upstream down")
+
+    framework._app = MyApp()
+    ran = []
+    while results:
+        runs.clear()
+        with contextlib.suppress(RuntimeError):
+            framework._call_do_update(trigger_source)
+        ran.append(bool(runs))
+        now[0] += interval
+    return ran
+
+
+def test_do_update_backs_off_after_errors(monkeypatch):
+    framework = create_framework()
+    framework._flask.config["UPDATE_INTERVAL"] = 10
+    framework._flask.config["UPDATE_BACKOFF_MAX"] = 40
+
+    ran = call_do_update_every(
+        framework, monkeypatch, TriggerSource.INTERVAL, 10, [False, False, True, True]
+    )
+
+    # delay doubles after each error up to 40 seconds, then recovers
+    assert ran == [True, False, True, False, False, False, True, True]
+    registry = framework._metrics_registry
+    assert (
+        registry.get_sample_value(
+            "update_runs_skipped_total", {"job": "do_update", "reason": "backoff"}
+        )
+        == 4
+    )
+
+
+def test_do_update_backs_off_cron_runs(monkeypatch):
+    framework = create_framework()
+    framework._flask.config["UPDATE_INTERVAL"] = 0
+    framework._flask.config["UPDATE_BACKOFF_MAX"] = 600
+
+    ran = call_do_update_every(
+        framework, monkeypatch, TriggerSource.CRON, 60, [False, False, True, True]
+    )
+
+    # 60 seconds after the first error, 120 seconds after the second one
+    assert ran == [True, True, False, True, True]
+
+
+def test_scheduler_events_measured():
+    framework = create_framework()
+    scheduled = datetime.now(timezone.utc) - timedelta(seconds=2)
+    framework._scheduler_event(
+        JobSubmissionEvent(EVENT_JOB_SUBMITTED, "do_update_interval", None, [scheduled])
+    )
+    framework._scheduler_event(
+        JobSubmissionEvent(EVENT_JOB_MAX_INSTANCES, "job_slow", None, [scheduled])
+    )
+    framework._scheduler_event(
+        JobExecutionEvent(EVENT_JOB_MISSED, "job_slow", None, scheduled)
+    )
+    framework._scheduler_event(
+        JobSubmissionEvent(EVENT_JOB_SUBMITTED, "health_check", None, [scheduled])
+    )
+
+    registry = framework._metrics_registry
+    assert (
+        registry.get_sample_value(
+            "update_schedule_drift_seconds_sum", {"job": "do_update"}
+        )
+        >= 2
+    )
+    assert (
+        registry.get_sample_value(
+            "update_runs_skipped_total", {"job": "slow", "reason": "overrun"}
+        )
+        == 1
+    )
+    assert registry.get_sample_value("update_runs_misfired_total", {"job": "slow"}) == 1
+
+
+def test_manual_update_triggers_coalesced():
+    framework = create_framework()
+    framework._flask.config["UPDATE_NOW_DEBOUNCE"] = 0.1
+    framework._add_update_job("app", lambda trigger_source: None, cron="0 0 * * *")
+    started = threading.Event()
+    release = threading.Event()
+    runs = []
+
+    class MyApp:
+        def do_update(self, trigger_source):
+            runs.append(trigger_source)
+            started.set()
+            release.wait(timeout=5)
+
+    framework._app = MyApp()
+    framework._scheduler.start()
+    for _ in range(3):
+        framework._update_now()
+    assert started.wait(timeout=5)
+
+    # triggers during the run queue one follow-up run
+    started.clear()
+    for _ in range(3):
+        framework._update_now()
+    release.set()
+    assert started.wait(timeout=5)
+    time.sleep(0.3)
+    job_ids = {job.id for job in framework._scheduler.get_jobs()}
+    framework._scheduler.shutdown(wait=True)
+
+    assert runs == [TriggerSource.MANUAL, TriggerSource.MANUAL]
+    assert "job_app" in job_ids
+    registry = framework._metrics_registry
+    assert registry.get_sample_value("update_triggers_coalesced_total") == 4
+
+
+def test_update_runs_never_overlap():
+    framework = create_framework()
+    framework._flask.config["UPDATE_NOW_DEBOUNCE"] = 0
+    started = threading.Semaphore(0)
+    release = threading.Event()
+    running = []
+    runs = []
+
+    class MyApp:
+        def do_update(self, trigger_source):
+            running.append(trigger_source)
+            runs.append(list(running))
+            started.release()
+            release.wait(timeout=5)
+            running.remove(trigger_source)
+
+    framework._app = MyApp()
+    framework._scheduler.start()
+    interval_run = threading.Thread(
+        target=framework._call_do_update, args=[TriggerSource.INTERVAL]
+    )
+    interval_run.start()
+    assert started.acquire(timeout=5)
+
+    framework._update_now()
+    framework._update_now()
+    framework._call_do_update(TriggerSource.CRON)
+    framework._call_do_update(TriggerSource.CRON)
+    time.sleep(0.2)
+    assert runs == [[TriggerSource.INTERVAL]]
+
+    # deferred triggers run one at a time after the running update
+    release.set()
+    assert started.acquire(timeout=5)
+    assert started.acquire(timeout=5)
+    interval_run.join(timeout=5)
+    time.sleep(0.2)
+    framework._scheduler.shutdown(wait=True)
+
+    assert runs == [
+        [TriggerSource.INTERVAL],
+        [TriggerSource.MANUAL],
+        [TriggerSource.CRON],
+    ]
+    registry = framework._metrics_registry
+    assert registry.get_sample_value("update_triggers_coalesced_total") == 1
+    assert (
+        registry.get_sample_value(
+            "update_runs_skipped_total", {"job": "do_update", "reason": "overrun"}
+        )
+        == 1
+    )
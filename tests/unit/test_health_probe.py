@@ -0,0 +1,61 @@
+import logging
+import time
+
+from prometheus_client import CollectorRegistry
+
+from mqtt_framework.health_probe import HealthProbe
+
+
+def create_probe(check):
+    registry = CollectorRegistry()
+    return HealthProbe(check, registry, logging.getLogger("test")), registry
+
+
+def test_status_unknown_until_first_check():
+    probe, _ = create_probe(lambda: True)
+
+    status = probe.status()
+
+    assert status.healthy is None
+    assert status.age is None
+
+
+def test_result_cached_with_age():
+    calls = []
+    probe, registry = create_probe(lambda: calls.append(1) or True)
+
+    assert probe.run() is True
+    time.sleep(0.05)
+    status = probe.status()
+    status_again = probe.status()
+
+    assert calls == [1]
+    assert status.healthy is True
+    assert 0.05 <= status.age <= status_again.age
+    assert status.last_failure is None
+    assert registry.get_sample_value("health_check_duration_seconds_count") == 1
+    assert registry.get_sample_value("health_check_healthy") == 1
+
+
+def test_last_failure_kept_after_recovery():
+    results = [False, "error", True]
+
+    def check():
+        result = results.pop(0)
+        if result == "error":
+            raise TimeoutError("device not responding")
+        return result
+
+    probe, registry = create_probe(check)
+
+    probe.run()
+    assert probe.status().last_failure == "Health check returned false"
+    assert registry.get_sample_value("health_check_healthy") == 0
+    probe.run()
+    probe.run()
+
+    status = probe.status()
+    assert status.healthy is True
+    assert status.last_failure == "TimeoutError: device not responding"
+    assert status.last_failure_time <= time.time()
+    assert registry.get_sample_value("health_check_failures_total") == 2
@@ -0,0 +1,97 @@
+import pytest
+from prometheus_client import CollectorRegistry
+
+from mqtt_framework import history as history_module
+from mqtt_framework.history import History
+
+SIZES = {"raw": 5, "minute": 3, "hour": 2}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [7200.0]
+    monkeypatch.setattr(history_module.time, "time", lambda: now[0])
+    return now
+
+
+def create_history(max_memory=1024 * 1024):
+    registry = CollectorRegistry()
+    return History(SIZES, max_memory, registry), registry
+
+
+@pytest.mark.parametrize("tier", ["raw", "minute", "hour"])
+def test_size_must_be_positive(tier):
+    with pytest.raises(ValueError):
+        History({**SIZES, tier: 0}, 1024 * 1024, CollectorRegistry())
+
+
+def test_raw_values_in_range(clock):
+    history, _ = create_history()
+    for value in range(3):
+        history.record("app/a", value)
+        clock[0] += 10
+    history.record("app/a", "text")
+    history.record("app/a", True)
+
+    series = history.query("app/a", start=7210, end=7220)
+
+    assert series.resolution == "raw"
+    assert series.columns == {"time": [7210.0], "value": [1.0]}
+    assert history.topics() == ["app/a"]
+    assert history.query("app/b") is None
+
+
+def test_ring_keeps_latest_values(clock):
+    history, _ = create_history()
+    for value in range(7):
+        history.record("app/a", value)
+        clock[0] += 1
+
+    columns = history.query("app/a", resolution="raw").columns
+
+    assert columns["value"] == [2.0, 3.0, 4.0, 5.0, 6.0]
+    assert columns["time"] == [7202.0, 7203.0, 7204.0, 7205.0, 7206.0]
+
+
+def test_downsampled_tiers(clock):
+    history, _ = create_history()
+    for value in (1, 3, 5):
+        history.record("app/a", value)
+        clock[0] += 20
+    # next minute
+    history.record("app/a", 10)
+
+    minutes = history.query("app/a", resolution="minute").columns
+    hours = history.query("app/a", resolution="hour").columns
+
+    assert minutes == {
+        "time": [7200.0, 7260.0],
+        "min": [1.0, 10.0],
+        "max": [5.0, 10.0],
+        "avg": [3.0, 10.0],
+    }
+    assert hours == {"time": [7200.0], "min": [1.0], "max": [10.0], "avg": [4.75]}
+
+
+def test_default_resolution_covers_start(clock):
+    history, _ = create_history()
+    for value in range(6):
+        history.record("app/a", value)
+        clock[0] += 30
+
+    # raw value of 7200 has been overwritten
+    assert history.query("app/a", start=7200).resolution == "minute"
+    assert history.query("app/a", start=7230).resolution == "raw"
+    with pytest.raises(ValueError):
+        history.query("app/a", resolution="day")
+
+
+def test_new_topics_rejected_over_memory_cap(clock):
+    # memory for one topic: 8 bytes * (2 * 5 + 4 * 3 + 4 * 2)
+    history, registry = create_history(max_memory=240)
+    history.record("app/a", 1)
+    history.record("app/b", 1)
+
+    assert history.topics() == ["app/a"]
+    assert registry.get_sample_value("history_memory_bytes") == 240
+    assert registry.get_sample_value("history_rejected_total") == 1
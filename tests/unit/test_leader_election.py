@@ -0,0 +1,197 @@
+import logging
+import threading
+import time
+
+from prometheus_client import CollectorRegistry
+
+from mqtt_framework import Config, Framework
+from mqtt_framework.leader_election import LeaderElection
+
+
+class LeaseTopic:
+    """Retained lease topic delivering messages to all nodes in order"""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.nodes = []
+        self.online = set()
+
+    def publisher(self, node_id):
+        def publish(payload):
+            with self.lock:
+                if node_id not in self.online:
+                    return
+                for node in self.nodes:
+                    if node.node_id in self.online:
+                        node.handle_message(payload.decode())
+
+        return publish
+
+    def join(self, node_id, changes):
+        """Start a connected node competing for the lease"""
+        node = LeaderElection(
+            node_id,
+            self.publisher(node_id),
+            0.05,
+            0.2,
+            lambda is_leader: changes.append((node_id, is_leader)),
+            CollectorRegistry(),
+            logging.getLogger("test"),
+        )
+        self.nodes.append(node)
+        self.online.add(node_id)
+        node.start()
+        node.connected()
+        return node
+
+
+def test_one_leader_and_failover(wait_for):
+    topic = LeaseTopic()
+    changes = []
+    nodes = [topic.join(node_id, changes) for node_id in ("a", "b", "c")]
+
+    assert wait_for(lambda: sum(node.is_leader for node in nodes) == 1)
+    time.sleep(0.3)
+    leaders = [node for node in nodes if node.is_leader]
+    assert len(leaders) == 1
+
+    # leader disconnects, others take over after lease timeout
+    leader = leaders[0]
+    topic.online.discard(leader.node_id)
+    assert wait_for(
+        lambda: not leader.is_leader
+        and sum(node.is_leader for node in nodes if node is not leader) == 1
+    )
+    for node in nodes:
+        node.stop()
+
+
+def test_released_lease_taken_over(wait_for):
+    topic = LeaseTopic()
+    changes = []
+    first = topic.join("a", changes)
+    assert wait_for(lambda: first.is_leader)
+    second = topic.join("b", changes)
+    time.sleep(0.3)
+    assert not second.is_leader
+
+    released = time.monotonic()
+    first.stop()
+
+    assert wait_for(lambda: second.is_leader)
+    assert time.monotonic() - released < 0.2
+    assert changes == [("a", True), ("a", False), ("b", True)]
+    second.stop()
+
+
+class ClusterConfig(Config):
+    def __init__(self):
+        super().__init__(self.APP_NAME)
+
+    APP_NAME = "clusterapp"
+    WEB_ENABLED = False
+    WEB_PORT = 0
+    DELAY_BEFORE_FIRST_TRY = 0
+    UPDATE_INTERVAL = 0.1
+    CLUSTER_ENABLED = True
+    CLUSTER_LEASE_INTERVAL = 0.1
+    CLUSTER_LEASE_TIMEOUT = 0.4
+
+
+class ClusterApp:
+    def __init__(self) -> None:
+        self.updates = 0
+        self.received = []
+
+    def init(self, callbacks):
+        self.callbacks = callbacks
+
+    def get_version(self):
+        return "1.0.0"
+
+    def stop(self):
+        pass
+
+    def subscribe_to_mqtt_topics(self):
+        self.callbacks.subscribe_to_mqtt_topic("command")
+
+    def mqtt_message_received(self, topic, message):
+        self.received.append(message)
+
+    def do_healthy_check(self):
+        return True
+
+    def do_update(self, trigger_source):
+        self.updates += 1
+
+
+def test_replicas_share_messages_and_scheduled_updates(broker, wait_for):
+    ClusterConfig.MQTT_BROKER_PORT = broker.port
+    replicas = [(Framework(), ClusterApp()) for _ in range(2)]
+    for framework, app in replicas:
+        framework.start(app, ClusterConfig())
+    try:
+        assert wait_for(
+            lambda: sum(
+                framework._leader_election.is_leader for framework, _ in replicas
+            )
+            == 1
+        )
+        assert wait_for(lambda: broker.has_subscribers("clusterapp/command"))
+        time.sleep(0.3)
+        sender = replicas[0][0]._mqtt.client
+        for i in range(10):
+            sender.publish("clusterapp/command", str(i))
+        assert wait_for(lambda: sum(len(app.received) for _, app in replicas) == 10)
+        # messages are load balanced, scheduled updates run only in leader
+        assert all(app.received for _, app in replicas)
+        leader, follower = sorted(
+            replicas, key=lambda replica: not replica[0]._leader_election.is_leader
+        )
+        assert leader[1].updates > 0
+        assert follower[1].updates == 0
+
+        leader[0].shutdown()
+        assert wait_for(lambda: follower[0]._leader_election.is_leader, timeout=1)
+        assert wait_for(lambda: follower[1].updates > 0)
+    finally:
+        for framework, _ in replicas:
+            framework.shutdown()
+
+
+def test_leader_restores_status_after_follower_will(broker, wait_for):
+    ClusterConfig.MQTT_BROKER_PORT = broker.port
+    replicas = [(Framework(), ClusterApp()) for _ in range(2)]
+    for framework, app in replicas:
+        framework.start(app, ClusterConfig())
+    try:
+        assert wait_for(
+            lambda: sum(
+                framework._leader_election.is_leader for framework, _ in replicas
+            )
+            == 1
+        )
+        follower = next(
+            framework
+            for framework, _ in replicas
+            if not framework._leader_election.is_leader
+        )
+        # lease refreshes do not republish retained status
+        time.sleep(0.3)
+        broker.received.clear()
+        time.sleep(0.3)
+        assert "clusterapp/status" not in [topic for _, topic, _, _ in broker.received]
+
+        # follower crashes, broker publishes its last will
+        follower._mqtt.client.loop_stop()
+        broker.received.clear()
+        broker.drop_client(follower._flask.config["MQTT_CLIENT_ID"])
+        assert wait_for(
+            lambda: ("clusterapp/status", b"offline")
+            in [(topic, payload) for _, topic, payload, _ in broker.received]
+        )
+
+        assert wait_for(lambda: broker.retained("clusterapp/status") == b"online")
+    finally:
+        for framework, _ in replicas:
+            framework.shutdown()
@@ -0,0 +1,44 @@
+import json
+import logging
+import urllib.error
+import urllib.request
+
+import pytest
+from prometheus_client import CollectorRegistry, Counter
+
+from mqtt_framework.metrics_server import MetricsServer
+
+
+def test_metrics_server():
+    registry = CollectorRegistry()
+    Counter("test_counter", "", registry=registry).inc(3)
+    healthy = ['{"status": "OK"}', 200]
+    server = MetricsServer(
+        0,
+        registry,
+        {
+            "/healthy": lambda: tuple(healthy),
+            "/live": lambda: ('{"status": "OK"}', 200),
+        },
+        logging.getLogger(),
+    )
+    server.start()
+    url = f"http://127.0.0.1:{server.port}"
+    try:
+        with urllib.request.urlopen(f"{url}/metrics") as response:
+            assert "test_counter_total 3.0" in response.read().decode()
+        with urllib.request.urlopen(f"{url}/healthy") as response:
+            assert response.headers["Content-Type"] == "application/json"
+            assert json.loads(response.read()) == {"status": "OK"}
+
+        healthy[:] = ['{"status": "FAIL"}', 503]
+        with pytest.raises(urllib.error.HTTPError) as e:
+            urllib.request.urlopen(f"{url}/healthy")
+        assert e.value.code == 503
+        with urllib.request.urlopen(f"{url}/live") as response:
+            assert response.status == 200
+        with pytest.raises(urllib.error.HTTPError) as e:
+            urllib.request.urlopen(f"{url}/jobs")
+        assert e.value.code == 404
+    finally:
+        server.stop()
@@ -0,0 +1,170 @@
+from paho.mqtt.client import MQTT_ERR_NO_CONN, MQTT_ERR_SUCCESS
+from prometheus_client import CollectorRegistry
+
+from mqtt_framework import Config, Framework
+from mqtt_framework.mqtt_v5 import PublishProperties, TopicAliases, to_paho_properties
+
+
+class FakeMessageInfo:
+    def __init__(self, rc) -> None:
+        self.rc = rc
+
+
+class Publisher:
+    def __init__(self) -> None:
+        self.published = []
+        self.rc = MQTT_ERR_SUCCESS
+
+    def __call__(self, topic, payload, qos, retain, properties):
+        alias = getattr(properties, "TopicAlias", None)
+        self.published.append((topic, alias))
+        return FakeMessageInfo(self.rc)
+
+
+def test_alias_assigned_on_second_publish():
+    registry = CollectorRegistry()
+    aliases = TopicAliases(2, registry)
+    aliases.reset(10)
+    publisher = Publisher()
+
+    for _ in range(4):
+        aliases.publish(publisher, "app/a/long/topic", 1, 0, False, None)
+
+    assert publisher.published == [
+        ("app/a/long/topic", None),
+        ("app/a/long/topic", 1),
+        ("", 1),
+        ("", 1),
+    ]
+    assert registry.get_sample_value("mqtt_topic_aliases") == 1
+    assert registry.get_sample_value("mqtt_topic_alias_bytes_saved_total") == 26
+
+
+def test_aliases_limited_and_not_used_with_qos():
+    aliases = TopicAliases(5, CollectorRegistry())
+    aliases.reset(1)
+    publisher = Publisher()
+
+    for topic in ("a/aa", "b/bb", "a/aa", "b/bb", "a/aa", "b/bb"):
+        aliases.publish(publisher, topic, 1, 0, False, None)
+    aliases.publish(publisher, "a/aa", 1, 1, False, None)
+    aliases.publish(publisher, "c", 1, 0, False, None)
+    aliases.reset(5)
+    aliases.publish(publisher, "c", 1, 0, False, None)
+    aliases.publish(publisher, "c", 1, 0, False, None)
+
+    assert publisher.published == [
+        ("a/aa", None),
+        ("b/bb", None),
+        ("a/aa", 1),
+        ("b/bb", None),
+        ("", 1),
+        ("b/bb", None),
+        ("a/aa", None),
+        ("c", None),
+        # too short topic to benefit from alias
+        ("c", None),
+        ("c", None),
+    ]
+
+
+def test_topic_resent_after_failure_and_reset():
+    registry = CollectorRegistry()
+    aliases = TopicAliases(2, registry)
+    aliases.reset(10)
+    publisher = Publisher()
+    aliases.publish(publisher, "a/aa", 1, 0, False, None)
+    publisher.rc = MQTT_ERR_NO_CONN
+    aliases.publish(publisher, "a/aa", 1, 0, False, None)
+    publisher.rc = MQTT_ERR_SUCCESS
+    aliases.publish(publisher, "a/aa", 1, 0, False, None)
+    assert publisher.published[-1] == ("a/aa", 1)
+
+    aliases.reset(0)
+    aliases.publish(publisher, "a/aa", 1, 0, False, None)
+    aliases.publish(publisher, "a/aa", 1, 0, False, None)
+    assert publisher.published[-2:] == [("a/aa", None), ("a/aa", None)]
+    assert registry.get_sample_value("mqtt_topic_aliases") == 0
+
+
+def test_to_paho_properties():
+    assert to_paho_properties(None) is None
+    properties = to_paho_properties(
+        PublishProperties(expiry=30, user_properties={"unit": "C"}), alias=3
+    )
+    assert properties.MessageExpiryInterval == 30
+    assert properties.UserProperty == [("unit", "C")]
+    assert properties.TopicAlias == 3
+
+
+class V5Config(Config):
+    def __init__(self):
+        super().__init__(self.APP_NAME)
+
+    APP_NAME = "v5app"
+    WEB_ENABLED = False
+    WEB_PORT = 0
+    UPDATE_INTERVAL = 0
+    MQTT_PROTOCOL_VERSION = 5
+
+
+class V5App:
+    def init(self, callbacks):
+        self.callbacks = callbacks
+
+    def get_version(self):
+        return "1.0.0"
+
+    def stop(self):
+        pass
+
+    def subscribe_to_mqtt_topics(self):
+        self.callbacks.subscribe_to_mqtt_topic("command")
+
+    def mqtt_message_received(self, topic, message):
+        pass
+
+    def do_healthy_check(self):
+        return True
+
+    def do_update(self, trigger_source):
+        pass
+
+
+def test_publish_with_v5_broker(broker, wait_for):
+    V5Config.MQTT_BROKER_PORT = broker.port
+    framework = Framework()
+    app = V5App()
+    framework.start(app, V5Config())
+    try:
+        assert wait_for(lambda: broker.has_subscribers("v5app/command"))
+        properties = PublishProperties(expiry=60, user_properties={"unit": "C"})
+        for value in range(3):
+            app.callbacks.publish_value_to_mqtt_topic(
+                "temperature", value, properties=properties
+            )
+        assert wait_for(
+            lambda: sum(r[1] == "v5app/temperature" for r in broker.received) == 3
+        )
+
+        received = [r for r in broker.received if r[1] == "v5app/temperature"]
+        assert [(sent, payload) for sent, _, payload, _ in received] == [
+            ("v5app/temperature", b"0"),
+            ("v5app/temperature", b"1"),
+            ("", b"2"),
+        ]
+        assert received[2][3] == {
+            "expiry": 60,
+            "user_properties": [("unit", "C")],
+            "topic_alias": 1,
+        }
+        registry = framework._metrics_registry
+        assert registry.get_sample_value(
+            "mqtt_reason_codes_total", {"operation": "connect", "reason": "Success"}
+        )
+        assert registry.get_sample_value(
+            "mqtt_reason_codes_total",
+            {"operation": "subscribe", "reason": "Granted QoS 0"},
+        )
+    finally:
+        framework.shutdown()
@@ -0,0 +1,56 @@
+import logging
+
+from prometheus_client import CollectorRegistry
+
+from mqtt_framework.offline_queue import OfflineQueue
+
+
+def create_queue(path, max_size=10, drop_policy="oldest"):
+    registry = CollectorRegistry()
+    queue = OfflineQueue(
+        str(path), max_size, drop_policy, registry, logging.getLogger("test")
+    )
+    return queue, registry
+
+
+def test_queue_survives_restart(tmp_path):
+    path = tmp_path / "queue.db"
+    queue, _ = create_queue(path)
+    queue.put("app/a", "x", retain=True)
+    queue.put("app/b", 1.5)
+    queue.close()
+
+    queue, registry = create_queue(path)
+    messages = queue.peek(10)
+
+    assert len(queue) == 2
+    assert [m[1:] for m in messages] == [
+        ("app/a", b"x", True),
+        ("app/b", b"1.5", False),
+    ]
+    queue.remove(messages[0][0])
+    assert [m[1] for m in queue.peek(10)] == ["app/b"]
+    assert queue.peek(10, after_id=messages[1][0]) == []
+    assert registry.get_sample_value("mqtt_offline_queue_replayed_total") == 1
+    assert registry.get_sample_value("mqtt_offline_queue_size") == 1
+
+
+def test_drop_oldest(tmp_path):
+    queue, registry = create_queue(tmp_path / "queue.db", max_size=2)
+    for i in range(4):
+        assert queue.put("app/a", i)
+
+    assert [m[2] for m in queue.peek(10)] == [b"2", b"3"]
+    assert registry.get_sample_value("mqtt_offline_queue_dropped_total") == 2
+
+
+def test_drop_newest(tmp_path):
+    queue, registry = create_queue(
+        tmp_path / "queue.db", max_size=2, drop_policy="newest"
+    )
+    for i in range(4):
+        queue.put("app/a", i)
+
+    assert [m[2] for m in queue.peek(10)] == [b"0", b"1"]
+    assert registry.get_sample_value("mqtt_offline_queue_queued_total") == 2
+    assert registry.get_sample_value("mqtt_offline_queue_dropped_total") == 2
@@ -0,0 +1,58 @@
+import pytest
+
+from mqtt_framework.payload_codecs import (
+    JsonCodec,
+    PayloadCodec,
+    get_codec,
+    register_codec,
+)
+
+
+def test_json_codec():
+    codec = get_codec("json")
+
+    assert codec.encode({"a": [1, 2.5, "ä"]}) == '{"a":[1,2.5,"ä"]}'.encode("utf-8")
+    assert codec.decode(b'{"a": [1, null]}') == {"a": [1, None]}
+    assert get_codec("json") is codec
+
+
+@pytest.mark.parametrize("name, module", [("orjson", "orjson"), ("msgpack", "msgpack")])
+def test_optional_codecs(name, module):
+    pytest.importorskip(module)
+    codec = get_codec(name)
+
+    value = {"text": "ä", "values": [1, 2.5, None, True]}
+    assert codec.decode(codec.encode(value)) == value
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError, match="Unknown payload codec"):
+        get_codec("xml")
+
+
+def test_register_codec():
+    class TextCodec:
+        name = "text"
+
+        def encode(self, obj):
+            return str(obj).encode()
+
+        def decode(self, payload):
+            return payload.decode()
+
+    register_codec("text", TextCodec)
+
+    assert isinstance(get_codec("text"), PayloadCodec)
+    assert get_codec("text").encode(12) == b"12"
+    register_codec("text", JsonCodec)
+    assert isinstance(get_codec("text"), JsonCodec)
+
+
+def test_missing_optional_package():
+    def factory():
+        import not_installed_package  # noqa: F401
+
+    register_codec("missing", factory)
+
+    with pytest.raises(ValueError, match="not available"):
+        get_codec("missing")
@@ -0,0 +1,43 @@
+import pytest
+from prometheus_client import CollectorRegistry, Counter, Gauge
+
+from mqtt_framework.process_pool import ProcessPool, get_worker_metrics_registry
+
+
+def count_values(values):
+    registry = get_worker_metrics_registry()
+    if not hasattr(count_values, "counter"):
+        count_values.counter = Counter("worker_values", "", registry=registry)
+        count_values.gauge = Gauge("worker_last_value", "", registry=registry)
+    count_values.counter.inc(len(values))
+    count_values.gauge.set(values[-1])
+    return {"sum": sum(values)}
+
+
+def fail():
+    raise ValueError("failed in worker")
+
+
+@pytest.fixture(scope="module")
+def pool_and_registry():
+    registry = CollectorRegistry()
+    pool = ProcessPool(1, registry)
+    yield pool, registry
+    pool.shutdown()
+
+
+def test_result_and_metrics_from_worker(pool_and_registry):
+    pool, registry = pool_and_registry
+
+    assert pool.submit(count_values, [1, 2, 3]).result(timeout=60) == {"sum": 6}
+    assert pool.submit(count_values, [4, 5]).result(timeout=60) == {"sum": 9}
+
+    assert registry.get_sample_value("worker_values_total") == 5
+    assert registry.get_sample_value("worker_last_value") == 5
+
+
+def test_exception_from_worker(pool_and_registry):
+    pool, _ = pool_and_registry
+
+    with pytest.raises(ValueError, match="failed in worker"):
+        pool.submit(fail).result(timeout=60)
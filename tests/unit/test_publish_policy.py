@@ -0,0 +1,77 @@
+from mqtt_framework.publish_policy import LastValueCache, PublishPolicy
+
+
+def publish(cache, topic, value, now):
+    if not cache.should_publish(topic, value, now=now):
+        return False
+    cache.mark_published(topic, value, now=now)
+    return True
+
+
+def test_no_policy_always_publishes():
+    cache = LastValueCache()
+
+    assert publish(cache, "a", 1, now=0)
+    assert publish(cache, "a", 1, now=0)
+
+
+def test_only_on_change():
+    cache = LastValueCache()
+    cache.set_policy("a", PublishPolicy())
+
+    assert publish(cache, "a", 1, now=0)
+    assert not publish(cache, "a", 1, now=1)
+    assert publish(cache, "a", 2, now=2)
+    assert publish(cache, "b", 2, now=2)
+    assert publish(cache, "b", 2, now=2)
+
+
+def test_deadband():
+    cache = LastValueCache()
+    cache.set_policy("#", PublishPolicy(deadband=0.5))
+
+    assert publish(cache, "temp", 20.0, now=0)
+    assert not publish(cache, "temp", 20.4, now=1)
+    assert publish(cache, "temp", 20.6, now=2)
+    assert publish(cache, "state", "on", now=0)
+    assert not publish(cache, "state", "on", now=1)
+
+
+def test_min_interval_and_heartbeat():
+    cache = LastValueCache()
+    cache.set_policy("a", PublishPolicy(min_interval=10, heartbeat=60))
+
+    assert publish(cache, "a", 1, now=0)
+    assert not publish(cache, "a", 2, now=5)
+    assert publish(cache, "a", 2, now=10)
+    assert not publish(cache, "a", 2, now=69)
+    assert publish(cache, "a", 2, now=70)
+
+
+def test_most_specific_policy_wins():
+    cache = LastValueCache()
+    cache.set_policy("#", PublishPolicy())
+    cache.set_policy("sensors/+/raw", PublishPolicy(only_on_change=False))
+
+    assert publish(cache, "sensors/a/raw", 1, now=0)
+    assert publish(cache, "sensors/a/raw", 1, now=1)
+    assert publish(cache, "sensors/a/value", 1, now=0)
+    assert not publish(cache, "sensors/a/value", 1, now=1)
+
+    cache.set_policy("#", None)
+    assert publish(cache, "sensors/a/value", 1, now=2)
+
+
+def test_only_marked_values_are_recorded():
+    cache = LastValueCache()
+    cache.set_policy("a", PublishPolicy())
+
+    # publish of the first value failed and it was not marked
+    assert cache.should_publish("a", 1, now=0)
+    assert cache.should_publish("a", 1, now=1)
+
+    buffer = bytearray(b"x")
+    cache.mark_published("a", buffer, now=2)
+    buffer[0] = ord("y")
+    assert not cache.should_publish("a", b"x", now=3)
+    assert cache.should_publish("a", b"y", now=3)
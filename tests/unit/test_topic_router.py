@@ -0,0 +1,59 @@
+import pytest
+
+from mqtt_framework.topic_router import TopicRouter
+
+
+def create_router(*topic_filters) -> TopicRouter:
+    router = TopicRouter()
+    for topic_filter in topic_filters:
+        router.add(topic_filter, topic_filter.upper())
+    return router
+
+
+def matched(router, topic):
+    return sorted((f, w) for f, _, w in router.match(topic))
+
+
+def test_exact_match():
+    router = create_router("a/b", "a/c")
+
+    assert router.match("a/b") == [("a/b", "A/B", [])]
+    assert router.match("a/d") == []
+    assert router.get("a/c") == "A/C"
+    assert len(router) == 2
+
+
+def test_wildcard_match():
+    router = create_router("sensors/+/temperature", "sensors/#", "#", "other/+")
+
+    assert matched(router, "sensors/kitchen/temperature") == [
+        ("#", ["sensors/kitchen/temperature"]),
+        ("sensors/#", ["kitchen/temperature"]),
+        ("sensors/+/temperature", ["kitchen"]),
+    ]
+    assert matched(router, "sensors") == [("#", ["sensors"]), ("sensors/#", [""])]
+    assert matched(router, "other/a/b") == [("#", ["other/a/b"])]
+
+
+def test_dollar_topics_not_matched_by_leading_wildcards():
+    router = create_router("#", "+/info", "$SYS/#")
+
+    assert matched(router, "$SYS/info") == [("$SYS/#", ["info"])]
+
+
+def test_remove():
+    router = create_router("a/+/c", "a/b/c")
+
+    assert router.remove("a/+/c")
+    assert not router.remove("a/+/c")
+    assert not router.remove("a/b")
+    assert matched(router, "a/b/c") == [("a/b/c", [])]
+    assert router.remove("a/b/c")
+    assert router._root.children == {}
+    assert len(router) == 0
+
+
+@pytest.mark.parametrize("topic_filter", ["a/#/b", "a/b#", "a+/b"])
+def test_invalid_filter(topic_filter):
+    with pytest.raises(ValueError):
+        TopicRouter().add(topic_filter, None)
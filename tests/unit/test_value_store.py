@@ -0,0 +1,77 @@
+import pytest
+from prometheus_client import CollectorRegistry
+
+from mqtt_framework.value_store import ValueStore
+
+
+def create_store(max_topics=100):
+    registry = CollectorRegistry()
+    return ValueStore(max_topics, registry), registry
+
+
+def topics(snapshot):
+    return [entry.topic for entry in snapshot.values]
+
+
+def test_latest_value_per_topic():
+    store, registry = create_store()
+    store.update("app/a", 1, False, "published")
+    store.update("app/a", 2, True, "published")
+    store.update("other/b", b"on", False, "received")
+
+    (entry,) = store.query("app/").values
+
+    assert (entry.topic, entry.value, entry.retain) == ("app/a", 2, True)
+    assert registry.get_sample_value("value_store_topics") == 2
+
+
+@pytest.mark.parametrize(
+    "prefix, topic_filter, expected",
+    [
+        ("", None, ["$SYS/x", "app", "app/a", "app/a/b", "app/c", "apple"]),
+        ("app", None, ["app", "app/a", "app/a/b", "app/c", "apple"]),
+        ("app/a", None, ["app/a", "app/a/b"]),
+        ("", "app/+", ["app/a", "app/c"]),
+        ("", "app/#", ["app", "app/a", "app/a/b", "app/c"]),
+        ("", "#", ["app", "app/a", "app/a/b", "app/c", "apple"]),
+        ("", "+/a/b", ["app/a/b"]),
+        ("app/a", "app/#", ["app/a", "app/a/b"]),
+    ],
+)
+def test_query_by_prefix_and_filter(prefix, topic_filter, expected):
+    store, _ = create_store()
+    for topic in ("app/a", "app/c", "app/a/b", "app", "apple", "$SYS/x"):
+        store.update(topic, 0, False, "published")
+
+    assert topics(store.query(prefix, topic_filter)) == expected
+
+
+def test_invalid_filter():
+    store, _ = create_store()
+
+    with pytest.raises(ValueError):
+        store.query(topic_filter="app/#/a")
+
+
+def test_etag_changes_only_when_matching_values_change():
+    store, _ = create_store()
+    store.update("app/a", 1, False, "published")
+    etag = store.query("app/").etag
+
+    store.update("other/b", 1, False, "published")
+    assert store.query("app/").etag == etag
+
+    store.update("app/a", 2, False, "published")
+    assert store.query("app/").etag != etag
+
+
+def test_new_topics_rejected_when_full():
+    store, registry = create_store(max_topics=2)
+    store.update("a", 1, False, "published")
+    store.update("b", 1, False, "published")
+    store.update("c", 1, False, "published")
+    store.update("a", 2, False, "published")
+
+    assert topics(store.query()) == ["a", "b"]
+    assert store.query("a").values[0].value == 2
+    assert registry.get_sample_value("value_store_rejected_total") == 1